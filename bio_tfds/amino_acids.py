@@ -0,0 +1,123 @@
+"""A shared vocabulary for encoding amino acid sequences as integer tokens.
+
+Token 0 is padding. The 20 standard amino acids come first, followed by the
+other one letter codes used by UniProt. Any other character gets
+UNKNOWN_TOKEN. All of the tokens fit in a uint8.
+
+Since there are fewer than 32 tokens, sequences can also be packed at 5 bits
+per token: every 8 tokens are stored in 5 bytes. Packed sequences can be
+unpacked in NumPy with `unpack` or inside of a tf.data pipeline with
+`tf_unpack`.
+"""
+import numpy as np
+import tensorflow as tf
+
+# The amino acids with a token, in order. The token of AMINO_ACIDS[i] is i + 1.
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY" + "XBZJUO"
+
+PAD_TOKEN = 0
+UNKNOWN_TOKEN = len(AMINO_ACIDS) + 1
+VOCAB_SIZE = len(AMINO_ACIDS) + 2
+
+# Maps each byte to its token.
+_TOKENS = np.full([256], UNKNOWN_TOKEN, dtype=np.uint8)
+_TOKENS[0] = PAD_TOKEN
+_TOKENS[np.frombuffer(AMINO_ACIDS.encode("ascii"), dtype=np.uint8)] = np.arange(
+    1, len(AMINO_ACIDS) + 1
+)
+
+# The packed format has 5 bits per token.
+assert VOCAB_SIZE <= 32
+
+# Every group of 8 tokens is packed into a 40-bit little-endian word stored as
+# 5 bytes.
+_TOKENS_PER_GROUP = 8
+_BYTES_PER_GROUP = 5
+_TOKEN_SHIFTS = 5 * np.arange(_TOKENS_PER_GROUP, dtype=np.uint64)
+_BYTE_SHIFTS = 8 * np.arange(_BYTES_PER_GROUP, dtype=np.uint64)
+
+# Maps each token back to its byte. The unknown token is decoded as an "X".
+_CHARS = np.frombuffer(b"\0" + AMINO_ACIDS.encode("ascii") + b"X", dtype=np.uint8)
+
+
+def encode(sequence):
+    """Encodes a single sequence, as str or bytes, as a uint8 array of tokens."""
+    if isinstance(sequence, str):
+        sequence = sequence.encode("utf-8")
+    return _TOKENS[np.frombuffer(sequence, dtype=np.uint8)]
+
+
+def encode_batch(sequences):
+    """Encodes a batch of sequences as a padded uint8 matrix of tokens.
+
+    Args:
+        sequences: an array or list of bytes sequences.
+
+    Returns:
+        A (tokens, lengths) tuple. The tokens is a [num_sequences, max_length]
+        matrix padded with PAD_TOKEN and the lengths is an int32 array.
+    """
+    sequences = np.asarray(sequences, dtype=bytes)
+    lengths = np.char.str_len(sequences).astype(np.int32)
+    width = max(int(lengths.max(initial=0)), 1)
+    # A fixed-width bytes array is zero-padded, so we can view it as a matrix
+    # of bytes whose padding maps to PAD_TOKEN.
+    chars = sequences.astype(f"S{width}").view(np.uint8).reshape([-1, width])
+    return _TOKENS[chars], lengths
+
+
+def decode(tokens):
+    """Returns the str sequence of an array of tokens, skipping padding."""
+    tokens = np.asarray(tokens)
+    return _CHARS[tokens[tokens != PAD_TOKEN]].tobytes().decode("ascii")
+
+
+def pack(tokens):
+    """Packs an array of tokens into bytes with 5 bits per token.
+
+    The number of tokens is not stored, so it needs to be passed to `unpack`.
+    """
+    tokens = np.asarray(tokens, dtype=np.uint64)
+    num_groups = -(-len(tokens) // _TOKENS_PER_GROUP)
+    groups = np.zeros([num_groups * _TOKENS_PER_GROUP], dtype=np.uint64)
+    groups[: len(tokens)] = tokens
+    groups = groups.reshape([num_groups, _TOKENS_PER_GROUP])
+    words = np.bitwise_or.reduce(groups << _TOKEN_SHIFTS, axis=1)
+    return ((words[:, None] >> _BYTE_SHIFTS) & 0xFF).astype(np.uint8).tobytes()
+
+
+def unpack(packed, length):
+    """Returns the uint8 array of the first `length` tokens of packed bytes."""
+    data = np.frombuffer(packed, dtype=np.uint8).astype(np.uint64)
+    words = np.bitwise_or.reduce(
+        data.reshape([-1, _BYTES_PER_GROUP]) << _BYTE_SHIFTS, axis=1
+    )
+    tokens = (words[:, None] >> _TOKEN_SHIFTS) & 31
+    return tokens.reshape([-1])[:length].astype(np.uint8)
+
+
+def tf_unpack(packed, length):
+    """The same as `unpack` but with TensorFlow ops, for use in tf.data.
+
+    Args:
+        packed: a scalar tf.string tensor of packed tokens.
+        length: a scalar integer tensor with the number of tokens.
+
+    Returns:
+        A uint8 tensor of the tokens with shape [length].
+    """
+    data = tf.cast(tf.io.decode_raw(packed, tf.uint8), tf.int64)
+    words = tf.reduce_sum(
+        tf.bitwise.left_shift(
+            tf.reshape(data, [-1, _BYTES_PER_GROUP]),
+            tf.constant(_BYTE_SHIFTS, dtype=tf.int64),
+        ),
+        axis=1,
+    )
+    tokens = tf.bitwise.bitwise_and(
+        tf.bitwise.right_shift(
+            words[:, None], tf.constant(_TOKEN_SHIFTS, dtype=tf.int64)
+        ),
+        31,
+    )
+    return tf.cast(tf.reshape(tokens, [-1])[:length], tf.uint8)
@@ -0,0 +1,83 @@
+"""Batching examples of variable length sequences with little padding.
+
+Examples are put into buckets by the length of their sequence and each batch
+only has examples from one bucket. The batches are padded to the length of
+their longest sequence, so most of the padding is avoided when the buckets
+are narrow.
+"""
+import tensorflow as tf
+
+
+def token_budget_batch_sizes(bucket_boundaries, max_tokens):
+    """Returns the largest batch size of each bucket that fits `max_tokens`.
+
+    A batch of a bucket is padded to at most its boundary minus 1 tokens, so
+    its batch size times that length is at most `max_tokens`. Buckets whose
+    sequences are longer than `max_tokens` get a batch size of 1.
+    """
+    return [max(1, max_tokens // (boundary - 1)) for boundary in bucket_boundaries]
+
+
+def bucket_by_length(
+    ds,
+    bucket_boundaries,
+    batch_size=None,
+    max_tokens=None,
+    length_key="aa_length",
+    drop_remainder=False,
+):
+    """Batches a dataset of examples in buckets of similar sequence lengths.
+
+    This is meant to be used on the output of `as_dataset` of the UniRef50
+    and UniRef50WithPfamRegions datasets, which store the length of the
+    sequence of each example. Exactly one of `batch_size` and `max_tokens`
+    must be given.
+
+    Args:
+        ds: a tf.data.Dataset of dicts of features.
+        bucket_boundaries: the increasing exclusive upper bounds of the
+            lengths of the buckets. The first bucket has the examples with
+            lengths in [0, bucket_boundaries[0]), the second those with
+            lengths in [bucket_boundaries[0], bucket_boundaries[1]) and so on.
+            Examples with a length of at least bucket_boundaries[-1] are
+            dropped.
+        batch_size: the number of examples in every batch.
+        max_tokens: the maximum number of tokens in a padded batch, which is
+            the batch size times the length of its longest sequence. The
+            batch size of each bucket is the largest one that fits this for
+            any of its lengths. See `token_budget_batch_sizes`.
+        length_key: the feature with the length of the sequence.
+        drop_remainder: if True, the last batch of each bucket is dropped when
+            it is smaller than the batch size of the bucket.
+
+    Returns:
+        A tf.data.Dataset of batches of examples. Features of variable length
+        are padded with zeros, which is amino_acids.PAD_TOKEN for tokens.
+    """
+    if (batch_size is None) == (max_tokens is None):
+        raise ValueError("Exactly one of batch_size and max_tokens must be given.")
+    bucket_boundaries = list(bucket_boundaries)
+    if not bucket_boundaries or any(
+        a >= b for a, b in zip([0] + bucket_boundaries, bucket_boundaries)
+    ):
+        raise ValueError(
+            f"The bucket boundaries must be positive and increasing: {bucket_boundaries}"
+        )
+
+    if max_tokens is None:
+        bucket_batch_sizes = len(bucket_boundaries) * [batch_size]
+    else:
+        bucket_batch_sizes = token_budget_batch_sizes(bucket_boundaries, max_tokens)
+
+    max_length = bucket_boundaries[-1]
+    ds = ds.filter(lambda x: x[length_key] < max_length)
+    # The last boundary only bounds the last bucket, whose examples are all
+    # shorter than it after the filter.
+    return ds.apply(
+        tf.data.experimental.bucket_by_sequence_length(
+            element_length_func=lambda x: x[length_key],
+            bucket_boundaries=bucket_boundaries[:-1],
+            bucket_batch_sizes=bucket_batch_sizes,
+            drop_remainder=drop_remainder,
+        )
+    )
@@ -0,0 +1,210 @@
+"""Progress and hot-path metrics of long-running dataset builds.
+
+Every builder has a BuildMetrics that its _generate_examples reports to. The
+metrics are grouped by stage, like "parse" or "fetch", and each stage has:
+    counters: like "records" or "bytes_read".
+    dropped: the number of records dropped for each reason.
+    latencies: the count, total and max of timed events, like requests.
+    seconds: the time spent in `timed` blocks of the stage.
+A summary line is logged every `log_interval_seconds` while examples are
+generated, and the summary is written as JSON when generation finishes.
+
+To send the metrics elsewhere, subclass BuildMetrics and override `log` and
+`write`, then pass an instance to the builder.
+"""
+import collections
+import contextlib
+import json
+import os
+import resource
+import threading
+import time
+
+import tensorflow as tf
+
+# The name of the file in the dataset directory that the metrics of the last
+# generation are written to.
+FILENAME = "build_metrics.json"
+
+# We only check whether it is time to log every this many examples.
+_LOG_CHECK_INTERVAL = 1000
+
+
+def for_builder(builder, metrics=None):
+    """Returns the metrics a builder should report to.
+
+    Creates a BuildMetrics if metrics is None and names it after the builder
+    if it has no name.
+    """
+    if metrics is None:
+        metrics = BuildMetrics()
+    if not metrics.name:
+        metrics.name = builder.name
+    return metrics
+
+
+def default_output_path(builder):
+    """Returns where a builder writes its metrics if they have no output_path."""
+    return os.path.join(builder.data_dir, FILENAME)
+
+
+def peak_rss_bytes():
+    """Returns the memory high-water mark of this process and its children."""
+    # ru_maxrss is in KiB on Linux.
+    return 1024 * max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+
+
+class _Stage(object):
+    def __init__(self):
+        self.counters = collections.Counter()
+        self.dropped = collections.Counter()
+        # Map from name to a [count, total_seconds, max_seconds] list.
+        self.latencies = collections.defaultdict(lambda: [0, 0.0, 0.0])
+        self.seconds = 0.0
+
+    def as_dict(self):
+        return {
+            "counters": dict(self.counters),
+            "dropped": dict(self.dropped),
+            "latencies": {
+                name: {"count": c, "total_seconds": total, "max_seconds": max_}
+                for name, (c, total, max_) in self.latencies.items()
+            },
+            "seconds": self.seconds,
+        }
+
+
+class BuildMetrics(object):
+    """Per-stage counters and timings of generating a dataset.
+
+    It is safe to report to it from several threads.
+    """
+
+    def __init__(self, name="", log_interval_seconds=60.0, output_path=None):
+        """Creates the metrics.
+
+        Args:
+            name: the name to prefix log lines with. Builders set it to their
+                name if empty.
+            log_interval_seconds: how often to log a summary line while
+                examples are generated. Set to None to never log one.
+            output_path: where to write the JSON summary when generation
+                finishes. Builders default to FILENAME in the dataset
+                directory.
+        """
+        self.name = name
+        self.log_interval_seconds = log_interval_seconds
+        self.output_path = output_path
+        self._lock = threading.Lock()
+        self._stages = collections.OrderedDict()
+        self._start_time = time.time()
+        self._last_log_time = self._start_time
+
+    def _stage(self, stage):
+        if stage not in self._stages:
+            self._stages[stage] = _Stage()
+        return self._stages[stage]
+
+    def count(self, stage, counter, n=1):
+        """Adds n to a counter of a stage."""
+        with self._lock:
+            self._stage(stage).counters[counter] += n
+
+    def drop(self, stage, reason, n=1):
+        """Records that n records were dropped in a stage for a reason."""
+        with self._lock:
+            self._stage(stage).dropped[reason] += n
+
+    def observe(self, stage, name, seconds):
+        """Records the duration of an event, like a remote request."""
+        with self._lock:
+            latency = self._stage(stage).latencies[name]
+            latency[0] += 1
+            latency[1] += seconds
+            latency[2] = max(latency[2], seconds)
+
+    @contextlib.contextmanager
+    def timed(self, stage):
+        """Adds the time spent in the with block to a stage."""
+        start_time = time.time()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._stage(stage).seconds += time.time() - start_time
+
+    def track(self, examples, output_path=None, finish=True):
+        """Yields the (key, example) pairs of a generator and reports on them.
+
+        The examples are counted in the "generate" stage. A summary line is
+        logged every log_interval_seconds, and once the generator is done the
+        summary is logged and written to self.output_path, or output_path if
+        that is not set. Builders that generate many splits can pass
+        finish=False for all but the last one to only do that once.
+        """
+        num_examples = 0
+        for key, example in examples:
+            yield key, example
+            num_examples += 1
+            if num_examples % _LOG_CHECK_INTERVAL == 0:
+                self.count("generate", "examples", _LOG_CHECK_INTERVAL)
+                self.maybe_log()
+        self.count("generate", "examples", num_examples % _LOG_CHECK_INTERVAL)
+        if not finish:
+            return
+        self.log(self.summary_line())
+        path = self.output_path or output_path
+        if path:
+            self.write(path)
+
+    def maybe_log(self):
+        """Logs a summary line if log_interval_seconds have passed."""
+        if self.log_interval_seconds is None:
+            return
+        now = time.time()
+        if now - self._last_log_time >= self.log_interval_seconds:
+            self._last_log_time = now
+            self.log(self.summary_line())
+
+    def log(self, line):
+        print(f"[{self.name}] {line}" if self.name else line)
+
+    def summary(self):
+        """Returns all of the metrics as a JSON-serializable dict."""
+        with self._lock:
+            stages = {name: stage.as_dict() for name, stage in self._stages.items()}
+        return {
+            "name": self.name,
+            "elapsed_seconds": time.time() - self._start_time,
+            "peak_rss_bytes": peak_rss_bytes(),
+            "stages": stages,
+        }
+
+    def summary_line(self):
+        """Returns a one line summary of the metrics."""
+        summary = self.summary()
+        elapsed = summary["elapsed_seconds"]
+        parts = [f"{elapsed:.0f} s"]
+        for name, stage in summary["stages"].items():
+            items = [f"{k}={v}" for k, v in stage["counters"].items()]
+            if "examples" in stage["counters"] and elapsed > 0:
+                items.append(f"{stage['counters']['examples'] / elapsed:.0f}/s")
+            items.extend(f"dropped_{k}={v}" for k, v in stage["dropped"].items())
+            for k, latency in stage["latencies"].items():
+                mean = latency["total_seconds"] / latency["count"]
+                items.append(f"{k}_mean={mean:.2f}s")
+            if stage["seconds"]:
+                items.append(f"in {stage['seconds']:.0f} s")
+            parts.append(f"{name}: {' '.join(items)}")
+        parts.append(f"peak RSS {summary['peak_rss_bytes'] / 2 ** 20:.0f} MiB")
+        return ", ".join(parts)
+
+    def write(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            tf.io.gfile.makedirs(directory)
+        with tf.io.gfile.GFile(path, "w") as f:
+            json.dump(self.summary(), f, indent=2, sort_keys=True)
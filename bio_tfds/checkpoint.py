@@ -0,0 +1,217 @@
+"""Checkpoints that let a crashed example generation resume where it stopped.
+
+TFDS shuffles the examples of a split across all of its shards by the hash of
+their keys, so no output shard is final before every example has been
+generated. Instead, the generated (key, example) pairs are committed in chunks
+to a checkpoint directory. Each chunk covers a range [start, end) of positions
+in the input, like byte offsets of a file or indices of a dataset, and the
+checkpoint records the ranges, key ranges and CRC32s of the committed chunks.
+
+A restarted generation verifies the committed chunks, yields their examples
+again and continues generating from the end of the last one. Since the keys
+and examples are the same as those of an uninterrupted generation, so is the
+prepared dataset.
+
+The chunks are spill files, so the checkpoint directory should be on local
+disk. It needs about as much space as the generated examples.
+"""
+import json
+import os
+import pickle
+import shutil
+import zlib
+
+from bio_tfds import spill
+
+# The name of the file in the checkpoint directory that lists the chunks.
+_CHECKPOINT_FILE = "checkpoint.json"
+
+_BUFFER_SIZE = 16 * 1024 * 1024
+
+
+def _file_crc32(path):
+    crc = 0
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(_BUFFER_SIZE)
+            if not data:
+                return crc
+            crc = zlib.crc32(data, crc)
+
+
+def _write_json_atomically(path, value):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(value, f, indent=2, sort_keys=True)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def remove(directory):
+    """Removes a checkpoint directory, for example once the dataset is prepared."""
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+class _ChunkWriter(spill.SpillWriter):
+    """A spill writer that keeps the CRC32 of what it has written."""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.crc32 = 0
+        self.num_bytes = 0
+
+    def write(self, record):
+        data = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+        self._file.write(data)
+        self.crc32 = zlib.crc32(data, self.crc32)
+        self.num_bytes += len(data)
+        self.num_records += 1
+
+    def close(self):
+        # The chunk must be on disk before the checkpoint refers to it.
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        super().close()
+
+
+class Checkpoint(object):
+    """The committed chunks of a generation.
+
+    Attributes:
+        directory: the checkpoint directory.
+        position: the end of the last committed chunk, which is where the
+            generation continues from. 0 if there are none.
+        state: a JSON-serializable dict that builders can use to remember
+            other progress, like a finished partitioning step.
+    """
+
+    def __init__(self, directory, fingerprint, log=print):
+        """Opens the checkpoint in a directory, creating it if needed.
+
+        Args:
+            directory: the checkpoint directory.
+            fingerprint: a JSON-serializable value that identifies the inputs
+                and options of the generation. If the checkpoint was made with
+                a different one, it is discarded.
+            log: the function to log messages with.
+        """
+        self.directory = directory
+        self.fingerprint = fingerprint
+        self._log = log
+        self._chunks = []
+        self.state = {}
+        self._load()
+
+    @property
+    def position(self):
+        return self._chunks[-1]["end"] if self._chunks else 0
+
+    @property
+    def num_records(self):
+        return sum(chunk["num_records"] for chunk in self._chunks)
+
+    def _checkpoint_path(self):
+        return os.path.join(self.directory, _CHECKPOINT_FILE)
+
+    def _load(self):
+        path = self._checkpoint_path()
+        if not os.path.exists(path):
+            os.makedirs(self.directory, exist_ok=True)
+            return
+        with open(path) as f:
+            checkpoint = json.load(f)
+        # Round trip through JSON so that tuples compare equal to lists.
+        if checkpoint["fingerprint"] != json.loads(json.dumps(self.fingerprint)):
+            self._log(
+                f"Discarding the checkpoint in {self.directory} since its inputs "
+                "or options are different."
+            )
+            remove(self.directory)
+            os.makedirs(self.directory)
+            return
+        self.state = checkpoint["state"]
+        # Keep the chunks up to the first one that is missing or corrupt.
+        for chunk in checkpoint["chunks"]:
+            chunk_path = os.path.join(self.directory, chunk["file"])
+            if (
+                not os.path.exists(chunk_path)
+                or os.path.getsize(chunk_path) != chunk["num_bytes"]
+                or _file_crc32(chunk_path) != chunk["crc32"]
+            ):
+                self._log(f"Chunk {chunk['file']} is corrupt, regenerating from it.")
+                break
+            self._chunks.append(chunk)
+        if self._chunks:
+            self._log(
+                f"Resuming from position {self.position} with "
+                f"{self.num_records} examples in {len(self._chunks)} chunks."
+            )
+
+    def _save(self):
+        _write_json_atomically(
+            self._checkpoint_path(),
+            {
+                "fingerprint": self.fingerprint,
+                "state": self.state,
+                "chunks": self._chunks,
+            },
+        )
+
+    def update_state(self, **kwargs):
+        """Adds the kwargs to the state and saves it."""
+        self.state.update(kwargs)
+        self._save()
+
+    def iter_committed(self):
+        """Yields the (key, example) pairs of the committed chunks in order."""
+        for chunk in self._chunks:
+            yield from spill.iter_spill(os.path.join(self.directory, chunk["file"]))
+
+    def commit(self, examples, start, end):
+        """Yields (key, example) pairs while committing them as a chunk.
+
+        The chunk is only committed once all of the examples have been
+        yielded, so a generation that stops in the middle resumes from
+        `start`.
+
+        Args:
+            examples: an iterable of the (key, example) pairs generated from
+                the range [start, end) of the input.
+            start: must be the position of the checkpoint.
+            end: the end of the range.
+        """
+        if start != self.position:
+            raise ValueError(
+                f"The chunk starts at {start} but the checkpoint is at {self.position}."
+            )
+        name = f"chunk-{len(self._chunks):05d}"
+        path = os.path.join(self.directory, name)
+        first_key = last_key = None
+        with _ChunkWriter(path + ".tmp") as writer:
+            for key, example in examples:
+                writer.write((key, example))
+                if first_key is None:
+                    first_key = key
+                last_key = key
+                yield key, example
+        os.replace(path + ".tmp", path)
+        self._chunks.append(
+            {
+                "file": name,
+                "start": start,
+                "end": end,
+                "first_key": _json_key(first_key),
+                "last_key": _json_key(last_key),
+                "num_records": writer.num_records,
+                "num_bytes": writer.num_bytes,
+                "crc32": writer.crc32,
+            }
+        )
+        self._save()
+
+
+def _json_key(key):
+    if isinstance(key, bytes):
+        return key.decode("utf-8")
+    return key
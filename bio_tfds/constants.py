@@ -13,6 +13,12 @@ if _is_longleaf():
 
     # The default directory to download files to for tfds.
     DEFAULT_TFDS_DOWNLOAD_DIR = "/proj/craffel/datasets/tfds/downloads"
+
+    # The default path of the cache of sequences retrieved from UniProt.
+    DEFAULT_SEQUENCE_CACHE_PATH = "/proj/craffel/datasets/tfds/uniprot_sequences.sqlite"
 else:
     DEFAULT_TFDS_DATA_DIR = None
     DEFAULT_TFDS_DOWNLOAD_DIR = None
+    DEFAULT_SEQUENCE_CACHE_PATH = os.path.join(
+        os.path.expanduser("~"), ".cache", "bio_tfds", "uniprot_sequences.sqlite"
+    )
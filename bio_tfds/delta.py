@@ -0,0 +1,212 @@
+"""Incremental rebuilds of a dataset from a previous prepared version.
+
+A prepared dataset can keep a content hash of each of its records next to its
+shards, as a RecordHashes sorted by key. When the inputs of a new release are
+mostly the same, a delta build compares the hashes of the new records to
+those of the previous version. Only the added and modified records are
+generated from the inputs. The unchanged ones are read back from the shards
+of the previous version instead, through its record_index.RecordIndex.
+
+The hashes are 64-bit BLAKE2b digests, which are plenty to detect changes.
+"""
+import collections
+import hashlib
+import json
+import os
+
+import numpy as np
+import tensorflow as tf
+import tensorflow_datasets.public_api as tfds
+
+_ARRAY_NAMES = ("keys", "hashes")
+
+# The number of keys we hold in Python lists before converting them to arrays.
+_BUFFER_SIZE = 1 << 16
+
+# The number of unchanged records we read and decode at a time.
+_READ_BATCH_SIZE = 1 << 14
+
+# An odd 64-bit constant to mix hashes with in `combine`.
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+def hashes_directory(data_dir, split):
+    """Returns where the RecordHashes of a split of a dataset are saved."""
+    return os.path.join(data_dir, f"{split}-record-hashes")
+
+
+def changelog_path(data_dir, split):
+    """Returns where the changelog of a split built by a delta build is saved."""
+    return os.path.join(data_dir, f"{split}-changelog.json")
+
+
+def content_hash(*parts):
+    """Returns the hash of some bytes as an int that fits in a uint64."""
+    h = hashlib.blake2b(digest_size=8)
+    for part in parts:
+        # Prefixing each part with its length makes the parts unambiguous.
+        h.update(len(part).to_bytes(8, "little"))
+        h.update(part)
+    return int.from_bytes(h.digest(), "little")
+
+
+def combine(hashes, other_hashes):
+    """Combines two uint64 arrays of hashes element-wise."""
+    with np.errstate(over="ignore"):
+        return np.asarray(hashes, np.uint64) ^ (
+            np.asarray(other_hashes, np.uint64) * _MIX
+        )
+
+
+class RecordHashes(object):
+    """The content hash of every record of a dataset, sorted by key."""
+
+    def __init__(self, keys, hashes):
+        # Sorted bytes array of the unique keys.
+        self.keys = keys
+        # uint64 array with the content hash of each key's record.
+        self.hashes = hashes
+
+    @classmethod
+    def from_unsorted(cls, keys, hashes):
+        keys = np.asarray(keys, dtype=bytes)
+        if not len(keys):
+            keys = np.zeros([0], dtype="S1")
+        order = np.argsort(keys, kind="stable")
+        return cls(keys=keys[order], hashes=np.asarray(hashes, np.uint64)[order])
+
+    def save(self, directory):
+        tf.io.gfile.makedirs(directory)
+        for name in _ARRAY_NAMES:
+            with tf.io.gfile.GFile(os.path.join(directory, f"{name}.npy"), "wb") as f:
+                np.save(f, getattr(self, name))
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """Loads hashes saved with `save`, memory-mapping them by default."""
+        mmap_mode = "r" if mmap else None
+        arrays = {
+            name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+            for name in _ARRAY_NAMES
+        }
+        return cls(**arrays)
+
+    @staticmethod
+    def exists(directory):
+        return tf.io.gfile.exists(os.path.join(directory, "hashes.npy"))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def lookup(self, keys):
+        """Returns a (found, hashes) tuple of arrays with an entry per key.
+
+        The hashes of keys that are not found are meaningless.
+        """
+        keys = np.asarray(keys, dtype=bytes)
+        if not len(self.keys):
+            return np.zeros(keys.shape, dtype=bool), np.zeros(keys.shape, np.uint64)
+        positions = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        found = self.keys[positions] == keys
+        return found, np.asarray(self.hashes[positions])
+
+
+class RecordHashesBuilder(object):
+    """Collects the hashes of records one at a time into a RecordHashes."""
+
+    def __init__(self):
+        self._keys = []
+        self._hashes = []
+        self._key_arrays = []
+        self._hash_arrays = []
+
+    def add(self, key, content_hash):
+        if isinstance(key, str):
+            key = key.encode("utf-8")
+        self._keys.append(key)
+        self._hashes.append(content_hash)
+        if len(self._keys) >= _BUFFER_SIZE:
+            self._flush()
+
+    def extend(self, keys, hashes):
+        self._flush()
+        self._key_arrays.append(np.asarray(keys, dtype=bytes))
+        self._hash_arrays.append(np.asarray(hashes, np.uint64))
+
+    def _flush(self):
+        if self._keys:
+            # Python lists of bytes take up several times the memory of arrays.
+            self._key_arrays.append(np.asarray(self._keys, dtype=bytes))
+            self._hash_arrays.append(np.asarray(self._hashes, np.uint64))
+            self._keys = []
+            self._hashes = []
+
+    def build(self):
+        self._flush()
+        if not self._key_arrays:
+            return RecordHashes.from_unsorted([], [])
+        return RecordHashes.from_unsorted(
+            np.concatenate(self._key_arrays), np.concatenate(self._hash_arrays)
+        )
+
+
+Changes = collections.namedtuple(
+    "Changes", ["added", "removed", "modified", "unchanged"]
+)
+
+
+def diff(previous, current):
+    """Compares two RecordHashes.
+
+    Returns:
+        A Changes tuple of sorted bytes arrays of keys. The added keys are
+        only in current, the removed keys only in previous, and the modified
+        and unchanged keys are in both with different or equal hashes.
+    """
+    found, previous_hashes = previous.lookup(current.keys)
+    same = found & (previous_hashes == np.asarray(current.hashes))
+    in_current, _ = current.lookup(previous.keys)
+    return Changes(
+        added=current.keys[~found],
+        removed=np.asarray(previous.keys[~in_current]),
+        modified=current.keys[found & ~same],
+        unchanged=current.keys[same],
+    )
+
+
+def write_changelog(path, changes):
+    """Writes the added, removed and modified keys as JSON."""
+    changelog = {}
+    for name in ("added", "removed", "modified"):
+        keys = getattr(changes, name)
+        changelog[f"num_{name}"] = len(keys)
+        changelog[name] = [key.decode("utf-8") for key in keys.tolist()]
+    changelog["num_unchanged"] = len(changes.unchanged)
+    with tf.io.gfile.GFile(path, "w") as f:
+        json.dump(changelog, f, indent=1)
+
+
+def iter_records(index, directory, features, keys):
+    """Yields the (key, example) of some keys from the shards of a dataset.
+
+    The examples are decoded from the serialized records but not otherwise
+    transformed, so they can be passed to the TFDS writer as they are.
+
+    Args:
+        index: the record_index.RecordIndex of the split.
+        directory: the directory of the dataset with the shards.
+        features: the FeaturesDict of the dataset.
+        keys: a bytes array of keys that are all in the index.
+    """
+    keys = np.asarray(keys, dtype=bytes)
+    _, shard_ids, offsets, _ = index.locate(keys)
+    # Reading in shard and offset order makes each batch of reads sequential.
+    keys = keys[np.lexsort([offsets, shard_ids])]
+    for begin in range(0, len(keys), _READ_BATCH_SIZE):
+        batch = keys[begin : begin + _READ_BATCH_SIZE]
+        ds = tf.data.Dataset.from_tensor_slices(index.read(directory, batch))
+        ds = ds.map(
+            features.deserialize_example,
+            num_parallel_calls=tf.data.experimental.AUTOTUNE,
+        )
+        yield from zip(batch.tolist(), tfds.as_numpy(ds))
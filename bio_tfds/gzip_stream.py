@@ -0,0 +1,140 @@
+"""Reading gzipped files with decompression in a background thread.
+
+This lets us parse a downloaded .gz file directly instead of having
+dl_manager.download_and_extract write the fully decompressed file to disk
+first. The decompression happens in a separate thread that feeds blocks of
+decompressed bytes through a bounded queue. zlib releases the GIL while
+decompressing, so parsing overlaps with decompression.
+"""
+import io
+import queue
+import threading
+import zlib
+
+import tensorflow as tf
+
+# The number of compressed bytes we read at a time.
+DEFAULT_READ_SIZE = 4 * 1024 * 1024
+
+# The maximum number of decompressed blocks waiting to be read.
+DEFAULT_QUEUE_SIZE = 16
+
+# Put on the queue once the whole file has been decompressed.
+_END = object()
+
+
+class _ThreadedGzipRaw(io.RawIOBase):
+    """A raw binary stream of the decompressed contents of a gzipped file."""
+
+    def __init__(self, path, read_size, queue_size):
+        super().__init__()
+        self._path = path
+        self._read_size = read_size
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._block = memoryview(b"")
+        self._done = False
+        self._thread = threading.Thread(target=self._decompress, daemon=True)
+        self._thread.start()
+
+    def _put(self, item):
+        # Returns False if the reader was closed while we were waiting.
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _decompress(self):
+        try:
+            # The wbits tell zlib to expect a gzip header.
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            # Whether the current decompressor has been given any input.
+            in_member = False
+            with tf.io.gfile.GFile(self._path, "rb") as f:
+                while True:
+                    data = f.read(self._read_size)
+                    if not data:
+                        break
+                    while data:
+                        in_member = True
+                        block = decompressor.decompress(data)
+                        if block and not self._put(block):
+                            return
+                        # A gzip file can consist of several members, in which
+                        # case we need a fresh decompressor for each of them.
+                        data = decompressor.unused_data
+                        if decompressor.eof:
+                            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                            in_member = False
+            block = decompressor.flush()
+            if block and not self._put(block):
+                return
+            if in_member and not decompressor.eof:
+                # The file is truncated, which gzip.open reports the same way.
+                self._put(
+                    EOFError(
+                        "Compressed file ended before the end-of-stream marker "
+                        "was reached"
+                    )
+                )
+                return
+            self._put(_END)
+        except Exception as e:  # pylint: disable=broad-except
+            # Re-raised in the reading thread.
+            self._put(e)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._block and not self._done:
+            item = self._queue.get()
+            if item is _END:
+                self._done = True
+            elif isinstance(item, Exception):
+                self._done = True
+                raise item
+            else:
+                self._block = memoryview(item)
+        size = min(len(buffer), len(self._block))
+        buffer[:size] = self._block[:size]
+        self._block = self._block[size:]
+        return size
+
+    def close(self):
+        self._stop.set()
+        super().close()
+
+
+def open_gzip(
+    path,
+    mode="rb",
+    encoding="utf-8",
+    read_size=DEFAULT_READ_SIZE,
+    queue_size=DEFAULT_QUEUE_SIZE,
+):
+    """Opens a gzipped file for reading its decompressed contents.
+
+    Args:
+        path: the path to the gzipped file.
+        mode: either "rb" for a binary stream or "r" for a text stream.
+        encoding: the encoding of the text when the mode is "r".
+        read_size: the number of compressed bytes to read at a time.
+        queue_size: the maximum number of decompressed blocks waiting to be
+            read. This bounds the memory used when parsing is slower than
+            decompression.
+
+    Returns:
+        A file-like object that should be closed when done, for example by
+        using it as a context manager.
+    """
+    if mode not in ("rb", "r"):
+        raise ValueError(f"Unsupported mode: {mode}")
+    raw = _ThreadedGzipRaw(path, read_size=read_size, queue_size=queue_size)
+    f = io.BufferedReader(raw, buffer_size=read_size)
+    if mode == "r":
+        f = io.TextIOWrapper(f, encoding=encoding)
+    return f
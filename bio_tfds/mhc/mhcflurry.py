@@ -3,11 +3,17 @@
 Taken from https://github.com/iskandr/cd8-tcell-epitope-prediction-data
 """
 import csv
+import hashlib
+import json
+import os
 from enum import Enum
 
+import numpy as np
 import tensorflow as tf
 import tensorflow_datasets.public_api as tfds
 
+from bio_tfds import amino_acids
+from bio_tfds import build_metrics
 from bio_tfds.constants import DEFAULT_TFDS_DATA_DIR
 
 _CITATION = R"""\
@@ -78,6 +84,37 @@ def normalize_ic50(ic50):
     )
 
 
+# The arrays returned by as_numpy_arrays. The last one is saved last, so we
+# check for it to see if a cache is complete.
+_NUMPY_ARRAY_NAMES = (
+    "peptide",
+    "peptide_length",
+    "mhc",
+    "mhc_length",
+    "allele",
+    "measurement_inequality",
+    "affinity",
+)
+
+# The number of examples we read at a time when materializing a split.
+_NUMPY_BATCH_SIZE = 4096
+
+
+def _normalize_ic50_np(ic50):
+    """Same as normalize_ic50 but in NumPy, for use when generating."""
+    return 1.0 - np.log(np.clip(ic50, 1.0, 50000.0)) / np.log(50000.0)
+
+
+def _species_of_allele(allele):
+    """Same as species_from_allele but for a Python str."""
+    return "-".join(allele.split("-")[:-1])
+
+
+def _gene_of_allele(allele):
+    """Same as gene_from_allele but for a Python str."""
+    return allele.split("*")[0]
+
+
 def species_from_allele(allele):
     species = tf.strings.split(allele, sep="-")
     species = species[..., :-1]
@@ -97,15 +134,17 @@ def _listify(x):
     return x
 
 
-_VERSION = tfds.core.Version("1.0.0")
+_VERSION = tfds.core.Version("1.1.0")
 
 
 class MhcBindingAffinityConfig(tfds.core.BuilderConfig):
-    def __init__(self, *, mhc_sequence_url, **kwargs):
+    def __init__(self, *, mhc_sequence_url, encode_sequences=False, **kwargs):
         super().__init__(
             description=_MHC_BINDING_AFFINITY_DESC, version=_VERSION, **kwargs
         )
         self.mhc_sequence_url = mhc_sequence_url
+        # If True, the sequences are also stored as amino_acids tokens.
+        self.encode_sequences = encode_sequences
 
 
 class MhcBindingAffinity(tfds.core.GeneratorBasedBuilder):
@@ -123,6 +162,15 @@ class MhcBindingAffinity(tfds.core.GeneratorBasedBuilder):
         MhcBindingAffinityConfig(
             name="aligned_mhc", mhc_sequence_url=_ALIGNED_MHC_SEQUENCE_URL
         ),
+        # The same as above but with the sequences also stored as tokens.
+        MhcBindingAffinityConfig(
+            name="encoded", mhc_sequence_url=_MHC_SEQUENCE_URL, encode_sequences=True
+        ),
+        MhcBindingAffinityConfig(
+            name="aligned_mhc_encoded",
+            mhc_sequence_url=_ALIGNED_MHC_SEQUENCE_URL,
+            encode_sequences=True,
+        ),
     ]
 
     def __init__(
@@ -135,9 +183,13 @@ class MhcBindingAffinity(tfds.core.GeneratorBasedBuilder):
         alleles=None,
         exclude_alleles=None,
         data_dir=DEFAULT_TFDS_DATA_DIR,
+        metrics=None,
         **kwargs,
     ):
         super().__init__(data_dir=data_dir, **kwargs)
+        # The build_metrics.BuildMetrics to report the progress of generating
+        # examples to.
+        self.metrics = build_metrics.for_builder(self, metrics)
         self.include_inequalities = include_inequalities
         self.normalize_measurement = normalize_measurement
         species = _listify(species)
@@ -150,31 +202,52 @@ class MhcBindingAffinity(tfds.core.GeneratorBasedBuilder):
         self.exclude_alleles = _listify(exclude_alleles)
 
     def _info(self):
-        return tfds.core.DatasetInfo(
-            builder=self,
-            description=self.builder_config.description,
-            features=tfds.features.FeaturesDict(
+        features = {
+            # Name of MHC allele, e.g. "HLA-A*02:01".
+            "mhc_allele": tfds.features.Text(),
+            # nM affinity (smaller is better), most often an
+            # IC50 (inhibitory concentration). If `normalize_measurement` is True
+            # then this will be converted to a value between 0 and 1 through the
+            # transformation 1 - log(min(max(affinity, 1), 50000))/log(50000).
+            "affinity": tf.float32,
+            # One of {=, >, <}. Most often = but < indicates that the measurement
+            # is an upper bound (and a lower bound >). If `include_inequalities`
+            # is False, then only equalities will be included.
+            "measurement_inequality": tfds.features.ClassLabel(
+                names=MEASUREMENT_INEQUALITIES
+            ),
+            # The allele, its species and its gene as integer labels,
+            # e.g. "HLA-A*02:01", "HLA" and "HLA-A". These let us
+            # filter without any string ops. The names are those
+            # found in the data, so they are set in _split_generators.
+            "allele": tfds.features.ClassLabel(),
+            "species": tfds.features.ClassLabel(),
+            "gene": tfds.features.ClassLabel(),
+            # The affinity after the transformation used when
+            # `normalize_measurement` is True.
+            "normalized_affinity": tf.float32,
+            # Amino acid sequence of the peptide.
+            "peptide_sequence": tfds.features.Text(),
+            # Most of the diversity of Class I MHCs occurs in exons 2 and 3,
+            # so some sequences are limited to those regions.
+            "mhc_sequence": tfds.features.Text(),
+        }
+        if self.builder_config.encode_sequences:
+            features.update(
                 {
-                    # Name of MHC allele, e.g. "HLA-A*02:01".
-                    "mhc_allele": tfds.features.Text(),
-                    # nM affinity (smaller is better), most often an
-                    # IC50 (inhibitory concentration). If `normalize_measurement` is True
-                    # then this will be converted to a value between 0 and 1 through the
-                    # transformation 1 - log(min(max(affinity, 1), 50000))/log(50000).
-                    "affinity": tf.float32,
-                    # One of {=, >, <}. Most often = but < indicates that the measurement
-                    # is an upper bound (and a lower bound >). If `include_inequalities`
-                    # is False, then only equalities will be included.
-                    "measurement_inequality": tfds.features.ClassLabel(
-                        names=MEASUREMENT_INEQUALITIES
+                    # The sequences as amino_acids tokens and their lengths.
+                    "peptide_tokens": tfds.features.Tensor(
+                        shape=(None,), dtype=tf.uint8
                     ),
-                    # Amino acid sequence of the peptide.
-                    "peptide_sequence": tfds.features.Text(),
-                    # Most of the diversity of Class I MHCs occurs in exons 2 and 3,
-                    # so some sequences are limited to those regions.
-                    "mhc_sequence": tfds.features.Text(),
+                    "peptide_length": tf.int32,
+                    "mhc_tokens": tfds.features.Tensor(shape=(None,), dtype=tf.uint8),
+                    "mhc_length": tf.int32,
                 }
-            ),
+            )
+        return tfds.core.DatasetInfo(
+            builder=self,
+            description=self.builder_config.description,
+            features=tfds.features.FeaturesDict(features),
             homepage="https://github.com/iskandr/cd8-tcell-epitope-prediction-data",
             citation=_CITATION,
         )
@@ -186,6 +259,7 @@ class MhcBindingAffinity(tfds.core.GeneratorBasedBuilder):
                 "mhc_sequence_file": self.builder_config.mhc_sequence_url,
             }
         )
+        self._set_label_names(**extracted_paths)
         return [
             tfds.core.SplitGenerator(
                 name=tfds.Split.TRAIN,
@@ -201,7 +275,26 @@ class MhcBindingAffinity(tfds.core.GeneratorBasedBuilder):
                 allele_to_sequence[row["name"]] = row["seq"]
         return allele_to_sequence
 
+    def _set_label_names(self, affinity_file, mhc_sequence_file):
+        """Sets the names of the allele, species and gene ClassLabels."""
+        allele_to_sequence = self._create_allele_to_sequence_map(mhc_sequence_file)
+        alleles = set()
+        with open(affinity_file, encoding="utf-8") as f:
+            for row in csv.DictReader(f, delimiter=","):
+                if row["allele"] in allele_to_sequence:
+                    alleles.add(row["allele"])
+        features = self.info.features
+        features["allele"].names = sorted(alleles)
+        features["species"].names = sorted({_species_of_allele(a) for a in alleles})
+        features["gene"].names = sorted({_gene_of_allele(a) for a in alleles})
+
     def _generate_examples(self, affinity_file, mhc_sequence_file):
+        yield from self.metrics.track(
+            self._iter_examples(affinity_file, mhc_sequence_file),
+            build_metrics.default_output_path(self),
+        )
+
+    def _iter_examples(self, affinity_file, mhc_sequence_file):
         allele_to_sequence = self._create_allele_to_sequence_map(mhc_sequence_file)
 
         missing_seqs = 0
@@ -209,71 +302,197 @@ class MhcBindingAffinity(tfds.core.GeneratorBasedBuilder):
         with open(affinity_file, encoding="utf-8") as f:
             reader = csv.DictReader(f, delimiter=",")
             for index, row in enumerate(reader):
+                self.metrics.count("parse", "records")
                 allele = row["allele"]
                 mhc_sequence = allele_to_sequence.get(allele, None)
 
                 if mhc_sequence is None:
                     missing_seqs += 1
+                    self.metrics.drop("parse", "missing_mhc_sequence")
                     continue
 
-                yield index, {
+                affinity = float(row["measurement_value"])
+                example = {
                     "mhc_allele": allele,
-                    "affinity": float(row["measurement_value"]),
+                    "allele": allele,
+                    "species": _species_of_allele(allele),
+                    "gene": _gene_of_allele(allele),
+                    "affinity": affinity,
+                    "normalized_affinity": _normalize_ic50_np(affinity),
                     "measurement_inequality": row["measurement_inequality"],
                     "peptide_sequence": row["peptide"],
                     "mhc_sequence": mhc_sequence,
                 }
+                if self.builder_config.encode_sequences:
+                    for name in ["peptide", "mhc"]:
+                        tokens = amino_acids.encode(example[f"{name}_sequence"])
+                        example[f"{name}_tokens"] = tokens
+                        example[f"{name}_length"] = len(tokens)
+                yield index, example
         if missing_seqs:
-            print(
+            self.metrics.log(
                 f"We were unable to find sequences for {missing_seqs} affinity data points."
             )
 
-    def _filter_inequalities_fn(self, x):
-        return tf.equal(
-            x["measurement_inequality"], MEASUREMENT_INEQUALITIES.index("=")
-        )
-
     def _normalize_measurement_fn(self, x):
-        x["affinity"] = normalize_ic50(x["affinity"])
+        x["affinity"] = x["normalized_affinity"]
         return x
 
-    def _filter_species_fn(self, x):
-        x_species = species_from_allele(x["mhc_allele"])
-        return tf.reduce_any([tf.equal(s.value, x_species) for s in self.species])
-
-    def _filter_genes_fn(self, x):
-        x_gene = gene_from_allele(x["mhc_allele"])
-        return tf.reduce_any([tf.equal(s, x_gene) for s in self.genes])
-
-    def _filter_exclude_genes_fn(self, x):
-        x_gene = gene_from_allele(x["mhc_allele"])
-        return tf.reduce_all([tf.not_equal(s, x_gene) for s in self.exclude_genes])
-
-    def _filter_alleles_fn(self, x):
-        return tf.reduce_any([tf.equal(s, x["mhc_allele"]) for s in self.alleles])
+    def _create_allele_mask(self):
+        """Returns a bool array with whether to keep each allele id.
+
+        All of the species, gene and allele filters only depend on the allele,
+        so we can evaluate them once per allele here. Returns None if there
+        is nothing to filter on.
+        """
+        if (
+            self.species is None
+            and self.genes is None
+            and self.exclude_genes is None
+            and self.alleles is None
+            and self.exclude_alleles is None
+        ):
+            return None
+        species = None if self.species is None else {s.value for s in self.species}
+        genes = None if self.genes is None else set(self.genes)
+        exclude_genes = set(self.exclude_genes or [])
+        alleles = None if self.alleles is None else set(self.alleles)
+        exclude_alleles = set(self.exclude_alleles or [])
+
+        def keep(allele):
+            gene = _gene_of_allele(allele)
+            return (
+                (species is None or _species_of_allele(allele) in species)
+                and (genes is None or gene in genes)
+                and gene not in exclude_genes
+                and (alleles is None or allele in alleles)
+                and allele not in exclude_alleles
+            )
 
-    def _filter_exclude_alleles_fn(self, x):
-        return tf.reduce_all(
-            [tf.not_equal(s, x["mhc_allele"]) for s in self.exclude_alleles]
-        )
+        names = self.info.features["allele"].names
+        return np.array([keep(allele) for allele in names], dtype=bool)
+
+    def _create_filter_fn(self):
+        """Returns a single predicate that applies all of the filters.
+
+        It only does integer ops, so the cost per element does not depend on
+        the number of alleles, genes or species filtered on. Returns None if
+        there is nothing to filter.
+        """
+        allele_mask = self._create_allele_mask()
+        if allele_mask is None and self.include_inequalities:
+            return None
+        if allele_mask is not None:
+            allele_mask = tf.constant(allele_mask)
+
+        def filter_fn(x):
+            keep = tf.constant(True)
+            if not self.include_inequalities:
+                keep &= tf.equal(
+                    x["measurement_inequality"], MEASUREMENT_INEQUALITIES.index("=")
+                )
+            if allele_mask is not None:
+                keep &= tf.gather(allele_mask, x["allele"])
+            return keep
+
+        return filter_fn
+
+    def _numpy_cache_key(self, split):
+        """Returns a hash of everything that the materialized arrays depend on."""
+        options = {
+            "config": self.builder_config.name,
+            "version": str(self.info.version),
+            "split": str(split),
+            "vocab": amino_acids.AMINO_ACIDS,
+            "normalize_measurement": self.normalize_measurement,
+            "include_inequalities": self.include_inequalities,
+            "species": None if self.species is None else [s.name for s in self.species],
+            "genes": self.genes,
+            "exclude_genes": self.exclude_genes,
+            "alleles": self.alleles,
+            "exclude_alleles": self.exclude_alleles,
+        }
+        options = json.dumps(options, sort_keys=True).encode("utf-8")
+        return hashlib.sha1(options).hexdigest()[:16]
+
+    def _materialize(self, split):
+        ds = self.as_dataset(split=split)
+        ds = ds.batch(_NUMPY_BATCH_SIZE)
+        ds = ds.prefetch(tf.data.experimental.AUTOTUNE)
+        # The dtype of each column we read from the dataset.
+        dtypes = {
+            "peptide_sequence": bytes,
+            "mhc_sequence": bytes,
+            "allele": np.int32,
+            "measurement_inequality": np.int8,
+            "affinity": np.float32,
+        }
+        columns = {k: [np.zeros([0], dtype=dtype)] for k, dtype in dtypes.items()}
+        for batch in ds.as_numpy_iterator():
+            for k, dtype in dtypes.items():
+                columns[k].append(batch[k].astype(dtype))
+        columns = {k: np.concatenate(v) for k, v in columns.items()}
+
+        arrays = {
+            k: columns[k] for k in ["allele", "measurement_inequality", "affinity"]
+        }
+        for name in ["peptide", "mhc"]:
+            tokens, lengths = amino_acids.encode_batch(columns[f"{name}_sequence"])
+            arrays[name] = tokens.astype(np.int8)
+            arrays[f"{name}_length"] = lengths
+        return arrays
+
+    def as_numpy_arrays(self, split="train", cache_dir=None, mmap=True):
+        """Returns a split with the filters applied as a dict of NumPy arrays.
+
+        The arrays are saved the first time, so later calls with the same
+        config, filter arguments and split only have to load them.
+
+        Sequences are encoded with the tokens of bio_tfds.amino_acids and
+        padded with amino_acids.PAD_TOKEN.
+
+        Args:
+            split: the split to materialize.
+            cache_dir: the directory to save the arrays in. Defaults to a
+                directory in the prepared dataset's directory.
+            mmap: if True, the saved arrays are memory-mapped.
+
+        Returns:
+            A dict with the following arrays, with an entry per example:
+                "peptide": int8 [num_examples, max_peptide_length] tokens.
+                "peptide_length": int32 lengths of the peptides.
+                "mhc": int8 [num_examples, max_mhc_length] tokens.
+                "mhc_length": int32 lengths of the MHC sequences.
+                "allele": int32 ids of the "allele" ClassLabel.
+                "measurement_inequality": int8 ids of the inequalities.
+                "affinity": float32 affinities, normalized if
+                    `normalize_measurement` is True.
+        """
+        if cache_dir is None:
+            cache_dir = os.path.join(self.data_dir, "numpy")
+        directory = os.path.join(cache_dir, self._numpy_cache_key(split))
+        last_path = os.path.join(directory, f"{_NUMPY_ARRAY_NAMES[-1]}.npy")
+        if not tf.io.gfile.exists(last_path):
+            arrays = self._materialize(split)
+            tf.io.gfile.makedirs(directory)
+            for name in _NUMPY_ARRAY_NAMES:
+                path = os.path.join(directory, f"{name}.npy")
+                with tf.io.gfile.GFile(path, "wb") as f:
+                    np.save(f, arrays[name])
+        mmap_mode = "r" if mmap else None
+        return {
+            name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+            for name in _NUMPY_ARRAY_NAMES
+        }
 
     def _as_dataset(self, *args, **kwargs):
         ds = super()._as_dataset(*args, **kwargs)
-        if not self.include_inequalities:
-            ds = ds.filter(self._filter_inequalities_fn)
+        filter_fn = self._create_filter_fn()
+        if filter_fn is not None:
+            ds = ds.filter(filter_fn)
         if self.normalize_measurement:
             ds = ds.map(
                 self._normalize_measurement_fn,
                 num_parallel_calls=tf.data.experimental.AUTOTUNE,
             )
-        if self.species is not None:
-            ds = ds.filter(self._filter_species_fn)
-        if self.genes is not None:
-            ds = ds.filter(self._filter_genes_fn)
-        if self.exclude_genes is not None:
-            ds = ds.filter(self._filter_exclude_genes_fn)
-        if self.alleles is not None:
-            ds = ds.filter(self._filter_alleles_fn)
-        if self.exclude_alleles is not None:
-            ds = ds.filter(self._filter_exclude_alleles_fn)
         return ds
@@ -0,0 +1,104 @@
+"""Utilities for generating examples from a file in parallel.
+
+The file is split into byte ranges whose boundaries are aligned to the starts
+of records. Each range can then be parsed independently in a worker process.
+"""
+import collections
+import multiprocessing
+
+import tensorflow as tf
+
+# The default approximate size in bytes of each range.
+DEFAULT_RANGE_SIZE = 64 * 1024 * 1024
+
+# How many bytes we read at a time when looking for a record boundary.
+_SEARCH_SIZE = 64 * 1024
+
+
+def _find_record_start(f, offset, record_start):
+    """Returns the first offset >= `offset` at which a record starts."""
+    # A record starts right after a "\n" that is followed by `record_start`.
+    # We back up a byte so that we find a record starting exactly at `offset`.
+    delimiter = b"\n" + record_start
+    f.seek(offset - 1)
+    buffer = b""
+    position = offset - 1
+    while True:
+        chunk = f.read(_SEARCH_SIZE)
+        if not chunk:
+            return None
+        buffer += chunk
+        index = buffer.find(delimiter)
+        if index >= 0:
+            return position + index + 1
+        # Keep enough of the buffer to find a delimiter spanning two chunks.
+        keep = len(delimiter) - 1
+        position += len(buffer) - keep
+        buffer = buffer[len(buffer) - keep :]
+
+
+def split_into_ranges(
+    path, range_size=DEFAULT_RANGE_SIZE, record_start=b"", start=0, end=None
+):
+    """Splits a file into byte ranges aligned to record boundaries.
+
+    Args:
+        path: the path to the file.
+        range_size: the approximate size in bytes of each range.
+        record_start: the bytes that a record starts with right after a
+            newline. Use b">" for FASTA files and b"" for line-based files.
+        start: only split the part of the file from this offset, which must
+            be the start of a record.
+        end: only split the part of the file up to this offset, which must be
+            the end of a record. Defaults to the end of the file.
+
+    Returns:
+        A list of (start, end) tuples. The ranges are contiguous and cover the
+        file from `start` to `end`. Any content before the first record that
+        starts after byte 0 belongs to the first range.
+    """
+    size = tf.io.gfile.stat(path).length if end is None else end
+    starts = [start]
+    with tf.io.gfile.GFile(path, "rb") as f:
+        offset = start + range_size
+        while offset < size:
+            next_start = _find_record_start(
+                f, max(offset, starts[-1] + 1), record_start
+            )
+            if next_start is None or next_start >= size:
+                break
+            starts.append(next_start)
+            offset = next_start + range_size
+    ends = starts[1:] + [size]
+    return list(zip(starts, ends))
+
+
+def read_range(path, start, end):
+    """Returns the bytes of the file in [start, end)."""
+    with tf.io.gfile.GFile(path, "rb") as f:
+        f.seek(start)
+        return f.read(end - start)
+
+
+def ordered_imap(fn, args_list, num_workers, max_in_flight=None):
+    """Yields fn(*args) for each args in args_list in order.
+
+    The calls are made in a pool of `num_workers` processes. Unlike
+    Pool.imap, at most `max_in_flight` results are held at once, so a slow
+    consumer does not cause results to pile up in memory.
+
+    `fn` must be a module-level function. We use the "spawn" start method
+    since forking a process that has already started TensorFlow's threads is
+    not safe.
+    """
+    if max_in_flight is None:
+        max_in_flight = 2 * num_workers
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(num_workers) as pool:
+        in_flight = collections.deque()
+        for args in args_list:
+            if len(in_flight) >= max_in_flight:
+                yield in_flight.popleft().get()
+            in_flight.append(pool.apply_async(fn, args))
+        while in_flight:
+            yield in_flight.popleft().get()
@@ -0,0 +1,67 @@
+"""A fast, byte-level streaming FASTA reader.
+
+Bio.SeqIO builds a SeqRecord for every entry and works on decoded text lines,
+which makes it the bottleneck when reading files with tens of millions of
+records. The reader here works on large binary buffers instead, so the only
+per-record Python work is splitting off the header and stripping newlines
+from the sequence.
+"""
+
+# The number of bytes we read from the file at a time.
+DEFAULT_CHUNK_SIZE = 16 * 1024 * 1024
+
+# Bytes that are removed from the body of a record to get its sequence. This
+# matches what Bio.SeqIO removes.
+_SEQUENCE_WHITESPACE = b" \r\n"
+
+
+def _parse_record(record):
+    # The record does not contain its leading ">".
+    header, _, body = record.partition(b"\n")
+    return header.rstrip(b"\r"), body.translate(None, _SEQUENCE_WHITESPACE)
+
+
+def iter_fasta_records(f, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yields the (header, sequence) of each record in a FASTA file.
+
+    Both the header and sequence are bytes. The header does not include the
+    leading ">". Any content before the first record is skipped.
+
+    Args:
+        f: a file-like object opened in binary mode.
+        chunk_size: the number of bytes to read at a time.
+    """
+    # Everything we have read but not yet yielded. Once we have found the
+    # first record, it always starts at the beginning of a record (without
+    # the leading ">").
+    pending = b""
+    found_first_record = False
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        pending += chunk
+
+        if not found_first_record:
+            if pending.startswith(b">"):
+                start = 1
+            else:
+                start = pending.find(b"\n>")
+                if start < 0:
+                    # Keep the last byte in case it is the "\n" of a "\n>".
+                    pending = pending[-1:]
+                    continue
+                start += 2
+            pending = pending[start:]
+            found_first_record = True
+
+        last_boundary = pending.rfind(b"\n>")
+        if last_boundary < 0:
+            continue
+        records = pending[:last_boundary].split(b"\n>")
+        pending = pending[last_boundary + 2 :]
+        for record in records:
+            yield _parse_record(record)
+
+    if found_first_record:
+        yield _parse_record(pending)
@@ -0,0 +1,248 @@
+"""Protein interaction graphs in CSR format and neighbor sampling on them.
+
+The edges of node i (in sorted order of the node ids) are at positions
+indptr[i]:indptr[i + 1] of the indices and weights arrays, where the indices
+are those of the other nodes. The arrays are saved as .npy files which can be
+memory-mapped when loaded, so a graph does not need to be read into memory to
+sample from it.
+
+Builders of interaction datasets list the features of their edges in the
+GRAPH_EDGE_KEYS and GRAPH_WEIGHT_KEY class attributes.
+"""
+import os
+
+import numpy as np
+import tensorflow as tf
+
+_ARRAY_NAMES = ("node_ids", "indptr", "indices", "weights")
+
+# The number of edges we read from the dataset at a time when building.
+_BATCH_SIZE = 1 << 16
+
+
+class CsrGraph(object):
+    """A weighted graph with the edges of each node stored contiguously."""
+
+    def __init__(self, node_ids, indptr, indices, weights):
+        # Sorted bytes array of the unique node ids, like UniProt accessions.
+        self.node_ids = node_ids
+        # int64 array with len(node_ids) + 1 entries.
+        self.indptr = indptr
+        # int32 array with the index of the other node of each edge.
+        self.indices = indices
+        # float16 or float32 array with the weight of each edge.
+        self.weights = weights
+
+    @classmethod
+    def from_edges(
+        cls, sources, targets, weights, undirected=True, weight_dtype=np.float32
+    ):
+        """Builds a graph from parallel arrays with an entry per edge.
+
+        Args:
+            sources: array with the node id of the first node of each edge.
+            targets: array with the node id of the other node of each edge.
+            weights: array with the weight of each edge.
+            undirected: if True, each edge is added in both directions.
+            weight_dtype: the dtype that the weights are stored as.
+
+        Returns:
+            A CsrGraph. If an edge appears more than once, only the copy with
+            the highest weight is kept.
+        """
+        num_edges = len(sources)
+        node_ids, node_indices = np.unique(
+            np.concatenate([sources, targets]), return_inverse=True
+        )
+        sources = node_indices[:num_edges]
+        targets = node_indices[num_edges:]
+        weights = np.asarray(weights, dtype=np.float32)
+        if undirected:
+            sources, targets = (
+                np.concatenate([sources, targets]),
+                np.concatenate([targets, sources]),
+            )
+            weights = np.concatenate([weights, weights])
+
+        # Sort by source, then target, then decreasing weight, so the first
+        # copy of a duplicate edge has the highest weight.
+        order = np.lexsort((-weights, targets, sources))
+        sources = sources[order]
+        targets = targets[order]
+        weights = weights[order]
+        is_first = np.ones([len(sources)], dtype=bool)
+        is_first[1:] = (sources[1:] != sources[:-1]) | (targets[1:] != targets[:-1])
+
+        indptr = np.zeros([len(node_ids) + 1], dtype=np.int64)
+        np.cumsum(
+            np.bincount(sources[is_first], minlength=len(node_ids)), out=indptr[1:]
+        )
+        return cls(
+            node_ids=node_ids,
+            indptr=indptr,
+            indices=targets[is_first].astype(np.int32),
+            weights=weights[is_first].astype(weight_dtype),
+        )
+
+    @classmethod
+    def from_dataset(cls, ds, edge_keys, weight_key, **kwargs):
+        """Builds a graph from a tf.data.Dataset of interactions.
+
+        Args:
+            ds: the dataset.
+            edge_keys: a pair with the features of the ids of the two nodes of
+                each edge.
+            weight_key: the feature with the weight of each edge.
+            **kwargs: passed to `from_edges`.
+        """
+        source_key, target_key = edge_keys
+        ds = ds.map(
+            lambda x: {k: x[k] for k in [source_key, target_key, weight_key]},
+            num_parallel_calls=tf.data.experimental.AUTOTUNE,
+        )
+        ds = ds.batch(_BATCH_SIZE)
+        ds = ds.prefetch(tf.data.experimental.AUTOTUNE)
+        sources, targets, weights = [], [], []
+        for batch in ds.as_numpy_iterator():
+            # The Text features come back as object arrays of bytes, which
+            # take up much more memory than fixed-width bytes arrays.
+            sources.append(batch[source_key].astype(bytes))
+            targets.append(batch[target_key].astype(bytes))
+            weights.append(batch[weight_key])
+        if not weights:
+            empty = np.zeros([0], dtype="S1")
+            return cls.from_edges(empty, empty, np.zeros([0]), **kwargs)
+        return cls.from_edges(
+            np.concatenate(sources),
+            np.concatenate(targets),
+            np.concatenate(weights),
+            **kwargs,
+        )
+
+    @classmethod
+    def from_builder(cls, builder, split="train", **kwargs):
+        """Builds a graph from a prepared split of an interaction dataset.
+
+        Args:
+            builder: a builder with GRAPH_EDGE_KEYS and GRAPH_WEIGHT_KEY class
+                attributes, like hippie.Hippie or stringdb.StringLinks.
+            split: the split to read.
+            **kwargs: passed to `from_edges`.
+        """
+        return cls.from_dataset(
+            builder.as_dataset(split=split),
+            edge_keys=builder.GRAPH_EDGE_KEYS,
+            weight_key=builder.GRAPH_WEIGHT_KEY,
+            **kwargs,
+        )
+
+    def save(self, directory):
+        tf.io.gfile.makedirs(directory)
+        for name in _ARRAY_NAMES:
+            with tf.io.gfile.GFile(os.path.join(directory, f"{name}.npy"), "wb") as f:
+                np.save(f, getattr(self, name))
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """Loads a graph saved with `save`, memory-mapping it by default."""
+        mmap_mode = "r" if mmap else None
+        arrays = {
+            name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+            for name in _ARRAY_NAMES
+        }
+        return cls(**arrays)
+
+    @property
+    def num_nodes(self):
+        return len(self.node_ids)
+
+    @property
+    def num_edges(self):
+        return len(self.indices)
+
+    def node_indices(self, node_ids):
+        """Looks up an array of node ids.
+
+        Returns:
+            An (indices, found) tuple of arrays with an entry per node id. The
+            found is a boolean array that is False for ids not in the graph,
+            whose indices are -1.
+        """
+        node_ids = np.asarray(node_ids, dtype=bytes)
+        if not self.num_nodes:
+            return np.full(node_ids.shape, -1), np.zeros(node_ids.shape, dtype=bool)
+        indices = np.minimum(
+            np.searchsorted(self.node_ids, node_ids), self.num_nodes - 1
+        )
+        found = self.node_ids[indices] == node_ids
+        return np.where(found, indices, -1), found
+
+    def neighbors(self, index):
+        """Returns the (indices, weights) of the neighbors of a node index."""
+        begin, end = self.indptr[index], self.indptr[index + 1]
+        return np.asarray(self.indices[begin:end]), np.asarray(self.weights[begin:end])
+
+
+def export_graph(builder, directory, split="train", **kwargs):
+    """Saves the graph of a prepared interaction dataset.
+
+    Args:
+        builder: a builder with GRAPH_EDGE_KEYS and GRAPH_WEIGHT_KEY class
+            attributes, like hippie.Hippie or stringdb.StringLinks.
+        directory: where to save the graph.
+        split: the split to read.
+        **kwargs: passed to `CsrGraph.from_edges`.
+
+    Returns:
+        The saved graph, memory-mapped.
+    """
+    CsrGraph.from_builder(builder, split=split, **kwargs).save(directory)
+    return CsrGraph.load(directory)
+
+
+def sample_neighbors(graph, seeds, fanouts, rng=None):
+    """Samples the k-hop neighborhoods of some nodes.
+
+    At each hop, every node of the frontier gets `fanout` of its neighbors
+    sampled uniformly with replacement. Nodes without neighbors get none. The
+    frontier of the next hop is the unique sampled neighbors. Each hop is a
+    few vectorized reads of the graph's arrays, which only touch the pages of
+    memory-mapped arrays that are needed.
+
+    Args:
+        graph: a CsrGraph.
+        seeds: array of the node indices to start from.
+        fanouts: the number of neighbors to sample per node at each hop. Its
+            length is the number of hops.
+        rng: a np.random.Generator. Defaults to a new unseeded one.
+
+    Returns:
+        A list with a dict per hop. Its "sources", "targets" and "weights"
+        arrays have an entry per sampled edge.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    frontier = np.unique(np.asarray(seeds, dtype=np.int64))
+    hops = []
+    for fanout in fanouts:
+        begins = np.asarray(graph.indptr[frontier])
+        degrees = np.asarray(graph.indptr[frontier + 1]) - begins
+        has_neighbors = degrees > 0
+        frontier = frontier[has_neighbors]
+        begins = begins[has_neighbors]
+        degrees = degrees[has_neighbors]
+
+        offsets = begins[:, None] + rng.integers(
+            0, degrees[:, None], size=[len(frontier), fanout]
+        )
+        offsets = offsets.ravel()
+        targets = np.asarray(graph.indices[offsets], dtype=np.int64)
+        hops.append(
+            {
+                "sources": np.repeat(frontier, fanout),
+                "targets": targets,
+                "weights": np.asarray(graph.weights[offsets]),
+            }
+        )
+        frontier = np.unique(targets)
+    return hops
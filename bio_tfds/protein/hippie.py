@@ -1,6 +1,9 @@
 """HIPPIE v2 protein-protein interaction dataset."""
+import collections
+import concurrent.futures
 import csv
 import io
+import os
 import ssl
 import time
 import urllib.parse
@@ -11,12 +14,25 @@ from Bio import SeqIO
 import tensorflow as tf
 import tensorflow_datasets.public_api as tfds
 
+from bio_tfds import amino_acids
+from bio_tfds import build_metrics
+from bio_tfds import gzip_stream
+from bio_tfds.constants import DEFAULT_SEQUENCE_CACHE_PATH
 from bio_tfds.constants import DEFAULT_TFDS_DATA_DIR
+from bio_tfds.protein import fasta
+from bio_tfds.protein import seq_cache
+from bio_tfds.protein import uniref
 
 _DOWNLOAD_URL = (
     "http://cbdm-01.zdv.uni-mainz.de/~mschaefer/hippie/HIPPIE-current.mitab.txt"
 )
 
+_UNIPROT_URL = "https://www.uniprot.org/uploadlists/"
+
+# The name of the file in the data_dir with the protein table of the
+# normalized config.
+_PROTEIN_TABLE_FILENAME = "proteins.tsv"
+
 _DESCRIPTION = R"""\
 Protein-protein interaction dataset."""
 
@@ -46,8 +62,8 @@ def _extract_example(example):
     }
 
 
-def _send_seq_request(accs, max_tries=10):
-    url = "https://www.uniprot.org/uploadlists/"
+def _send_seq_request(accs, url=_UNIPROT_URL, max_tries=10, max_backoff_seconds=60):
+    """Returns the FASTA response and the number of retries it took."""
     payload = {
         "from": "ACC+ID",
         "to": "ACC",
@@ -65,34 +81,186 @@ def _send_seq_request(accs, max_tries=10):
         try:
             req = urllib.request.Request(url, data)
             with urllib.request.urlopen(req, context=ctx) as f:
-                return f.read().decode("utf-8")
+                return f.read().decode("utf-8"), attempt
         except urllib.error.URLError:
-            print(f"{2**attempt} s backoff")
-            time.sleep(2 ** attempt)
-    raise urllib.error.URLError
+            backoff = min(2 ** attempt, max_backoff_seconds)
+            time.sleep(backoff)
+    raise urllib.error.URLError(
+        f"Failed to retrieve sequences after {max_tries} tries."
+    )
 
 
-def _retrieve_sequences_from_remote(accs):
+def _retrieve_sequences_from_remote(accs, url=_UNIPROT_URL):
+    """Returns the sequences, missing accessions and number of retries."""
     ret = {}
     if not accs:
-        return ret
+        return ret, set(), 0
 
-    response = _send_seq_request(accs)
+    response, num_retries = _send_seq_request(accs, url=url)
     for seq in SeqIO.parse(io.StringIO(response), "fasta"):
         acc = seq.name.split("|")[-1]
         ret[acc] = str(seq.seq)
 
     missing_accs = set(acc for acc in accs if acc not in ret)
-    return ret, missing_accs
+    return ret, missing_accs, num_retries
+
+
+def _parse_fasta_accession(header):
+    # UniProt FASTA headers look like ">sp|P12345|NAME_HUMAN Description", but
+    # we also support headers that start with a bare accession.
+    identifier = header.split(None, 1)[0]
+    splits = identifier.split(b"|")
+    if len(splits) >= 2:
+        return splits[1].decode("utf-8")
+    return identifier.decode("utf-8")
+
+
+def _read_sequences_from_fasta(fasta_file, accs):
+    """Returns a map from accession to sequence for the accs in a FASTA file.
+
+    The file is read in a single streaming pass. Files ending in .gz are
+    decompressed on the fly.
+    """
+    if fasta_file.endswith(".gz"):
+        f = gzip_stream.open_gzip(fasta_file)
+    else:
+        f = tf.io.gfile.GFile(fasta_file, "rb")
+    acc_to_seq = {}
+    with f:
+        for header, sequence in fasta.iter_fasta_records(f):
+            acc = _parse_fasta_accession(header)
+            if acc in accs:
+                acc_to_seq[acc] = sequence.decode("utf-8")
+    return acc_to_seq
+
+
+def _read_sequences_from_uniref50(data_dir, accs):
+    """Returns a map from accession to sequence for the accs in UniRef50.
+
+    Only the representative members of the clusters are included.
+    """
+    ds = uniref.UniRef50(data_dir=data_dir).as_dataset(split="train")
+    ds = ds.map(
+        lambda x: (x["unique_identifier"], x["aa_sequence"]),
+        num_parallel_calls=tf.data.experimental.AUTOTUNE,
+    )
+    ds = ds.prefetch(tf.data.experimental.AUTOTUNE)
+    acc_to_seq = {}
+    for identifier, sequence in ds.as_numpy_iterator():
+        acc = uniref.UniRef50.extract_uniprot_acc(identifier).decode("utf-8")
+        if acc in accs:
+            acc_to_seq[acc] = sequence.decode("utf-8")
+    return acc_to_seq
+
+
+class _SequenceFetcher(object):
+    """Retrieves batches of sequences from UniProt in a pool of threads.
+
+    The batch size adapts to how the service is doing: it grows while batches
+    come back quickly without retries and shrinks otherwise.
+    """
+
+    def __init__(
+        self,
+        url,
+        max_in_flight,
+        initial_batch_size,
+        max_batch_size,
+        min_batch_size=500,
+        target_latency_seconds=30.0,
+        metrics=None,
+    ):
+        self.url = url
+        self.max_in_flight = max_in_flight
+        self.batch_size = initial_batch_size
+        self.max_batch_size = max_batch_size
+        self.min_batch_size = min_batch_size
+        self.target_latency_seconds = target_latency_seconds
+        self.metrics = metrics or build_metrics.BuildMetrics()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_in_flight)
+        self._in_flight = set()
+
+    def _fetch(self, accs):
+        start_time = time.time()
+        seqs, missing, num_retries = _retrieve_sequences_from_remote(accs, url=self.url)
+        return seqs, missing, time.time() - start_time, num_retries
+
+    def _adapt_batch_size(self, num_accs, latency, num_retries):
+        if num_retries or latency > self.target_latency_seconds:
+            self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+        elif num_accs >= self.batch_size and latency < self.target_latency_seconds / 2:
+            self.batch_size = min(self.max_batch_size, 2 * self.batch_size)
+
+    @property
+    def is_full(self):
+        return len(self._in_flight) >= self.max_in_flight
+
+    @property
+    def num_in_flight(self):
+        return len(self._in_flight)
+
+    def submit(self, accs):
+        future = self._executor.submit(self._fetch, accs)
+        future.num_accs = len(accs)
+        self._in_flight.add(future)
+
+    def completed(self, block=False):
+        """Returns the (seqs, missing) of the batches that have completed.
+
+        If block is True, waits for at least one batch to complete if any are
+        in flight.
+        """
+        if block and self._in_flight:
+            done, _ = concurrent.futures.wait(
+                self._in_flight, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+        else:
+            done = [future for future in self._in_flight if future.done()]
+
+        results = []
+        for future in done:
+            self._in_flight.remove(future)
+            seqs, missing, latency, num_retries = future.result()
+            self.metrics.observe("fetch", "request", latency)
+            self.metrics.count("fetch", "requested", future.num_accs)
+            self.metrics.count("fetch", "retries", num_retries)
+            self.metrics.drop("fetch", "missing_sequence", len(missing))
+            self.metrics.log(
+                f"Retrieved a batch of {future.num_accs} sequences in "
+                f"{latency:.1f} s with {num_retries} retries."
+            )
+            self._adapt_batch_size(future.num_accs, latency, num_retries)
+            results.append((seqs, missing))
+        return results
+
+    def close(self):
+        self._executor.shutdown(wait=True)
 
 
 _VERSION = tfds.core.Version("1.0.0")
 
 
 class MhcBindingAffinityConfig(tfds.core.BuilderConfig):
-    def __init__(self, *, include_sequences=False, **kwargs):
+    def __init__(
+        self,
+        *,
+        include_sequences=False,
+        normalized=False,
+        encode_sequences=False,
+        **kwargs,
+    ):
         super().__init__(description=_DESCRIPTION, version=_VERSION, **kwargs)
+        if encode_sequences and (normalized or not include_sequences):
+            raise ValueError(
+                "Only denormalized configs with sequences can encode them."
+            )
         self.include_sequences = include_sequences
+        # If True, the interactions only store integer ids of the proteins.
+        # The accessions and sequences of the proteins are stored once in a
+        # separate protein table and attached to the interactions when reading.
+        self.normalized = normalized
+        # If True, the sequences are also stored as amino_acids tokens.
+        self.encode_sequences = encode_sequences
 
 
 class Hippie(tfds.core.GeneratorBasedBuilder):
@@ -102,15 +270,106 @@ class Hippie(tfds.core.GeneratorBasedBuilder):
 
     UNSTABLE = "Looks like the we can't get a fixed link to the version that is current at download time."
 
+    # The features of the edges for graph.CsrGraph.
+    GRAPH_EDGE_KEYS = ("protein_a_identifier", "protein_b_identifier")
+    GRAPH_WEIGHT_KEY = "confidence"
+
     BUILDER_CONFIGS = [
         MhcBindingAffinityConfig(name="no_seq", include_sequences=False),
         MhcBindingAffinityConfig(name="with_seq", include_sequences=True),
+        MhcBindingAffinityConfig(
+            name="normalized", include_sequences=True, normalized=True
+        ),
+        MhcBindingAffinityConfig(
+            name="with_seq_encoded", include_sequences=True, encode_sequences=True
+        ),
     ]
 
-    def __init__(self, data_dir=DEFAULT_TFDS_DATA_DIR, **kwargs):
+    def __init__(
+        self,
+        data_dir=DEFAULT_TFDS_DATA_DIR,
+        sequence_cache_path=DEFAULT_SEQUENCE_CACHE_PATH,
+        sequence_cache_ttl_seconds=None,
+        uniprot_url=_UNIPROT_URL,
+        max_in_flight_requests=4,
+        initial_request_batch_size=2000,
+        max_request_batch_size=40000,
+        sequence_source="remote",
+        sequence_fasta_file=None,
+        metrics=None,
+        **kwargs,
+    ):
+        """Creates the builder.
+
+        Args:
+            data_dir: the tfds data directory.
+            sequence_cache_path: the path to a seq_cache.SequenceCache of
+                sequences retrieved from UniProt. It is checked before sending
+                any requests, so rebuilding the "with_seq" config only fetches
+                accessions that have not been seen before. Set to None to not
+                use a persistent cache.
+            sequence_cache_ttl_seconds: entries in the sequence cache older
+                than this are fetched again. They never expire if None.
+            uniprot_url: the URL of the UniProt service to retrieve sequences
+                from.
+            max_in_flight_requests: the maximum number of requests to UniProt
+                that we make concurrently. The MITAB file keeps being parsed
+                while they are in flight.
+            initial_request_batch_size: the number of accessions in the first
+                request. The batch size then adapts to the latency of the
+                requests.
+            max_request_batch_size: the maximum number of accessions in a
+                single request.
+            sequence_source: where the "with_seq" config gets its sequences
+                from. With "remote", they are retrieved from UniProt. With
+                "fasta", they are read from the local `sequence_fasta_file`,
+                for example a UniProt sprot or trembl dump. With "uniref50",
+                they are read from the prepared uniref.UniRef50 dataset in
+                data_dir, which only has the representative members of its
+                clusters. The local sources need no network access.
+            sequence_fasta_file: the FASTA file to use with the "fasta"
+                sequence_source. It can be gzipped.
+            metrics: the build_metrics.BuildMetrics to report the progress of
+                generating examples to. Creates one if None.
+        """
         super().__init__(data_dir=data_dir, **kwargs)
+        self.sequence_cache_path = sequence_cache_path
+        self.sequence_cache_ttl_seconds = sequence_cache_ttl_seconds
+        self.uniprot_url = uniprot_url
+        self.max_in_flight_requests = max_in_flight_requests
+        self.initial_request_batch_size = initial_request_batch_size
+        self.max_request_batch_size = max_request_batch_size
+        if sequence_source not in ("remote", "fasta", "uniref50"):
+            raise ValueError(f"Unknown sequence_source: {sequence_source}")
+        if sequence_source == "fasta" and not sequence_fasta_file:
+            raise ValueError('A sequence_fasta_file is needed for "fasta".')
+        self._source_data_dir = data_dir
+        self.sequence_source = sequence_source
+        self.sequence_fasta_file = sequence_fasta_file
+        self.metrics = build_metrics.for_builder(self, metrics)
 
     def _info(self):
+        if self.builder_config.normalized:
+            features = {
+                # The ids of the proteins involved in the interaction. These
+                # index into the protein table. The accessions and sequences of
+                # the proteins are attached when reading the dataset.
+                "protein_a_id": tf.int32,
+                "protein_b_id": tf.int32,
+                # Confidence score of the interaction.
+                "confidence": tf.float32,
+            }
+        else:
+            features = self._denormalized_features()
+        return tfds.core.DatasetInfo(
+            builder=self,
+            description=self.builder_config.description,
+            features=tfds.features.FeaturesDict(features),
+            homepage="http://cbdm-01.zdv.uni-mainz.de/~mschaefer/hippie/index.php",
+            citation=_CITATION,
+        )
+
+    def _denormalized_features(self):
         features = {
             # The UniprotKb accessions of the proteins involved in the interaction.
             "protein_a_identifier": tfds.features.Text(),
@@ -126,13 +385,21 @@ class Hippie(tfds.core.GeneratorBasedBuilder):
                     "protein_b_sequence": tfds.features.Text(),
                 }
             )
-        return tfds.core.DatasetInfo(
-            builder=self,
-            description=self.builder_config.description,
-            features=tfds.features.FeaturesDict(features),
-            homepage="http://cbdm-01.zdv.uni-mainz.de/~mschaefer/hippie/index.php",
-            citation=_CITATION,
-        )
+        if self.builder_config.encode_sequences:
+            features.update(
+                {
+                    # The sequences as amino_acids tokens and their lengths.
+                    "protein_a_tokens": tfds.features.Tensor(
+                        shape=(None,), dtype=tf.uint8
+                    ),
+                    "protein_a_length": tf.int32,
+                    "protein_b_tokens": tfds.features.Tensor(
+                        shape=(None,), dtype=tf.uint8
+                    ),
+                    "protein_b_length": tf.int32,
+                }
+            )
+        return features
 
     def _split_generators(self, dl_manager):
         extracted_path = dl_manager.download_and_extract(_DOWNLOAD_URL)
@@ -146,82 +413,259 @@ class Hippie(tfds.core.GeneratorBasedBuilder):
         ]
 
     def _generate_examples(self, mitab_file):
-        if self.builder_config.include_sequences:
-            yield from self._generate_examples_with_seq(mitab_file)
+        yield from self.metrics.track(
+            self._iter_examples(mitab_file), build_metrics.default_output_path(self)
+        )
+
+    def _iter_examples(self, mitab_file):
+        if self.builder_config.normalized:
+            yield from self._generate_examples_normalized(mitab_file)
         else:
-            yield from self._generate_examples_no_seq(mitab_file)
+            yield from self._generate_examples_denormalized(mitab_file)
+
+    def _generate_examples_denormalized(self, mitab_file):
+        if not self.builder_config.include_sequences:
+            examples = self._generate_examples_no_seq(mitab_file)
+        elif self.sequence_source == "remote":
+            examples = self._generate_examples_with_seq(mitab_file)
+        else:
+            examples = self._generate_examples_with_local_seq(mitab_file)
+        for key, example in examples:
+            if self.builder_config.encode_sequences:
+                for name in ["protein_a", "protein_b"]:
+                    tokens = amino_acids.encode(example[f"{name}_sequence"])
+                    example[f"{name}_tokens"] = tokens
+                    example[f"{name}_length"] = len(tokens)
+            yield key, example
+
+    def _generate_examples_normalized(self, mitab_file):
+        # The ids are the positions of the accessions in sorted order, so they
+        # do not depend on the order in which sequences are retrieved.
+        accs = set()
+        for _, example in self._iter_interactions(mitab_file, stage="collect_accs"):
+            accs.add(example["protein_a_identifier"])
+            accs.add(example["protein_b_identifier"])
+        acc_to_id = {acc: i for i, acc in enumerate(sorted(accs))}
+
+        acc_to_seq = {}
+        for index, example in self._generate_examples_denormalized(mitab_file):
+            a_acc = example["protein_a_identifier"]
+            b_acc = example["protein_b_identifier"]
+            acc_to_seq[a_acc] = example["protein_a_sequence"]
+            acc_to_seq[b_acc] = example["protein_b_sequence"]
+            yield index, {
+                "protein_a_id": acc_to_id[a_acc],
+                "protein_b_id": acc_to_id[b_acc],
+                "confidence": example["confidence"],
+            }
+
+        table_file = os.path.join(self.data_dir, _PROTEIN_TABLE_FILENAME)
+        with tf.io.gfile.GFile(table_file, "w") as f:
+            for acc in sorted(acc_to_seq):
+                f.write(f"{acc_to_id[acc]}\t{acc}\t{acc_to_seq[acc]}\n")
+
+    def _read_protein_table(self):
+        """Returns lists of the accessions and sequences indexed by id."""
+        rows = []
+        table_file = os.path.join(self.data_dir, _PROTEIN_TABLE_FILENAME)
+        with tf.io.gfile.GFile(table_file) as f:
+            for line in f:
+                protein_id, acc, sequence = line.rstrip("\n").split("\t")
+                rows.append((int(protein_id), acc, sequence))
+        num_ids = max((row[0] for row in rows), default=-1) + 1
+        accs = [""] * num_ids
+        sequences = [""] * num_ids
+        for protein_id, acc, sequence in rows:
+            accs[protein_id] = acc
+            sequences[protein_id] = sequence
+        return accs, sequences
+
+    def _as_dataset(self, *args, **kwargs):
+        ds = super()._as_dataset(*args, **kwargs)
+        if not self.builder_config.normalized:
+            return ds
+
+        accs, sequences = self._read_protein_table()
+        accs = tf.constant(accs, dtype=tf.string)
+        sequences = tf.constant(sequences, dtype=tf.string)
+
+        def attach_proteins(x):
+            x["protein_a_identifier"] = tf.gather(accs, x["protein_a_id"])
+            x["protein_b_identifier"] = tf.gather(accs, x["protein_b_id"])
+            x["protein_a_sequence"] = tf.gather(sequences, x["protein_a_id"])
+            x["protein_b_sequence"] = tf.gather(sequences, x["protein_b_id"])
+            return x
+
+        return ds.map(attach_proteins, num_parallel_calls=tf.data.experimental.AUTOTUNE)
 
     def _generate_examples_no_seq(self, mitab_file):
         with tf.io.gfile.GFile(mitab_file) as f:
             reader = csv.DictReader(f, delimiter="\t")
             for index, row in enumerate(reader):
                 example = _extract_example(row)
+                self.metrics.count("parse", "records")
                 yield index, example
 
-    def _generate_examples_with_seq(self, mitab_file):
-        max_to_fetch = 40000
-        seq_cache = {}
-        example_queue = []
-        accs_to_fetch = set()
-        missing_accs = set()
-
-        def add_seqs_to_example(example):
-            a_acc, b_acc = (
-                example["protein_a_identifier"],
-                example["protein_b_identifier"],
-            )
-            example["protein_a_sequence"] = seq_cache.get(a_acc, None)
-            example["protein_b_sequence"] = seq_cache.get(b_acc, None)
-            return example
-
-        def flush_caches():
-            nonlocal example_queue, accs_to_fetch
-            print("Retrieving sequences")
-            seqs, missing = _retrieve_sequences_from_remote(accs_to_fetch)
-            seq_cache.update(seqs)
-            missing_accs.update(missing)
-            print("Done retrieving sequences")
-            for index, example in example_queue:
-                example = add_seqs_to_example(example)
-                if (
-                    not example["protein_a_sequence"]
-                    or not example["protein_b_sequence"]
-                ):
-                    continue
-                yield index, example
-            example_queue = []
-            accs_to_fetch = set()
-
-        def process_example(index, example):
-            a_acc, b_acc = (
-                example["protein_a_identifier"],
-                example["protein_b_identifier"],
-            )
-
-            if a_acc not in seq_cache:
-                if a_acc not in missing_accs:
-                    accs_to_fetch.add(a_acc)
-            if b_acc not in seq_cache:
-                if b_acc not in missing_accs:
-                    accs_to_fetch.add(b_acc)
-
-            if a_acc in seq_cache and b_acc in seq_cache:
-                yield index, add_seqs_to_example(example)
-            else:
-                example_queue.append((index, example))
-
-            if len(accs_to_fetch) >= max_to_fetch:
-                yield from flush_caches()
-
+    def _iter_interactions(self, mitab_file, stage="parse"):
+        # Yields the interactions where we know the accessions of both proteins.
+        # The stage is the one to report to, which keeps the counts of the
+        # passes that only collect the accessions separate.
         with tf.io.gfile.GFile(mitab_file) as f:
             reader = csv.DictReader(f, delimiter="\t")
             for index, row in enumerate(reader):
                 example = _extract_example(row)
+                self.metrics.count(stage, "records")
                 if (
                     not example["protein_a_identifier"]
                     or not example["protein_b_identifier"]
                 ):
+                    self.metrics.drop(stage, "no_uniprot_accession")
                     continue
-                yield from process_example(index, example)
+                yield index, example
+
+    def _generate_examples_with_local_seq(self, mitab_file):
+        accs = set()
+        for _, example in self._iter_interactions(mitab_file, stage="collect_accs"):
+            accs.add(example["protein_a_identifier"])
+            accs.add(example["protein_b_identifier"])
 
-        yield from flush_caches()
+        with self.metrics.timed("read_sequences"):
+            if self.sequence_source == "fasta":
+                acc_to_seq = _read_sequences_from_fasta(self.sequence_fasta_file, accs)
+            else:
+                acc_to_seq = _read_sequences_from_uniref50(self._source_data_dir, accs)
+        self.metrics.count("read_sequences", "found", len(acc_to_seq))
+        self.metrics.drop(
+            "read_sequences", "missing_sequence", len(accs) - len(acc_to_seq)
+        )
+        self.metrics.log(
+            f"Found sequences for {len(acc_to_seq)} of {len(accs)} accessions."
+        )
+
+        for index, example in self._iter_interactions(mitab_file):
+            a_seq = acc_to_seq.get(example["protein_a_identifier"], None)
+            b_seq = acc_to_seq.get(example["protein_b_identifier"], None)
+            if not a_seq or not b_seq:
+                self.metrics.drop("join", "missing_sequence")
+                continue
+            example["protein_a_sequence"] = a_seq
+            example["protein_b_sequence"] = b_seq
+            yield index, example
+
+    def _open_sequence_cache(self):
+        if self.sequence_cache_path is None:
+            return None
+        return seq_cache.SequenceCache(
+            self.sequence_cache_path, ttl_seconds=self.sequence_cache_ttl_seconds
+        )
+
+    def _generate_examples_with_seq(self, mitab_file):
+        persistent_cache = self._open_sequence_cache()
+        fetcher = _SequenceFetcher(
+            url=self.uniprot_url,
+            max_in_flight=self.max_in_flight_requests,
+            initial_batch_size=self.initial_request_batch_size,
+            max_batch_size=self.max_request_batch_size,
+            metrics=self.metrics,
+        )
+        try:
+            yield from self._generate_examples_with_seq_fetcher(
+                mitab_file, persistent_cache, fetcher
+            )
+        finally:
+            fetcher.close()
+            if persistent_cache is not None:
+                persistent_cache.close()
+
+    def _generate_examples_with_seq_fetcher(
+        self, mitab_file, persistent_cache, fetcher
+    ):
+        acc_to_seq = {}
+        missing_accs = set()
+        # The examples waiting on sequences, keyed by index. The values are the
+        # example and the number of its accessions we are still waiting on.
+        waiting = {}
+        # Map from each accession we are waiting on to the indices of the
+        # examples waiting on it.
+        acc_to_waiting = collections.defaultdict(list)
+        # Accessions we are waiting on that have not been requested yet.
+        accs_to_fetch = []
+
+        def add_seqs_to_example(example):
+            example["protein_a_sequence"] = acc_to_seq.get(
+                example["protein_a_identifier"], None
+            )
+            example["protein_b_sequence"] = acc_to_seq.get(
+                example["protein_b_identifier"], None
+            )
+            if not example["protein_a_sequence"] or not example["protein_b_sequence"]:
+                self.metrics.drop("join", "missing_sequence")
+                return None
+            return example
+
+        def resolve(seqs, missing):
+            acc_to_seq.update(seqs)
+            missing_accs.update(missing)
+            for acc in list(seqs) + list(missing):
+                for index in acc_to_waiting.pop(acc, []):
+                    entry = waiting[index]
+                    entry[1] -= 1
+                    if entry[1]:
+                        continue
+                    del waiting[index]
+                    example = add_seqs_to_example(entry[0])
+                    if example:
+                        yield index, example
+
+        def handle_completed(results):
+            for seqs, missing in results:
+                if persistent_cache is not None:
+                    persistent_cache.put_many(seqs, missing)
+                yield from resolve(seqs, missing)
+
+        def fetch():
+            nonlocal accs_to_fetch
+            accs, accs_to_fetch = accs_to_fetch, []
+            if persistent_cache is not None:
+                seqs, missing = persistent_cache.get_many(accs)
+                num_hits = len(seqs) + len(missing)
+                self.metrics.count("sequence_cache", "hits", num_hits)
+                self.metrics.count("sequence_cache", "misses", len(accs) - num_hits)
+                yield from resolve(seqs, missing)
+                accs = [acc for acc in accs if acc in acc_to_waiting]
+            if not accs:
+                return
+            if fetcher.is_full:
+                yield from handle_completed(fetcher.completed(block=True))
+            fetcher.submit(accs)
+
+        for index, example in self._iter_interactions(mitab_file):
+            unresolved = set(
+                acc
+                for acc in (
+                    example["protein_a_identifier"],
+                    example["protein_b_identifier"],
+                )
+                if acc not in acc_to_seq and acc not in missing_accs
+            )
+            if not unresolved:
+                example = add_seqs_to_example(example)
+                if example:
+                    yield index, example
+                continue
+
+            waiting[index] = [example, len(unresolved)]
+            for acc in unresolved:
+                if acc not in acc_to_waiting:
+                    accs_to_fetch.append(acc)
+                acc_to_waiting[acc].append(index)
+
+            if len(accs_to_fetch) >= fetcher.batch_size:
+                yield from fetch()
+            # Emit the examples whose sequences have arrived without waiting
+            # on the requests still in flight.
+            yield from handle_completed(fetcher.completed())
+
+        yield from fetch()
+        while fetcher.num_in_flight:
+            yield from handle_completed(fetcher.completed(block=True))
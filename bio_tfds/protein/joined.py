@@ -1,13 +1,123 @@
 """Protein datasets that come from joining other datasets here."""
 import collections
+import itertools
+import os
+import shutil
+import tempfile
 
+import numpy as np
 import tensorflow as tf
 import tensorflow_datasets.public_api as tfds
 
+from bio_tfds import build_metrics
+from bio_tfds import checkpoint
+from bio_tfds import delta
+from bio_tfds import parallel
+from bio_tfds import spill
 from bio_tfds.constants import DEFAULT_TFDS_DATA_DIR
 from bio_tfds.protein import pfam
+from bio_tfds.protein import pfam_index
+from bio_tfds.protein import record_index
 from bio_tfds.protein import uniref
 
+# A rough estimate of how many bytes of memory a region takes up once loaded
+# into Python objects per byte of its spill file.
+_MEMORY_PER_SPILL_BYTE = 8
+
+# With a checkpoint_dir and the "memory" join_mode, the examples joined from
+# this many UniRef50 examples are committed at a time.
+_CHECKPOINT_INTERVAL = 1000000
+
+
+def _empty_regions():
+    return {"pfam_acc": [], "start": [], "end": []}
+
+
+def _regions_hash(regions):
+    return pfam_index.regions_hash(
+        regions["pfam_acc"], regions["start"], regions["end"]
+    )
+
+
+def _uniprot_accs(keys):
+    """Returns the UniProt accessions of a bytes array of UniRef50 keys.
+
+    This is uniref.UniRef50.extract_uniprot_acc on the whole array at once.
+    """
+    keys = np.ascontiguousarray(np.asarray(keys, dtype=bytes))
+    prefix_size = len("UniRef50_")
+    width = keys.dtype.itemsize
+    if width <= prefix_size:
+        return np.zeros(keys.shape, dtype="S1")
+    chars = keys.view(np.uint8).reshape(len(keys), width)
+    accs = np.ascontiguousarray(chars[:, prefix_size:])
+    return accs.view(f"S{width - prefix_size}").reshape(len(keys))
+
+
+def _size_or_none(path):
+    return os.path.getsize(path) if os.path.exists(path) else None
+
+
+def _split_spill_file(path, key_fn, num_partitions, num_splits):
+    """Splits the spill file of a partition into num_splits spill files.
+
+    The keys of partition i are those with spill.partition_of(key,
+    num_partitions) == i, so spill.partition_of(key, num_partitions *
+    num_splits) // num_partitions spreads them over [0, num_splits). Splitting
+    the regions and UniRef50 files of a partition this way keeps the records
+    of each accession in matching files.
+
+    Returns:
+        The paths of the new spill files, which are next to the original.
+    """
+    writers = [
+        spill.SpillWriter(f"{path}-{i:03d}-of-{num_splits:03d}")
+        for i in range(num_splits)
+    ]
+    for record in spill.iter_spill(path):
+        partition = spill.partition_of(key_fn(record), num_partitions * num_splits)
+        writers[partition // num_partitions].write(record)
+    for writer in writers:
+        writer.close()
+    return [writer.path for writer in writers]
+
+
+def _join_partitions(region_files, uniref_files, output_file):
+    """Joins some partitions of the Pfam regions and UniRef50 examples.
+
+    The joined examples are written to the output_file spill file, whose
+    path is returned.
+    """
+    acc_to_regions = collections.defaultdict(_empty_regions)
+    for region_file in region_files:
+        for acc, pfam_acc, start, end in spill.iter_spill(region_file):
+            regions = acc_to_regions[acc]
+            regions["pfam_acc"].append(pfam_acc)
+            regions["start"].append(start)
+            regions["end"].append(end)
+
+    with spill.SpillWriter(output_file) as writer:
+        for uniref_file in uniref_files:
+            for x in spill.iter_spill(uniref_file):
+                acc = uniref.UniRef50.extract_uniprot_acc(x["unique_identifier"])
+                x["pfam_regions"] = acc_to_regions.get(acc, None) or _empty_regions()
+                writer.write(x)
+    return output_file
+
+
+# Version 1.1.0 stores the "aa_length" of the sequences in every config.
+_VERSION = tfds.core.Version("1.1.0")
+
+
+class UniRef50WithPfamRegionsConfig(tfds.core.BuilderConfig):
+    def __init__(self, *, encode_sequences=False, pack_sequences=False, **kwargs):
+        super().__init__(version=_VERSION, **kwargs)
+        # If True, the sequences are also stored as amino_acids tokens.
+        self.encode_sequences = encode_sequences
+        # If True, the sequences are only stored as packed amino_acids tokens.
+        # See uniref.UniRef50Config.
+        self.pack_sequences = pack_sequences
+
 
 class UniRef50WithPfamRegions(tfds.core.GeneratorBasedBuilder):
     """UniRef50 sequences with Pfam regions annotated.
@@ -16,54 +126,143 @@ class UniRef50WithPfamRegions(tfds.core.GeneratorBasedBuilder):
     building this dataset.
     """
 
-    VERSION = tfds.core.Version("1.0.0")
+    VERSION = _VERSION
 
     UNSTABLE = "The current_release is updated every 8 weeks."
 
+    BUILDER_CONFIGS = [
+        UniRef50WithPfamRegionsConfig(
+            name="default", description="The sequences as text."
+        ),
+        UniRef50WithPfamRegionsConfig(
+            name="encoded",
+            description="The sequences as text and as amino acid tokens.",
+            encode_sequences=True,
+        ),
+        UniRef50WithPfamRegionsConfig(
+            name="packed",
+            description="The sequences as amino acid tokens packed at 5 bits per token.",
+            pack_sequences=True,
+        ),
+    ]
+
+    def __init__(
+        self,
+        data_dir=DEFAULT_TFDS_DATA_DIR,
+        join_mode="memory",
+        num_workers=1,
+        num_partitions=256,
+        memory_budget_bytes=4 * 1024 ** 3,
+        spill_dir=None,
+        metrics=None,
+        checkpoint_dir=None,
+        previous_data_dir=None,
+        **kwargs,
+    ):
+        """Creates the builder.
+
+        Args:
+            data_dir: the tfds data directory. The UniRef50 and Pfam datasets
+                are read from here too.
+            join_mode: how to join the datasets when generating examples. With
+                "memory", we look up the regions of each UniRef50 accession in
+                a pfam_index.PfamRegionIndex, which is built and saved next to
+                the Pfam dataset the first time. With "partitioned", both datasets are
+                hash-partitioned by accession into spill files on disk, and
+                the partitions are then joined in worker processes. This keeps
+                the peak memory bounded.
+            num_workers: the number of processes used to join partitions.
+            num_partitions: the number of partitions to hash accessions into.
+                Several partitions are joined together in a single task as
+                long as they fit in the memory budget. A partition that does
+                not fit on its own is split further.
+            memory_budget_bytes: the approximate amount of memory each worker
+                may use to hold the regions of the partitions it is joining.
+            spill_dir: the directory to create temporary spill files in. Uses
+                the default temporary directory if None.
+            metrics: the build_metrics.BuildMetrics to report the progress of
+                generating examples to. Creates one if None.
+            checkpoint_dir: if set, the joined examples are committed to a
+                checkpoint.Checkpoint in a subdirectory of this local
+                directory, so that an interrupted build resumes from the last
+                commit. With the "memory" join_mode, a commit is made every
+                _CHECKPOINT_INTERVAL UniRef50 examples. With "partitioned",
+                the spill files are kept in the checkpoint directory instead
+                of spill_dir and a commit is made after every join task. The
+                checkpoint is removed once the dataset is prepared.
+            previous_data_dir: if set, do a delta build against the dataset
+                of the same version and config prepared in this tfds data
+                directory by a previous release, which must be a different
+                directory than data_dir. An example is rejoined if its
+                UniRef50 record or its Pfam regions changed, and the others
+                are read back from the previous shards. The changes are
+                written to <split>-changelog.json. This needs the content
+                hashes saved by builds of both this dataset and UniRef50, and
+                always looks up the regions in a pfam_index.PfamRegionIndex.
+                The hashes of the regions of every accession are saved with the
+                index the first time, so later delta builds don't hash them.
+        """
+        super().__init__(data_dir=data_dir, **kwargs)
+        if join_mode not in ("memory", "partitioned"):
+            raise ValueError(f"Unknown join_mode: {join_mode}")
+        if previous_data_dir and checkpoint_dir:
+            raise ValueError("A previous_data_dir can't be used with a checkpoint_dir.")
+        self._source_data_dir = data_dir
+        self.join_mode = join_mode
+        self.num_workers = num_workers
+        self.num_partitions = num_partitions
+        self.memory_budget_bytes = memory_budget_bytes
+        self.spill_dir = spill_dir
+        self.metrics = build_metrics.for_builder(self, metrics)
+        self.checkpoint_dir = checkpoint_dir
+        self.previous_data_dir = previous_data_dir
+        # What the last generation of each split found, to save with the
+        # prepared dataset.
+        self._record_hashes = {}
+        self._changes = {}
+
     def _info(self):
-        return tfds.core.DatasetInfo(
-            builder=self,
-            description="The uniref.UniRef50 dataset with regions from pfam.PfamARegionsUniprot attached.",
-            features=tfds.features.FeaturesDict(
+        features = {
+            # The primary accession number of the UniRef cluster.
+            # The UniRef50 identifier is generated by placing
+            # "UniRef50_" prefix before the UniProtKB accession number
+            # or UniParc identifier of the representative UniProtKB or UniParc entry.
+            "unique_identifier": tfds.features.Text(),
+            # The name of the UniRef cluster.
+            "cluster_name": tfds.features.Text(),
+            # The number of UniRef cluster members.
+            "num_members": tf.int32,
+            # The scientific name of the lowest common taxon shared by all
+            # UniRef cluster members.
+            "tax_name": tfds.features.Text(),
+            # Thee id of the lowest common taxon shared by all
+            # UniRef cluster members.
+            "tax_id": tfds.features.Text(),
+            # The entry name of the representative member of the
+            # UniRef cluster.
+            "representative_member": tfds.features.Text(),
+            # The information from Pfam. A list of all features present on
+            # the representative member.
+            "pfam_regions": tfds.features.Sequence(
                 {
-                    # The primary accession number of the UniRef cluster.
-                    # The UniRef50 identifier is generated by placing
-                    # "UniRef50_" prefix before the UniProtKB accession number
-                    # or UniParc identifier of the representative UniProtKB or UniParc entry.
-                    "unique_identifier": tfds.features.Text(),
-                    # The name of the UniRef cluster.
-                    "cluster_name": tfds.features.Text(),
-                    # The number of UniRef cluster members.
-                    "num_members": tf.int32,
-                    # The scientific name of the lowest common taxon shared by all
-                    # UniRef cluster members.
-                    "tax_name": tfds.features.Text(),
-                    # Thee id of the lowest common taxon shared by all
-                    # UniRef cluster members.
-                    "tax_id": tfds.features.Text(),
-                    # The entry name of the representative member of the
-                    # UniRef cluster.
-                    "representative_member": tfds.features.Text(),
-                    # The uppercase AA sequence of the protein.
-                    "aa_sequence": tfds.features.Text(),
-                    # The information from Pfam. A list of all features present on
-                    # the representative member.
-                    "pfam_regions": tfds.features.Sequence(
-                        {
-                            # The accession number of the PfamA entry.
-                            "pfam_acc": tfds.features.Text(),
-                            # The 0-BASED, INCLUSIVE start index of the region in the
-                            # protein's AA sequence. Note that this is different than
-                            # in the raw data, which is 1-based and inclusive.
-                            "start": tf.int32,
-                            # The 0-BASED, EXCLUSIVE end index of the region in the
-                            # protein's AA sequence. The raw data is 1-based and
-                            # inclusive, which works out to be the same.
-                            "end": tf.int32,
-                        }
-                    ),
+                    # The accession number of the PfamA entry.
+                    "pfam_acc": tfds.features.Text(),
+                    # The 0-BASED, INCLUSIVE start index of the region in the
+                    # protein's AA sequence. Note that this is different than
+                    # in the raw data, which is 1-based and inclusive.
+                    "start": tf.int32,
+                    # The 0-BASED, EXCLUSIVE end index of the region in the
+                    # protein's AA sequence. The raw data is 1-based and
+                    # inclusive, which works out to be the same.
+                    "end": tf.int32,
                 }
             ),
+        }
+        features.update(uniref.sequence_features(self.builder_config))
+        return tfds.core.DatasetInfo(
+            builder=self,
+            description="The uniref.UniRef50 dataset with regions from pfam.PfamARegionsUniprot attached.",
+            features=tfds.features.FeaturesDict(features),
             homepage="",
             citation=f"{pfam._CITATION}\n{uniref._CITATION}",
         )
@@ -76,48 +275,375 @@ class UniRef50WithPfamRegions(tfds.core.GeneratorBasedBuilder):
             ),
         ]
 
-    def _get_uniref50_acc_set(self, split):
-        ds = uniref.UniRef50().as_dataset(split=split)
+    def _generate_examples(self, split):
+        yield from self.metrics.track(
+            self._iter_examples(split), build_metrics.default_output_path(self)
+        )
+
+    def _iter_examples(self, split):
+        if self.previous_data_dir:
+            yield from self._generate_examples_delta(split)
+            return
+        regions_hashes = delta.RecordHashesBuilder()
+        for key, x in self._iter_all_examples(split):
+            regions_hashes.add(key, _regions_hash(x["pfam_regions"]))
+            yield key, x
+        self._record_hashes[split] = self._record_hashes_of(
+            split, regions_hashes.build()
+        )
+
+    def _iter_all_examples(self, split):
+        if self.checkpoint_dir:
+            yield from self._generate_examples_checkpointed(split)
+            return
+        if self.join_mode == "partitioned":
+            examples = self._generate_examples_partitioned(split)
+        else:
+            examples = self._generate_examples_memory(split)
+        for key, x in examples:
+            yield key, uniref.add_sequence_features(x, self.builder_config)
+
+    def _as_dataset(self, *args, **kwargs):
+        ds = super()._as_dataset(*args, **kwargs)
+        if self.builder_config.pack_sequences:
+            ds = ds.map(
+                uniref.unpack_sequence,
+                num_parallel_calls=tf.data.experimental.AUTOTUNE,
+            )
+        return ds
+
+    def download_and_prepare(self, *args, **kwargs):
+        super().download_and_prepare(*args, **kwargs)
+        if self.checkpoint_dir:
+            for split in self.info.splits:
+                checkpoint.remove(self._checkpoint_directory(split))
+        for split, hashes in self._record_hashes.items():
+            if hashes is not None:
+                hashes.save(delta.hashes_directory(self.data_dir, split))
+        for split, changes in self._changes.items():
+            delta.write_changelog(delta.changelog_path(self.data_dir, split), changes)
+        self._record_hashes = {}
+        self._changes = {}
+
+    def _record_hashes_of(self, split, regions_hashes):
+        """Returns the hashes of the joined records given those of their regions.
+
+        The hash of a joined record combines the hash of its UniRef50 record
+        with that of its regions.
+        """
+        source = uniref.UniRef50(data_dir=self._source_data_dir)
+        source_hashes_dir = delta.hashes_directory(source.data_dir, split)
+        if not delta.RecordHashes.exists(source_hashes_dir):
+            self.metrics.log(
+                "The UniRef50 dataset has no record hashes, so this one won't either."
+            )
+            return None
+        keys = regions_hashes.keys
+        found, uniref_hashes = delta.RecordHashes.load(source_hashes_dir).lookup(keys)
+        if not found.all():
+            # Their hashes would be meaningless. Leaving them out makes the
+            # next delta build join them again as if they were added.
+            self.metrics.log(
+                f"Skipping the hashes of {int((~found).sum())} examples that are "
+                "not in the record hashes of UniRef50."
+            )
+            self.metrics.drop("hash", "not_in_uniref50_hashes", int((~found).sum()))
+        hashes = delta.combine(uniref_hashes[found], regions_hashes.hashes[found])
+        return delta.RecordHashes(keys[found], hashes)
+
+    def _generate_examples_delta(self, split):
+        previous = UniRef50WithPfamRegions(
+            data_dir=self.previous_data_dir, config=self.builder_config.name
+        )
+        source = uniref.UniRef50(data_dir=self._source_data_dir)
+        previous_hashes_dir = delta.hashes_directory(previous.data_dir, split)
+        source_hashes_dir = delta.hashes_directory(source.data_dir, split)
+        for directory in (previous_hashes_dir, source_hashes_dir):
+            if not delta.RecordHashes.exists(directory):
+                raise ValueError(
+                    f"There are no record hashes in {directory}. It must be "
+                    "prepared by a build that saves them."
+                )
+
+        with self.metrics.timed("load_index"):
+            index = pfam_index.PfamRegionIndex.build_or_load(
+                split=split, data_dir=self._source_data_dir, with_region_hashes=True
+            )
+        source_hashes = delta.RecordHashes.load(source_hashes_dir)
+        keys = np.asarray(source_hashes.keys)
+        with self.metrics.timed("hash"):
+            regions_hashes = index.lookup_region_hashes(_uniprot_accs(keys))
+        current = delta.RecordHashes(
+            keys, delta.combine(source_hashes.hashes, regions_hashes)
+        )
+        changes = delta.diff(delta.RecordHashes.load(previous_hashes_dir), current)
+
+        changed = delta.iter_records(
+            source.record_index(split),
+            source.data_dir,
+            source.info.features,
+            np.concatenate([changes.added, changes.modified]),
+        )
+        for key, x in changed:
+            x["pfam_regions"] = index.regions(uniref.UniRef50.extract_uniprot_acc(key))
+            self.metrics.count("delta", "joined")
+            yield key, uniref.add_sequence_features(x, self.builder_config)
+        unchanged = delta.iter_records(
+            previous.record_index(split),
+            previous.data_dir,
+            previous.info.features,
+            changes.unchanged,
+        )
+        for key, x in unchanged:
+            self.metrics.count("delta", "reused")
+            yield key, x
+
+        self._record_hashes[split] = current
+        self._changes[split] = changes
+        self.metrics.log(
+            f"{len(changes.added)} examples were added, {len(changes.removed)} "
+            f"removed and {len(changes.modified)} modified."
+        )
+
+    def record_index(self, split="train"):
+        """Returns the record_index.RecordIndex of a prepared split."""
+        return record_index.build_or_load_split(
+            self.data_dir, self.name, split, key_feature="unique_identifier"
+        )
+
+    def _generate_examples_memory(self, split, start=0):
+        with self.metrics.timed("load_index"):
+            index = pfam_index.PfamRegionIndex.build_or_load(
+                split=split, data_dir=self._source_data_dir
+            )
+        self.metrics.log("Loaded the index of Pfam regions.")
+
+        ds = uniref.UniRef50(data_dir=self._source_data_dir).as_dataset(split=split)
+        ds = ds.skip(start).prefetch(tf.data.experimental.AUTOTUNE)
+        for x in ds.as_numpy_iterator():
+            key = x["unique_identifier"]
+            x["pfam_regions"] = index.regions(uniref.UniRef50.extract_uniprot_acc(key))
+            if len(x["pfam_regions"]["start"]):
+                self.metrics.count("join", "with_regions")
+            else:
+                self.metrics.count("join", "without_regions")
+            yield key, x
+
+    def _spill_regions(self, split, spill_dir):
+        ds = pfam.PfamARegionsUniprot(data_dir=self._source_data_dir).as_dataset(
+            split=split
+        )
         ds = ds.map(
-            lambda x: x["unique_identifier"],
+            lambda x: (x["uniprot_acc"], x["pfam_acc"], x["start"], x["end"]),
             num_parallel_calls=tf.data.experimental.AUTOTUNE,
         )
         ds = ds.prefetch(tf.data.experimental.AUTOTUNE)
-        return set(
-            uniref.UniRef50.extract_uniprot_acc(s) for s in ds.as_numpy_iterator()
-        )
 
-    def _get_acc_to_regions(self, split, uniref50_acc_set):
-        ds = pfam.PfamARegionsUniprot().as_dataset(split=split)
-        ds = ds.prefetch(tf.data.experimental.AUTOTUNE)
+        writers = [
+            spill.SpillWriter(os.path.join(spill_dir, f"regions-{i:05d}"))
+            for i in range(self.num_partitions)
+        ]
+        for acc, pfam_acc, start, end in ds.as_numpy_iterator():
+            writer = writers[spill.partition_of(acc, self.num_partitions)]
+            writer.write((acc, pfam_acc, int(start), int(end)))
+        for writer in writers:
+            writer.close()
+            self.metrics.count("spill", "regions", writer.num_records)
+        return [writer.path for writer in writers]
 
-        default_value = lambda: {"pfam_acc": [], "start": [], "end": []}
+    def _spill_uniref50(self, split, spill_dir):
+        ds = uniref.UniRef50(data_dir=self._source_data_dir).as_dataset(split=split)
+        ds = ds.prefetch(tf.data.experimental.AUTOTUNE)
 
-        acc_to_regions = collections.defaultdict(default_value)
+        writers = [
+            spill.SpillWriter(os.path.join(spill_dir, f"uniref50-{i:05d}"))
+            for i in range(self.num_partitions)
+        ]
         for x in ds.as_numpy_iterator():
-            acc = x["uniprot_acc"]
-            if acc not in uniref50_acc_set:
+            acc = uniref.UniRef50.extract_uniprot_acc(x["unique_identifier"])
+            writers[spill.partition_of(acc, self.num_partitions)].write(x)
+        for writer in writers:
+            writer.close()
+            self.metrics.count("spill", "uniref50_records", writer.num_records)
+        return [writer.path for writer in writers]
+
+    def _estimated_memory(self, region_file):
+        return _MEMORY_PER_SPILL_BYTE * os.path.getsize(region_file)
+
+    def _split_oversized_partitions(self, region_files, uniref_files):
+        """Splits the partitions that don't fit in the memory budget on their own.
+
+        Returns the lists of region and UniRef50 spill files of the partitions
+        after splitting, in the same order as before.
+        """
+        split_region_files = []
+        split_uniref_files = []
+        for index, (region_file, uniref_file) in enumerate(
+            zip(region_files, uniref_files)
+        ):
+            size = self._estimated_memory(region_file)
+            if size <= self.memory_budget_bytes:
+                split_region_files.append(region_file)
+                split_uniref_files.append(uniref_file)
                 continue
-            regions = acc_to_regions[acc]
-            regions["pfam_acc"].append(x["pfam_acc"])
-            regions["start"].append(x["start"])
-            regions["end"].append(x["end"])
-        return acc_to_regions
+            # One more split than the estimate leaves room for uneven splits.
+            num_splits = -(-size // self.memory_budget_bytes) + 1
+            self.metrics.log(
+                f"Partition {index} needs about {size} bytes of memory, which is "
+                f"more than the memory budget. Splitting it into {num_splits}."
+            )
+            self.metrics.count("join", "split_partitions")
+            split_region_files.extend(
+                _split_spill_file(
+                    region_file, lambda r: r[0], self.num_partitions, num_splits
+                )
+            )
+            split_uniref_files.extend(
+                _split_spill_file(
+                    uniref_file,
+                    lambda x: uniref.UniRef50.extract_uniprot_acc(
+                        x["unique_identifier"]
+                    ),
+                    self.num_partitions,
+                    num_splits,
+                )
+            )
+        return split_region_files, split_uniref_files
 
-    def _generate_examples(self, split):
-        print("Starting to generate examples.")
+    def _group_partitions(self, region_files):
+        """Groups consecutive partitions into tasks that fit the memory budget."""
+        groups = [[]]
+        group_bytes = 0
+        for index, region_file in enumerate(region_files):
+            size = self._estimated_memory(region_file)
+            if size > self.memory_budget_bytes:
+                raise ValueError(
+                    f"The partition in {region_file} needs about {size} bytes of "
+                    "memory even after splitting, which is more than the "
+                    f"memory_budget_bytes of {self.memory_budget_bytes}."
+                )
+            if groups[-1] and group_bytes + size > self.memory_budget_bytes:
+                groups.append([])
+                group_bytes = 0
+            groups[-1].append(index)
+            group_bytes += size
+        return groups
 
-        uniref50_acc_set = self._get_uniref50_acc_set(split)
-        print("Created a set of UniRef50 accessions.")
+    def _spill(self, split, spill_dir):
+        with self.metrics.timed("spill"):
+            region_files = self._spill_regions(split, spill_dir)
+            self.metrics.log("Partitioned the Pfam regions.")
+            uniref_files = self._spill_uniref50(split, spill_dir)
+            self.metrics.log("Partitioned the UniRef50 examples.")
+        return region_files, uniref_files
 
-        # Get the regions for only the reference sequences in UniRef50. This
-        # is to save memory.
-        acc_to_regions = self._get_acc_to_regions(split, uniref50_acc_set)
-        print("Created a map from UniRef50 accessions to Pfam regions.")
+    def _join_tasks(self, region_files, uniref_files, spill_dir, first_task=0):
+        """Yields the (task, examples) of each join task from first_task on.
+
+        The examples of a task must be consumed before the next is yielded.
+        """
+        region_files, uniref_files = self._split_oversized_partitions(
+            region_files, uniref_files
+        )
+        groups = self._group_partitions(region_files)
+        args_list = [
+            (
+                [region_files[i] for i in group],
+                [uniref_files[i] for i in group],
+                os.path.join(spill_dir, f"joined-{task:05d}"),
+            )
+            for task, group in enumerate(groups)
+        ][first_task:]
+        output_files = parallel.ordered_imap(
+            _join_partitions, args_list, self.num_workers
+        )
+        for task, output_file in enumerate(output_files, first_task):
+            self.metrics.count("join", "tasks")
+            yield task, (
+                (x["unique_identifier"], x) for x in spill.iter_spill(output_file)
+            )
+            os.remove(output_file)
+
+    def _generate_examples_partitioned(self, split):
+        with tempfile.TemporaryDirectory(dir=self.spill_dir) as spill_dir:
+            region_files, uniref_files = self._spill(split, spill_dir)
+            for _, examples in self._join_tasks(region_files, uniref_files, spill_dir):
+                yield from examples
+
+    def _checkpoint_directory(self, split):
+        return os.path.join(self.checkpoint_dir, self.info.full_name, split)
+
+    def _generate_examples_checkpointed(self, split):
+        uniref_info = uniref.UniRef50(data_dir=self._source_data_dir).info
+        pfam_info = pfam.PfamARegionsUniprot(data_dir=self._source_data_dir).info
+        ckpt = checkpoint.Checkpoint(
+            self._checkpoint_directory(split),
+            fingerprint={
+                "join_mode": self.join_mode,
+                "num_partitions": self.num_partitions,
+                "memory_budget_bytes": self.memory_budget_bytes,
+                "uniref50": [
+                    uniref_info.full_name,
+                    uniref_info.splits[split].num_examples,
+                ],
+                "pfam": [pfam_info.full_name, pfam_info.splits[split].num_examples],
+            },
+            log=self.metrics.log,
+        )
+        for key, x in ckpt.iter_committed():
+            self.metrics.count("checkpoint", "resumed_records")
+            yield key, x
+
+        if self.join_mode == "partitioned":
+            chunks = self._partitioned_chunks(split, ckpt)
+        else:
+            chunks = self._memory_chunks(
+                split, ckpt, uniref_info.splits[split].num_examples
+            )
+        for start, end, examples in chunks:
+            yield from ckpt.commit(
+                (
+                    (key, uniref.add_sequence_features(x, self.builder_config))
+                    for key, x in examples
+                ),
+                start,
+                end,
+            )
+            self.metrics.count("checkpoint", "chunks")
+
+    def _memory_chunks(self, split, ckpt, num_examples):
+        """Yields the (start, end, examples) of UniRef50 example ranges."""
+        examples = self._generate_examples_memory(split, start=ckpt.position)
+        for start in range(ckpt.position, num_examples, _CHECKPOINT_INTERVAL):
+            end = min(start + _CHECKPOINT_INTERVAL, num_examples)
+            yield start, end, itertools.islice(examples, end - start)
+
+    def _partitioned_chunks(self, split, ckpt):
+        """Yields the (task, task + 1, examples) of the remaining join tasks."""
+        spill_dir = os.path.join(ckpt.directory, "spill")
+        spill_sizes = ckpt.state.get("spill_sizes")
+        if spill_sizes is not None:
+            region_files = [
+                os.path.join(spill_dir, f"regions-{i:05d}")
+                for i in range(self.num_partitions)
+            ]
+            uniref_files = [
+                os.path.join(spill_dir, f"uniref50-{i:05d}")
+                for i in range(self.num_partitions)
+            ]
+            if [_size_or_none(f) for f in region_files + uniref_files] != spill_sizes:
+                self.metrics.log("The spill files are incomplete, partitioning again.")
+                spill_sizes = None
+        if spill_sizes is None:
+            shutil.rmtree(spill_dir, ignore_errors=True)
+            os.makedirs(spill_dir)
+            region_files, uniref_files = self._spill(split, spill_dir)
+            ckpt.update_state(
+                spill_sizes=[os.path.getsize(f) for f in region_files + uniref_files]
+            )
+        tasks = self._join_tasks(
+            region_files, uniref_files, spill_dir, first_task=ckpt.position
+        )
+        for task, examples in tasks:
+            yield task, task + 1, examples
 
-        ds = uniref.UniRef50().as_dataset(split=split)
-        ds = ds.prefetch(tf.data.experimental.AUTOTUNE)
-        for x in ds.as_numpy_iterator():
-            acc = x["unique_identifier"]
-            x["pfam_regions"] = acc_to_regions[acc]
-            yield acc, x
@@ -0,0 +1,238 @@
+"""A compact index from UniProt accession to its Pfam regions.
+
+The regions are stored in a CSR layout: the regions of the i-th accession (in
+sorted order) are at positions indptr[i]:indptr[i + 1] of the pfam_ids,
+starts and ends arrays. Pfam accessions are interned to integer ids. Compared
+to a dict of Python lists, this uses a small fraction of the memory and can be
+saved to disk and memory-mapped back in.
+
+The index can also hold the content hash of the regions of each accession,
+which delta builds of joined.UniRef50WithPfamRegions compare across releases.
+"""
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from bio_tfds import delta
+from bio_tfds.constants import DEFAULT_TFDS_DATA_DIR
+from bio_tfds.protein import pfam
+
+_ARRAY_NAMES = ("accessions", "indptr", "pfam_accs", "pfam_ids", "starts", "ends")
+
+# The optional array with the hash of the regions of each accession. It is
+# saved separately so that indexes saved without it can still be loaded.
+_REGION_HASHES_NAME = "region_hashes"
+
+# The number of regions we read from the dataset at a time when building.
+_BATCH_SIZE = 1 << 16
+
+
+def regions_hash(pfam_accs, starts, ends):
+    """Returns the content hash of the regions of an accession.
+
+    Args:
+        pfam_accs: the bytes Pfam accessions of the regions.
+        starts: the starts of the regions.
+        ends: the ends of the regions.
+    """
+    return delta.content_hash(
+        b"\n".join(tf.compat.as_bytes(acc) for acc in pfam_accs),
+        np.asarray(starts, np.int32).tobytes(),
+        np.asarray(ends, np.int32).tobytes(),
+    )
+
+
+# The hash of an accession without any regions.
+_EMPTY_REGIONS_HASH = np.uint64(regions_hash([], [], []))
+
+
+class PfamRegionIndex(object):
+    """Maps UniProt accessions to their Pfam regions."""
+
+    def __init__(
+        self, accessions, indptr, pfam_accs, pfam_ids, starts, ends, region_hashes=None
+    ):
+        # Sorted bytes array of the unique UniProt accessions.
+        self.accessions = accessions
+        # int64 array with len(accessions) + 1 entries.
+        self.indptr = indptr
+        # Bytes array of the unique Pfam accessions. A region's pfam_id is
+        # an index into this.
+        self.pfam_accs = pfam_accs
+        # int32 arrays with an entry per region.
+        self.pfam_ids = pfam_ids
+        self.starts = starts
+        self.ends = ends
+        # uint64 array with the regions_hash of each accession, or None if
+        # they have not been computed.
+        self.region_hashes = region_hashes
+
+    @classmethod
+    def from_arrays(cls, uniprot_accs, pfam_accs, starts, ends):
+        """Builds an index from parallel arrays with an entry per region."""
+        accessions, acc_ids = np.unique(uniprot_accs, return_inverse=True)
+        unique_pfam_accs, pfam_ids = np.unique(pfam_accs, return_inverse=True)
+        # A stable sort keeps the regions of each accession in their original
+        # order.
+        order = np.argsort(acc_ids, kind="stable")
+        indptr = np.zeros([len(accessions) + 1], dtype=np.int64)
+        np.cumsum(np.bincount(acc_ids, minlength=len(accessions)), out=indptr[1:])
+        return cls(
+            accessions=accessions,
+            indptr=indptr,
+            pfam_accs=unique_pfam_accs,
+            pfam_ids=pfam_ids[order].astype(np.int32),
+            starts=np.asarray(starts, dtype=np.int32)[order],
+            ends=np.asarray(ends, dtype=np.int32)[order],
+        )
+
+    @classmethod
+    def from_dataset(cls, ds):
+        """Builds an index from a PfamARegionsUniprot tf.data.Dataset."""
+        ds = ds.map(
+            lambda x: {k: x[k] for k in ["uniprot_acc", "pfam_acc", "start", "end"]},
+            num_parallel_calls=tf.data.experimental.AUTOTUNE,
+        )
+        ds = ds.batch(_BATCH_SIZE)
+        ds = ds.prefetch(tf.data.experimental.AUTOTUNE)
+        columns = {"uniprot_acc": [], "pfam_acc": [], "start": [], "end": []}
+        for batch in ds.as_numpy_iterator():
+            # The Text features come back as object arrays of bytes, which
+            # take up much more memory than fixed-width bytes arrays.
+            columns["uniprot_acc"].append(batch["uniprot_acc"].astype(bytes))
+            columns["pfam_acc"].append(batch["pfam_acc"].astype(bytes))
+            columns["start"].append(batch["start"])
+            columns["end"].append(batch["end"])
+        if not columns["start"]:
+            empty = np.zeros([0], dtype=np.int32)
+            return cls.from_arrays(np.zeros([0], dtype="S1"), empty, empty, empty)
+        return cls.from_arrays(
+            uniprot_accs=np.concatenate(columns["uniprot_acc"]),
+            pfam_accs=np.concatenate(columns["pfam_acc"]),
+            starts=np.concatenate(columns["start"]),
+            ends=np.concatenate(columns["end"]),
+        )
+
+    def save(self, directory):
+        tf.io.gfile.makedirs(directory)
+        for name in _ARRAY_NAMES:
+            with tf.io.gfile.GFile(os.path.join(directory, f"{name}.npy"), "wb") as f:
+                np.save(f, getattr(self, name))
+        if self.region_hashes is not None:
+            self._save_region_hashes(directory)
+
+    def _save_region_hashes(self, directory):
+        path = os.path.join(directory, f"{_REGION_HASHES_NAME}.npy")
+        with tf.io.gfile.GFile(path, "wb") as f:
+            np.save(f, self.region_hashes)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """Loads an index saved with `save`.
+
+        With mmap=True, the arrays are memory-mapped instead of read into
+        memory, so loading is almost instant. This only works for local files.
+        """
+        mmap_mode = "r" if mmap else None
+        arrays = {
+            name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+            for name in _ARRAY_NAMES
+        }
+        region_hashes_path = os.path.join(directory, f"{_REGION_HASHES_NAME}.npy")
+        if tf.io.gfile.exists(region_hashes_path):
+            arrays["region_hashes"] = np.load(region_hashes_path, mmap_mode=mmap_mode)
+        return cls(**arrays)
+
+    @classmethod
+    def build_or_load(
+        cls,
+        split="train",
+        data_dir=DEFAULT_TFDS_DATA_DIR,
+        mmap=True,
+        with_region_hashes=False,
+    ):
+        """Returns the index of a prepared PfamARegionsUniprot split.
+
+        The index is saved next to the prepared dataset the first time, so it
+        only needs to be built once. With with_region_hashes, the hashes of
+        the regions of every accession are computed and saved with it too if
+        they are not already.
+        """
+        builder = pfam.PfamARegionsUniprot(data_dir=data_dir)
+        directory = os.path.join(builder.data_dir, f"{split}-region-index")
+        if not tf.io.gfile.exists(os.path.join(directory, "ends.npy")):
+            cls.from_dataset(builder.as_dataset(split=split)).save(directory)
+        index = cls.load(directory, mmap=mmap)
+        if with_region_hashes and index.region_hashes is None:
+            index.compute_region_hashes()
+            index._save_region_hashes(directory)
+        return index
+
+    def compute_region_hashes(self):
+        """Sets the region_hashes to the regions_hash of each accession."""
+        pfam_accs = np.asarray(self.pfam_accs).tolist()
+        pfam_ids = np.asarray(self.pfam_ids)
+        starts = np.asarray(self.starts)
+        ends = np.asarray(self.ends)
+        indptr = np.asarray(self.indptr).tolist()
+        self.region_hashes = np.fromiter(
+            (
+                regions_hash(
+                    [pfam_accs[i] for i in pfam_ids[begin:end].tolist()],
+                    starts[begin:end],
+                    ends[begin:end],
+                )
+                for begin, end in zip(indptr[:-1], indptr[1:])
+            ),
+            dtype=np.uint64,
+            count=len(self.accessions),
+        )
+
+    def lookup_region_hashes(self, uniprot_accs):
+        """Returns the regions_hash of each of an array of accessions.
+
+        Accessions that are not in the index get the hash of no regions, like
+        `regions` gives them no regions. The region_hashes must be set.
+        """
+        uniprot_accs = np.asarray(uniprot_accs, dtype=bytes)
+        if not len(self.accessions):
+            return np.full(uniprot_accs.shape, _EMPTY_REGIONS_HASH, np.uint64)
+        positions = np.minimum(
+            np.searchsorted(self.accessions, uniprot_accs), len(self.accessions) - 1
+        )
+        found = self.accessions[positions] == uniprot_accs
+        return np.where(
+            found, np.asarray(self.region_hashes)[positions], _EMPTY_REGIONS_HASH
+        ).astype(np.uint64)
+
+    def __len__(self):
+        return len(self.accessions)
+
+    def __contains__(self, uniprot_acc):
+        return self._find(uniprot_acc) is not None
+
+    def _find(self, uniprot_acc):
+        if isinstance(uniprot_acc, str):
+            uniprot_acc = uniprot_acc.encode("utf-8")
+        index = int(np.searchsorted(self.accessions, uniprot_acc))
+        if index < len(self.accessions) and self.accessions[index] == uniprot_acc:
+            return index
+        return None
+
+    def regions(self, uniprot_acc):
+        """Returns the regions of the accession.
+
+        The regions are returned as a dict with "pfam_acc", "start" and "end"
+        keys, matching the pfam_regions feature of UniRef50WithPfamRegions.
+        An accession without any regions gets empty lists.
+        """
+        index = self._find(uniprot_acc)
+        if index is None:
+            return {"pfam_acc": [], "start": [], "end": []}
+        begin, end = self.indptr[index], self.indptr[index + 1]
+        return {
+            "pfam_acc": self.pfam_accs[self.pfam_ids[begin:end]].tolist(),
+            "start": np.asarray(self.starts[begin:end]),
+            "end": np.asarray(self.ends[begin:end]),
+        }
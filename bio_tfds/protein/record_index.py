@@ -0,0 +1,220 @@
+"""A persisted index from the keys of a prepared dataset to its records.
+
+The index locates the serialized record of every key in the TFRecord shards
+of a prepared dataset, so a few records can be read without scanning the
+whole dataset. It is stored as parallel arrays sorted by key: the shard id,
+the byte offset of the record's data in the shard and its length. Lookups are
+a single vectorized binary search. The records that are looked up together
+are read in shard and offset order, and records close to each other in a
+shard are read with one request.
+
+A TFRecord is framed as an 8 byte length, a 4 byte CRC of the length, the
+data and a 4 byte CRC of the data.
+"""
+import os
+
+import numpy as np
+import tensorflow as tf
+
+_ARRAY_NAMES = ("shard_names", "keys", "shard_ids", "offsets", "lengths")
+
+# The number of bytes that come before and after the data of a TFRecord.
+_HEADER_SIZE = 12
+_FOOTER_SIZE = 4
+
+# The number of records we read from a shard at a time when building.
+_BATCH_SIZE = 1 << 16
+
+# Two records of a shard are read with a single request if there are at most
+# this many bytes between them.
+_MAX_GAP = 64 * 1024
+
+
+def build_or_load_split(data_dir, name, split, key_feature, mmap=True):
+    """Returns the index of a split of a prepared dataset.
+
+    The index is saved next to the shards the first time, so it only needs to
+    be built once.
+
+    Args:
+        data_dir: the directory of the prepared dataset, i.e. builder.data_dir.
+        name: the name of the dataset, i.e. builder.name.
+        split: the name of the split.
+        key_feature: the name of the scalar string feature to use as key.
+        mmap: whether to memory-map the index.
+    """
+    shard_paths = sorted(
+        tf.io.gfile.glob(os.path.join(data_dir, f"{name}-{split}.tfrecord*"))
+    )
+    return RecordIndex.build_or_load(
+        shard_paths,
+        key_feature=key_feature,
+        directory=os.path.join(data_dir, f"{split}-record-index"),
+        mmap=mmap,
+    )
+
+
+class RecordIndex(object):
+    """Maps the keys of a prepared dataset to their serialized records."""
+
+    def __init__(self, shard_names, keys, shard_ids, offsets, lengths):
+        # Bytes array of the file names of the shards, relative to the
+        # directory of the dataset.
+        self.shard_names = shard_names
+        # Sorted bytes array of the unique keys.
+        self.keys = keys
+        # int32 array with the index in shard_names of each key's shard.
+        self.shard_ids = shard_ids
+        # int64 arrays with the offset of the data of each key's record in
+        # its shard and the length of the data.
+        self.offsets = offsets
+        self.lengths = lengths
+
+    @classmethod
+    def from_shards(cls, shard_paths, key_feature):
+        """Builds an index by reading the TFRecord shards of a dataset.
+
+        Args:
+            shard_paths: the paths to the shards. Their order is kept.
+            key_feature: the name of the scalar string feature to use as key.
+        """
+        features = {key_feature: tf.io.FixedLenFeature([], tf.string)}
+        columns = {"keys": [], "shard_ids": [], "offsets": [], "lengths": []}
+        for shard_id, shard_path in enumerate(shard_paths):
+            ds = tf.data.TFRecordDataset(shard_path)
+            ds = ds.map(
+                lambda r: (
+                    tf.io.parse_single_example(r, features)[key_feature],
+                    tf.strings.length(r, unit="BYTE"),
+                ),
+                num_parallel_calls=tf.data.experimental.AUTOTUNE,
+            )
+            ds = ds.batch(_BATCH_SIZE)
+            ds = ds.prefetch(tf.data.experimental.AUTOTUNE)
+            record_start = 0
+            for keys, lengths in ds.as_numpy_iterator():
+                lengths = lengths.astype(np.int64)
+                sizes = _HEADER_SIZE + lengths + _FOOTER_SIZE
+                starts = record_start + np.cumsum(sizes) - sizes
+                record_start += int(sizes.sum())
+                columns["keys"].append(keys.astype(bytes))
+                columns["shard_ids"].append(np.full(len(keys), shard_id, np.int32))
+                columns["offsets"].append(starts + _HEADER_SIZE)
+                columns["lengths"].append(lengths)
+
+        shard_names = np.array(
+            [os.path.basename(path) for path in shard_paths], dtype=bytes
+        )
+        if not columns["keys"]:
+            return cls(
+                shard_names=shard_names,
+                keys=np.zeros([0], dtype="S1"),
+                shard_ids=np.zeros([0], dtype=np.int32),
+                offsets=np.zeros([0], dtype=np.int64),
+                lengths=np.zeros([0], dtype=np.int64),
+            )
+        keys = np.concatenate(columns["keys"])
+        order = np.argsort(keys, kind="stable")
+        return cls(
+            shard_names=shard_names,
+            keys=keys[order],
+            shard_ids=np.concatenate(columns["shard_ids"])[order],
+            offsets=np.concatenate(columns["offsets"])[order],
+            lengths=np.concatenate(columns["lengths"])[order],
+        )
+
+    def save(self, directory):
+        tf.io.gfile.makedirs(directory)
+        for name in _ARRAY_NAMES:
+            with tf.io.gfile.GFile(os.path.join(directory, f"{name}.npy"), "wb") as f:
+                np.save(f, getattr(self, name))
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """Loads an index saved with `save`, memory-mapping it by default."""
+        mmap_mode = "r" if mmap else None
+        arrays = {
+            name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+            for name in _ARRAY_NAMES
+        }
+        return cls(**arrays)
+
+    @classmethod
+    def build_or_load(cls, shard_paths, key_feature, directory, mmap=True):
+        """Loads the index from the directory, building it first if needed."""
+        if not tf.io.gfile.exists(os.path.join(directory, "lengths.npy")):
+            cls.from_shards(shard_paths, key_feature).save(directory)
+        return cls.load(directory, mmap=mmap)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return bool(self.locate([key])[0][0])
+
+    def locate(self, keys):
+        """Looks up an array of keys.
+
+        Returns:
+            A (found, shard_ids, offsets, lengths) tuple of arrays with an
+            entry per key. The found is a boolean array that is False for keys
+            not in the index, whose other entries are meaningless.
+        """
+        keys = np.asarray(keys, dtype=bytes)
+        if not len(self.keys):
+            zeros = np.zeros(keys.shape, dtype=np.int64)
+            return np.zeros(keys.shape, dtype=bool), zeros, zeros, zeros
+        positions = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        found = self.keys[positions] == keys
+        return (
+            found,
+            np.asarray(self.shard_ids[positions]),
+            np.asarray(self.offsets[positions]),
+            np.asarray(self.lengths[positions]),
+        )
+
+    def read(self, directory, keys):
+        """Reads the serialized records of some keys.
+
+        Args:
+            directory: the directory of the dataset with the shards.
+            keys: the keys to read.
+
+        Returns:
+            A list with the serialized record of each key as bytes, or None
+            for keys not in the index.
+        """
+        found, shard_ids, offsets, lengths = self.locate(keys)
+        records = [None] * len(found)
+        wanted = np.flatnonzero(found)
+        # Sorting the reads by shard and offset lets us coalesce the reads of
+        # nearby records and read each shard front to back.
+        wanted = wanted[np.lexsort([offsets[wanted], shard_ids[wanted]])]
+
+        begin = 0
+        while begin < len(wanted):
+            # Group the reads of the same shard whose gaps are small enough.
+            shard_id = shard_ids[wanted[begin]]
+            end = begin + 1
+            span_end = offsets[wanted[begin]] + lengths[wanted[begin]]
+            while (
+                end < len(wanted)
+                and shard_ids[wanted[end]] == shard_id
+                and offsets[wanted[end]] - span_end <= _MAX_GAP
+            ):
+                span_end = max(span_end, offsets[wanted[end]] + lengths[wanted[end]])
+                end += 1
+            group = wanted[begin:end]
+            span_start = offsets[group[0]]
+
+            shard_path = os.path.join(
+                directory, self.shard_names[shard_id].decode("utf-8")
+            )
+            with tf.io.gfile.GFile(shard_path, "rb") as f:
+                f.seek(int(span_start))
+                data = f.read(int(span_end - span_start))
+            for i in group:
+                start = int(offsets[i] - span_start)
+                records[i] = data[start : start + int(lengths[i])]
+            begin = end
+        return records
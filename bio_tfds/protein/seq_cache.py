@@ -0,0 +1,89 @@
+"""A persistent, file-backed cache of protein sequences by accession.
+
+This lets us avoid fetching sequences from remote services like UniProt again
+every time a dataset is rebuilt. Accessions that the remote service did not
+have a sequence for are cached too, so we don't keep asking for them.
+"""
+import os
+import sqlite3
+import time
+
+# SQLite limits the number of variables in a single statement.
+_MAX_VARIABLES = 900
+
+
+class SequenceCache(object):
+    """Maps accessions to sequences in an SQLite database.
+
+    Accessions known to be missing are stored with a NULL sequence.
+    """
+
+    def __init__(self, path, ttl_seconds=None):
+        """Opens the cache, creating it if needed.
+
+        Args:
+            path: the path to the SQLite database file.
+            ttl_seconds: entries older than this many seconds are ignored. They
+                never expire if None.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._connection = sqlite3.connect(path)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS sequences ("
+            "accession TEXT PRIMARY KEY, sequence TEXT, updated REAL NOT NULL)"
+        )
+        self._connection.commit()
+
+    def get_many(self, accessions):
+        """Looks up the accessions in the cache.
+
+        Returns:
+            A (sequences, missing) tuple. The sequences is a dict from
+            accession to sequence. The missing is a set of the accessions known
+            to not have a sequence. Accessions that are in neither were not
+            in the cache.
+        """
+        min_updated = -1.0
+        if self.ttl_seconds is not None:
+            min_updated = time.time() - self.ttl_seconds
+
+        sequences = {}
+        missing = set()
+        accessions = list(accessions)
+        for i in range(0, len(accessions), _MAX_VARIABLES):
+            batch = accessions[i : i + _MAX_VARIABLES]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._connection.execute(
+                "SELECT accession, sequence FROM sequences "
+                f"WHERE updated >= ? AND accession IN ({placeholders})",
+                [min_updated] + batch,
+            )
+            for accession, sequence in rows:
+                if sequence is None:
+                    missing.add(accession)
+                else:
+                    sequences[accession] = sequence
+        return sequences, missing
+
+    def put_many(self, sequences, missing=()):
+        """Adds sequences and accessions known to be missing to the cache."""
+        now = time.time()
+        rows = [(acc, seq, now) for acc, seq in sequences.items()]
+        rows.extend((acc, None, now) for acc in missing)
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO sequences VALUES (?, ?, ?)", rows
+        )
+        self._connection.commit()
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
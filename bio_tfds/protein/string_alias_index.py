@@ -0,0 +1,136 @@
+"""A compact, persisted index from STRING protein names to UniProt accessions.
+
+The mapping is stored as two fixed-width bytes arrays, the sorted STRING names
+and their UniProt accessions. Lookups are binary searches, and many names can
+be looked up at once with a single vectorized search. The arrays are saved as
+.npy files which are memory-mapped when loaded, so loading is almost instant
+and the pages are shared between processes.
+"""
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from bio_tfds import tsv
+
+# The source of the aliases that are UniProt accessions.
+UNIPROT_ALIAS_SOURCE = "Ensembl_UniProt"
+
+# The approximate number of bytes of the alias file we parse at a time.
+_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+class StringAliasIndex(object):
+    """Maps STRING protein names to UniProt accessions."""
+
+    def __init__(self, names, accessions):
+        # Sorted bytes array of the unique STRING protein names.
+        self.names = names
+        # Bytes array with the UniProt accession of each name.
+        self.accessions = accessions
+
+    @classmethod
+    def from_arrays(cls, names, accessions):
+        """Builds an index from parallel arrays of names and accessions.
+
+        If a name appears more than once, its last accession is used.
+        """
+        order = np.argsort(names, kind="stable")
+        names = names[order]
+        accessions = accessions[order]
+        # Keep the last entry of each run of equal names.
+        is_last = np.ones([len(names)], dtype=bool)
+        is_last[:-1] = names[1:] != names[:-1]
+        return cls(names=names[is_last], accessions=accessions[is_last])
+
+    @classmethod
+    def from_alias_file(cls, f, source=UNIPROT_ALIAS_SOURCE):
+        """Builds an index from a STRING protein.aliases file.
+
+        Args:
+            f: the alias file opened in binary mode.
+            source: only aliases from this source are included.
+        """
+        # We pad the space-separated sources with spaces so that we only
+        # match whole words.
+        pattern = f" {source} ".encode("utf-8")
+        names = []
+        accessions = []
+        is_header = True
+        for block in tsv.iter_blocks(f, chunk_size=_CHUNK_SIZE):
+            if is_header:
+                _, _, block = block.partition(b"\n")
+                is_header = False
+                if not block:
+                    continue
+            data, starts, ends = tsv.split_fields(block, 3)
+            sources = tsv.parse_strings(data, starts[:, 2], ends[:, 2])
+            sources = np.char.add(np.char.add(b" ", sources), b" ")
+            mask = np.char.find(sources, pattern) >= 0
+            names.append(tsv.parse_strings(data, starts[mask, 0], ends[mask, 0]))
+            accessions.append(tsv.parse_strings(data, starts[mask, 1], ends[mask, 1]))
+        if not names:
+            return cls(np.zeros([0], dtype="S1"), np.zeros([0], dtype="S1"))
+        return cls.from_arrays(np.concatenate(names), np.concatenate(accessions))
+
+    def save(self, directory):
+        tf.io.gfile.makedirs(directory)
+        for name in ["names", "accessions"]:
+            with tf.io.gfile.GFile(os.path.join(directory, f"{name}.npy"), "wb") as f:
+                np.save(f, getattr(self, name))
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """Loads an index saved with `save`, memory-mapping it by default."""
+        mmap_mode = "r" if mmap else None
+        return cls(
+            names=np.load(os.path.join(directory, "names.npy"), mmap_mode=mmap_mode),
+            accessions=np.load(
+                os.path.join(directory, "accessions.npy"), mmap_mode=mmap_mode
+            ),
+        )
+
+    @classmethod
+    def build_or_load(cls, alias_file, directory, open_fn=None):
+        """Loads the index from the directory, building it first if needed.
+
+        Args:
+            alias_file: the path to the STRING protein.aliases file.
+            directory: where the index is saved.
+            open_fn: a function that opens the alias file in binary mode.
+                Defaults to tf.io.gfile.GFile.
+        """
+        if not tf.io.gfile.exists(os.path.join(directory, "accessions.npy")):
+            if open_fn is None:
+                f = tf.io.gfile.GFile(alias_file, "rb")
+            else:
+                f = open_fn(alias_file)
+            with f:
+                cls.from_alias_file(f).save(directory)
+        return cls.load(directory)
+
+    def __len__(self):
+        return len(self.names)
+
+    def lookup(self, names):
+        """Looks up an array of STRING names.
+
+        Returns:
+            An (accessions, found) tuple of arrays with an entry per name. The
+            found is a boolean array that is False for names not in the index,
+            whose accessions are empty.
+        """
+        names = np.asarray(names, dtype=bytes)
+        if not len(self.names):
+            return np.zeros(names.shape, dtype="S1"), np.zeros(names.shape, dtype=bool)
+        positions = np.minimum(np.searchsorted(self.names, names), len(self.names) - 1)
+        found = self.names[positions] == names
+        accessions = np.where(found, self.accessions[positions], b"")
+        return accessions, found
+
+    def get(self, name, default=None):
+        """Returns the UniProt accession of a single STRING name as a str."""
+        accessions, found = self.lookup([name])
+        if not found[0]:
+            return default
+        return accessions[0].decode("utf-8")
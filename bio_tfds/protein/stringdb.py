@@ -1,7 +1,20 @@
+import collections
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
 import tensorflow as tf
 import tensorflow_datasets as tfds
 
+from bio_tfds import build_metrics
+from bio_tfds import gzip_stream
+from bio_tfds import parallel
+from bio_tfds import spill
+from bio_tfds import tsv
 from bio_tfds.constants import DEFAULT_TFDS_DATA_DIR
+from bio_tfds.protein import string_alias_index
 
 _CITATION = R"""\
 @article{von2005string,
@@ -15,18 +28,248 @@ _CITATION = R"""\
   publisher={Oxford University Press}
 }"""
 
-_UNIPROT_ALIAS_KEY = "Ensembl_UniProt"
-
 _ALIASES_DOWNLOAD = "http://stringdb-static.org/download/protein.aliases.v11.0.txt.gz"
 
+# The number of columns in the protein.links file.
+_NUM_LINKS_COLUMNS = 3
+
+# The file in the data directory of a split_by_taxon config that lists its
+# taxa.
+_TAXON_MANIFEST_FILENAME = "taxa.json"
+
+# Alias indices already loaded in this process, keyed by directory.
+_ALIAS_INDICES = {}
+
+
+def _load_alias_index(alias_index_dir):
+    if alias_index_dir not in _ALIAS_INDICES:
+        _ALIAS_INDICES[alias_index_dir] = string_alias_index.StringAliasIndex.load(
+            alias_index_dir
+        )
+    return _ALIAS_INDICES[alias_index_dir]
+
+
+def taxon_split(taxa):
+    """Returns the split of a split_by_taxon StringLinks with the given taxa.
+
+    Args:
+        taxa: an NCBI taxon id, like 9606 for human, or a list of them.
+
+    Returns:
+        A split string that can be passed to as_dataset. Only the shards of
+        those taxa are read.
+    """
+    if isinstance(taxa, (int, str)):
+        taxa = [taxa]
+    return "+".join(f"taxon_{taxon}" for taxon in taxa)
+
+
+def _parse_taxa(data, starts):
+    """Parses the taxon prefixes of the STRING names starting at `starts`."""
+    # STRING names look like "9606.ENSP00000000233".
+    dots = np.flatnonzero(data == ord("."))
+    ends = dots[np.minimum(np.searchsorted(dots, starts), len(dots) - 1)]
+    return tsv.parse_ints(data, starts, ends, dtype=np.int64)
+
+
+def _parse_links_block(block, offset, alias_index, min_score, same_species_only):
+    """Parses a block of complete lines of the protein.links file.
+
+    Args:
+        block: the bytes of the lines.
+        offset: the offset of the block in the file. If 0, the block starts
+            with the header line, which is skipped.
+        alias_index: a string_alias_index.StringAliasIndex.
+        min_score: links with a lower score are dropped.
+        same_species_only: if True, links between proteins of different
+            species are dropped.
+
+    Returns:
+        A dict of arrays with an entry per link that was kept. The "key" of
+        each link is the offset of its line in the file, which makes for keys
+        that do not depend on how the file was split up. The "taxon" is the
+        taxon of the first protein. It also has the "num_bytes" and
+        "num_lines" of the block, and "dropped", a dict from the reason links
+        were dropped to how many were.
+    """
+    num_bytes = len(block)
+    if offset == 0:
+        header, _, block = block.partition(b"\n")
+        offset = len(header) + 1
+    if not block:
+        # Only the header, or a range without any lines.
+        return {
+            "num_bytes": num_bytes,
+            "num_lines": 0,
+            "dropped": {},
+            "key": np.zeros([0], dtype=np.int64),
+            "taxon": np.zeros([0], dtype=np.int64),
+            "uniprot_acc_1": np.zeros([0], dtype="S1"),
+            "uniprot_acc_2": np.zeros([0], dtype="S1"),
+            "score": np.zeros([0], dtype=np.float64),
+        }
+    data, starts, ends = tsv.split_fields(block, _NUM_LINKS_COLUMNS, delimiter=b" ")
+    p1 = tsv.parse_strings(data, starts[:, 0], ends[:, 0])
+    p2 = tsv.parse_strings(data, starts[:, 1], ends[:, 1])
+    scores = tsv.parse_ints(data, starts[:, 2], ends[:, 2]) / 1000.0
+    taxa = _parse_taxa(data, starts[:, 0])
+
+    u1, found1 = alias_index.lookup(p1)
+    u2, found2 = alias_index.lookup(p2)
+    mask = found1 & found2 & (u1 != b"") & (u2 != b"")
+    dropped = {"no_uniprot_alias": int(len(mask) - mask.sum())}
+    if min_score:
+        keep = scores >= min_score
+        dropped["low_score"] = int((mask & ~keep).sum())
+        mask &= keep
+    if same_species_only:
+        keep = taxa == _parse_taxa(data, starts[:, 1])
+        dropped["different_species"] = int((mask & ~keep).sum())
+        mask &= keep
+    return {
+        "num_bytes": num_bytes,
+        "num_lines": len(mask),
+        "dropped": dropped,
+        "key": starts[mask, 0] + offset,
+        "taxon": taxa[mask],
+        "uniprot_acc_1": u1[mask],
+        "uniprot_acc_2": u2[mask],
+        "score": scores[mask],
+    }
+
+
+def _parse_links_range(
+    links_file, start, end, alias_index_dir, min_score, same_species_only
+):
+    block = parallel.read_range(links_file, start, end)
+    if not block.endswith(b"\n"):
+        block += b"\n"
+    return _parse_links_block(
+        block,
+        start,
+        _load_alias_index(alias_index_dir),
+        min_score=min_score,
+        same_species_only=same_species_only,
+    )
+
+
+def _split_by_taxon(links):
+    """Splits the links parsed from a block by the taxon of the first protein.
+
+    Yields:
+        A (taxon, links) pair for each taxon in the block. The links are a
+        dict with the "key", "uniprot_acc_1", "uniprot_acc_2" and "score"
+        arrays of the links of the taxon, in the order of the file.
+    """
+    taxa = links["taxon"]
+    order = np.argsort(taxa, kind="stable")
+    boundaries = np.flatnonzero(taxa[order][1:] != taxa[order][:-1]) + 1
+    for indices in np.split(order, boundaries):
+        if not len(indices):
+            continue
+        yield int(taxa[indices[0]]), {
+            name: links[name][indices]
+            for name in ("key", "uniprot_acc_1", "uniprot_acc_2", "score")
+        }
+
+
+def _iter_examples(links):
+    for row in zip(
+        links["key"].tolist(),
+        links["uniprot_acc_1"].astype(str).tolist(),
+        links["uniprot_acc_2"].astype(str).tolist(),
+        links["score"].tolist(),
+    ):
+        yield row[0], {
+            "uniprot_acc_1": row[1],
+            "uniprot_acc_2": row[2],
+            "score": row[3],
+        }
+
+
+class StringLinksConfig(tfds.core.BuilderConfig):
+    def __init__(
+        self, *, min_score=0.0, same_species_only=False, split_by_taxon=False, **kwargs
+    ):
+        super().__init__(version=tfds.core.Version("1.0.0"), **kwargs)
+        # Links with a lower score are not included.
+        self.min_score = min_score
+        # If True, only links between proteins of the same species are included.
+        self.same_species_only = same_species_only
+        # If True, there is a split for each taxon, named like "taxon_9606",
+        # instead of a single train split. A link belongs to the taxon of its
+        # first protein.
+        self.split_by_taxon = split_by_taxon
+
 
 class StringLinks(tfds.core.GeneratorBasedBuilder):
     VERSION = tfds.core.Version("1.0.0")
 
     _DOWNLOAD_URL = "http://stringdb-static.org/download/protein.links.v11.0.txt.gz"
 
-    def __init__(self, data_dir=DEFAULT_TFDS_DATA_DIR, **kwargs):
+    # The features of the edges for graph.CsrGraph.
+    GRAPH_EDGE_KEYS = ("uniprot_acc_1", "uniprot_acc_2")
+    GRAPH_WEIGHT_KEY = "score"
+
+    BUILDER_CONFIGS = [
+        StringLinksConfig(name="all", description="All links."),
+        StringLinksConfig(
+            name="high_confidence",
+            description="Links with a score of at least 0.7 between proteins of the same species.",
+            min_score=0.7,
+            same_species_only=True,
+        ),
+        StringLinksConfig(
+            name="by_taxon",
+            description="Links between proteins of the same species, with a split per species.",
+            same_species_only=True,
+            split_by_taxon=True,
+        ),
+    ]
+
+    def __init__(
+        self,
+        data_dir=DEFAULT_TFDS_DATA_DIR,
+        stream_gzip=False,
+        alias_index_dir=None,
+        num_workers=1,
+        range_size=parallel.DEFAULT_RANGE_SIZE,
+        metrics=None,
+        spill_dir=None,
+        **kwargs,
+    ):
+        """Creates the builder.
+
+        Args:
+            data_dir: the tfds data directory.
+            stream_gzip: if True, we parse the downloaded .gz files directly
+                while they are decompressed in a background thread instead of
+                extracting them to disk first.
+            alias_index_dir: where to save the string_alias_index.StringAliasIndex
+                built from the alias file. It is only built the first time and
+                memory-mapped on later builds. Defaults to a directory next to
+                the alias file.
+            num_workers: the number of processes to parse the links file with.
+                If greater than 1, the file is split into line-aligned byte
+                ranges which are parsed in parallel. Workers memory-map the
+                alias index, so they share a single copy of it. The keys and
+                examples are the same as when parsing serially. Links are
+                always parsed serially with stream_gzip.
+            range_size: the approximate size in bytes of each of those ranges.
+            metrics: the build_metrics.BuildMetrics to report the progress of
+                generating examples to. Creates one if None.
+            spill_dir: the directory to create the temporary spill file of the
+                links of each taxon in for the split_by_taxon configs. Uses
+                the default temporary directory if None.
+        """
         super().__init__(data_dir=data_dir, **kwargs)
+        self.stream_gzip = stream_gzip
+        self.alias_index_dir = alias_index_dir
+        self.num_workers = num_workers
+        self.range_size = range_size
+        self.metrics = build_metrics.for_builder(self, metrics)
+        self.spill_dir = spill_dir
+        self._taxon_spill_dir = None
 
     def _info(self):
         return tfds.core.DatasetInfo(
@@ -48,12 +291,16 @@ class StringLinks(tfds.core.GeneratorBasedBuilder):
         )
 
     def _split_generators(self, dl_manager):
-        files = dl_manager.download_and_extract(
-            {
-                "alias_file": _ALIASES_DOWNLOAD,
-                "links_file": StringLinks._DOWNLOAD_URL,
-            }
-        )
+        urls = {
+            "alias_file": _ALIASES_DOWNLOAD,
+            "links_file": StringLinks._DOWNLOAD_URL,
+        }
+        if self.stream_gzip:
+            files = dl_manager.download(urls)
+        else:
+            files = dl_manager.download_and_extract(urls)
+        if self.builder_config.split_by_taxon:
+            return self._taxon_split_generators(files)
         return [
             tfds.core.SplitGenerator(
                 name=tfds.Split.TRAIN,
@@ -61,38 +308,155 @@ class StringLinks(tfds.core.GeneratorBasedBuilder):
             ),
         ]
 
-    def _create_alias_map(self, alias_file):
-        string_to_uniprot = {}
-        with open(alias_file) as f:
-            next(f)
-            for line in f:
-                items = line.split("\t")
-                source = items[-1]
-                if _UNIPROT_ALIAS_KEY in source.split():
-                    string_name = items[0]
-                    uniprot_ac = items[1]
-                    string_to_uniprot[string_name] = uniprot_ac
-        return string_to_uniprot
-
-    def _generate_examples(self, alias_file, links_file):
-        string_to_uniprot = self._create_alias_map(alias_file)
-
-        with open(links_file) as f:
-            next(f)
-            for line in f:
-                items = line.split(" ")
-                p1, p2 = items[0], items[1]
-
-                u1 = string_to_uniprot.get(p1, None)
-                if not u1:
-                    continue
-
-                u2 = string_to_uniprot.get(p2, None)
-                if not u2:
-                    continue
-
-                yield {
-                    "uniprot_acc_1": u1,
-                    "uniprot_acc_2": u2,
-                    "score": float(items[-1]) / 1000.0,
-                }
+    def _taxon_split_generators(self, files):
+        if self.stream_gzip:
+            raise ValueError(
+                "The split_by_taxon configs need to seek in the links file, so "
+                "they do not support stream_gzip."
+            )
+        # We parse the file once, writing the links of each taxon to a spill
+        # file as we go. Each split then only reads the records of its taxon.
+        alias_index_dir = self._get_alias_index_dir(files["alias_file"])
+        self._taxon_spill_dir = tempfile.mkdtemp(dir=self.spill_dir)
+        taxon_file = os.path.join(self._taxon_spill_dir, "links-by-taxon")
+        taxon_offsets = collections.defaultdict(list)
+        with spill.SpillWriter(taxon_file) as writer:
+            for links in self._parse_links_ranges(files["links_file"], alias_index_dir):
+                self._count_links(links)
+                for taxon, taxon_links in _split_by_taxon(links):
+                    taxon_offsets[taxon].append(writer.write(taxon_links))
+        taxa = sorted(taxon_offsets)
+        return [
+            tfds.core.SplitGenerator(
+                name=taxon_split(taxon),
+                gen_kwargs={
+                    "taxon_file": taxon_file,
+                    "taxon_offsets": taxon_offsets[taxon],
+                    "last_taxon": taxon == taxa[-1],
+                },
+            )
+            for taxon in taxa
+        ]
+
+    def download_and_prepare(self, *args, **kwargs):
+        try:
+            super().download_and_prepare(*args, **kwargs)
+        finally:
+            if self._taxon_spill_dir:
+                shutil.rmtree(self._taxon_spill_dir, ignore_errors=True)
+                self._taxon_spill_dir = None
+        if self.builder_config.split_by_taxon:
+            self._write_taxon_manifest()
+
+    def _write_taxon_manifest(self):
+        manifest = {}
+        for name, split_info in self.info.splits.items():
+            taxon = name[len("taxon_") :]
+            manifest[taxon] = {
+                "split": name,
+                "num_examples": split_info.num_examples,
+                "shards": split_info.filenames,
+            }
+        path = os.path.join(self.data_dir, _TAXON_MANIFEST_FILENAME)
+        with tf.io.gfile.GFile(path, "w") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+
+    def taxon_manifest(self):
+        """Returns the taxa of a prepared split_by_taxon config.
+
+        Returns:
+            A dict from NCBI taxon id, as a str, to a dict with the "split"
+            name, its "num_examples" and the file names of its "shards".
+        """
+        path = os.path.join(self.data_dir, _TAXON_MANIFEST_FILENAME)
+        with tf.io.gfile.GFile(path, "r") as f:
+            return json.load(f)
+
+    def _open(self, path):
+        if self.stream_gzip:
+            return gzip_stream.open_gzip(path, "rb")
+        else:
+            return open(path, "rb")
+
+    def _get_alias_index_dir(self, alias_file):
+        directory = self.alias_index_dir or f"{alias_file}.uniprot_index"
+        # Makes sure that the index has been built.
+        with self.metrics.timed("alias_index"):
+            string_alias_index.StringAliasIndex.build_or_load(
+                alias_file, directory, open_fn=self._open
+            )
+        return directory
+
+    def _generate_examples(
+        self,
+        alias_file=None,
+        links_file=None,
+        taxon_file=None,
+        taxon_offsets=None,
+        last_taxon=False,
+    ):
+        if taxon_file is None:
+            yield from self.metrics.track(
+                self._iter_links_examples(alias_file, links_file),
+                build_metrics.default_output_path(self),
+            )
+            return
+        # The links were parsed and counted in _taxon_split_generators, so the
+        # summary is only logged and written once, after the last taxon.
+        examples = (
+            example
+            for links in spill.iter_spill_at(taxon_file, taxon_offsets)
+            for example in _iter_examples(links)
+        )
+        yield from self.metrics.track(
+            examples, build_metrics.default_output_path(self), finish=last_taxon
+        )
+
+    def _count_links(self, links):
+        self.metrics.count("parse", "bytes_read", links["num_bytes"])
+        self.metrics.count("parse", "records", links["num_lines"])
+        for reason, n in links["dropped"].items():
+            self.metrics.drop("parse", reason, n)
+
+    def _iter_links_examples(self, alias_file, links_file):
+        alias_index_dir = self._get_alias_index_dir(alias_file)
+        if self.num_workers > 1 and not self.stream_gzip:
+            all_links = self._parse_links_ranges(links_file, alias_index_dir)
+        else:
+            all_links = self._parse_links_serial(links_file, alias_index_dir)
+        for links in all_links:
+            self._count_links(links)
+            yield from _iter_examples(links)
+
+    def _parse_links_serial(self, links_file, alias_index_dir):
+        alias_index = _load_alias_index(alias_index_dir)
+        offset = 0
+        with self._open(links_file) as f:
+            for block in tsv.iter_blocks(f):
+                yield _parse_links_block(
+                    block,
+                    offset,
+                    alias_index,
+                    min_score=self.builder_config.min_score,
+                    same_species_only=self.builder_config.same_species_only,
+                )
+                offset += len(block)
+
+    def _parse_links_ranges(self, links_file, alias_index_dir):
+        """Parses the ranges of the extracted links file, in parallel if we can."""
+        args_list = [
+            (
+                links_file,
+                start,
+                end,
+                alias_index_dir,
+                self.builder_config.min_score,
+                self.builder_config.same_species_only,
+            )
+            for start, end in parallel.split_into_ranges(links_file, self.range_size)
+        ]
+        if self.num_workers > 1:
+            return parallel.ordered_imap(
+                _parse_links_range, args_list, self.num_workers
+            )
+        return (_parse_links_range(*args) for args in args_list)
@@ -1,10 +1,22 @@
 """The UniRef50 dataset."""
+import io
+import os
+
 from Bio import SeqIO
 
+import numpy as np
 import tensorflow as tf
 import tensorflow_datasets.public_api as tfds
 
+from bio_tfds import amino_acids
+from bio_tfds import build_metrics
+from bio_tfds import checkpoint
+from bio_tfds import delta
+from bio_tfds import gzip_stream
+from bio_tfds import parallel
 from bio_tfds.constants import DEFAULT_TFDS_DATA_DIR
+from bio_tfds.protein import fasta
+from bio_tfds.protein import record_index
 
 _DOWNLOAD_URL = "ftp://ftp.uniprot.org/pub/databases/uniprot/current_release/uniref/uniref50/uniref50.fasta.gz"
 
@@ -79,13 +91,180 @@ def _extract_example(seq):
     }
 
 
+def _extract_example_from_bytes(header, sequence):
+    # This is equivalent to _extract_example, but it makes a single pass over
+    # the words of the raw header. The unique_identifier always starts with
+    # "UniRef", so we can skip it when looking for the other fields.
+    unique_identifier, *words = header.decode("utf-8").split()
+
+    cluster_name = []
+    tax_name = []
+    num_members = tax_id = representative_member = None
+    in_cluster_name = True
+    in_tax_name = False
+    tax_name_done = False
+    for word in words:
+        if word.startswith("n="):
+            in_cluster_name = False
+            if num_members is None:
+                num_members = word[2:]
+        elif in_cluster_name:
+            cluster_name.append(word)
+
+        if not tax_name_done:
+            if word.startswith("Tax="):
+                in_tax_name = True
+                tax_name.append(word[4:])
+            elif in_tax_name and "=" in word:
+                tax_name_done = True
+            elif in_tax_name:
+                tax_name.append(word)
+
+        if tax_id is None and word.startswith("TaxID="):
+            tax_id = word[6:]
+        elif representative_member is None and word.startswith("RepID="):
+            representative_member = word[6:]
+
+    return {
+        "unique_identifier": unique_identifier,
+        "cluster_name": " ".join(cluster_name),
+        "num_members": int(num_members),
+        "tax_name": " ".join(tax_name),
+        "tax_id": tax_id,
+        "representative_member": representative_member,
+        "aa_sequence": sequence.decode("utf-8"),
+    }
+
+
+def sequence_features(config):
+    """Returns the features that store the AA sequence with a config."""
+    features = {
+        # The number of amino acids in the sequence.
+        "aa_length": tf.int32,
+    }
+    if config.pack_sequences:
+        # The AA sequence as amino_acids tokens packed at 5 bits per token.
+        # It is unpacked into "aa_tokens" when reading.
+        features["aa_packed"] = tfds.features.Tensor(shape=(), dtype=tf.string)
+        return features
+    # The uppercase AA sequence of the protein.
+    features["aa_sequence"] = tfds.features.Text()
+    if config.encode_sequences:
+        # The AA sequence as amino_acids tokens.
+        features["aa_tokens"] = tfds.features.Tensor(shape=(None,), dtype=tf.uint8)
+    return features
+
+
+def add_sequence_features(example, config):
+    """Replaces the "aa_sequence" of an example by the features of a config."""
+    # Every character is encoded as a single token, so this is also the
+    # number of tokens.
+    example["aa_length"] = len(example["aa_sequence"])
+    if config.encode_sequences or config.pack_sequences:
+        tokens = amino_acids.encode(example["aa_sequence"])
+        if config.pack_sequences:
+            example["aa_packed"] = amino_acids.pack(tokens)
+            del example["aa_sequence"]
+        else:
+            example["aa_tokens"] = tokens
+    return example
+
+
+def unpack_sequence(x):
+    """Replaces the "aa_packed" of a packed example by its "aa_tokens"."""
+    x = dict(x)
+    x["aa_tokens"] = amino_acids.tf_unpack(x.pop("aa_packed"), x["aa_length"])
+    return x
+
+
+def _parse_fasta_range(fasta_file, start, end, config):
+    """Parses a range of a FASTA file.
+
+    Returns:
+        A list of the examples of the range and the (keys, hashes) of their
+        records, as returned by _hash_records.
+    """
+    data = parallel.read_range(fasta_file, start, end)
+    records = list(fasta.iter_fasta_records(io.BytesIO(data)))
+    examples = [
+        _extract_example_from_bytes(header, sequence) for header, sequence in records
+    ]
+    # We encode the sequences in the workers to keep the work off of the
+    # main process.
+    examples = [add_sequence_features(example, config) for example in examples]
+    return examples, _hash_records(records)
+
+
+def _hash_records(records):
+    """Returns the keys and content hashes of some (header, sequence) records.
+
+    The unique_identifier is the first word of the header, and the hash is of
+    the raw header and sequence.
+    """
+    keys = [header.split(None, 1)[0] for header, _ in records]
+    hashes = [delta.content_hash(header, sequence) for header, sequence in records]
+    return np.asarray(keys, dtype=bytes), np.asarray(hashes, dtype=np.uint64)
+
+
+def _hash_fasta_range(fasta_file, start, end):
+    data = parallel.read_range(fasta_file, start, end)
+    return _hash_records(list(fasta.iter_fasta_records(io.BytesIO(data))))
+
+
+def _parse_changed_fasta_range(fasta_file, start, end, config, previous_hashes_dir):
+    """Hashes a range and parses its records that are not in the previous version.
+
+    Returns:
+        The (keys, hashes) of every record of the range and a list of the
+        examples of the added or modified records.
+    """
+    data = parallel.read_range(fasta_file, start, end)
+    records = list(fasta.iter_fasta_records(io.BytesIO(data)))
+    keys, hashes = _hash_records(records)
+    previous = delta.RecordHashes.load(previous_hashes_dir)
+    found, previous_hashes = previous.lookup(keys)
+    examples = [
+        add_sequence_features(_extract_example_from_bytes(*records[i]), config)
+        for i in np.flatnonzero(~found | (previous_hashes != hashes))
+    ]
+    return keys, hashes, examples
+
+
+# Version 1.1.0 stores the "aa_length" of the sequences in every config.
+_VERSION = tfds.core.Version("1.1.0")
+
+
+class UniRef50Config(tfds.core.BuilderConfig):
+    def __init__(self, *, encode_sequences=False, pack_sequences=False, **kwargs):
+        super().__init__(version=_VERSION, **kwargs)
+        # If True, the sequences are also stored as amino_acids tokens.
+        self.encode_sequences = encode_sequences
+        # If True, the sequences are only stored as packed amino_acids tokens,
+        # which take up about 5/8 of the space of the text.
+        self.pack_sequences = pack_sequences
+
+
 class UniRef50(tfds.core.GeneratorBasedBuilder):
     """The UniRef50 dataset."""
 
-    VERSION = tfds.core.Version("1.0.0")
+    VERSION = _VERSION
 
     UNSTABLE = "The current_release is updated every 8 weeks."
 
+    BUILDER_CONFIGS = [
+        UniRef50Config(name="default", description="The sequences as text."),
+        UniRef50Config(
+            name="encoded",
+            description="The sequences as text and as amino acid tokens.",
+            encode_sequences=True,
+        ),
+        UniRef50Config(
+            name="packed",
+            description="The sequences as amino acid tokens packed at 5 bits per token.",
+            pack_sequences=True,
+        ),
+    ]
+
     @staticmethod
     def extract_uniprot_acc(unique_identifier):
         if isinstance(unique_identifier, (str, bytes)):
@@ -93,54 +272,383 @@ class UniRef50(tfds.core.GeneratorBasedBuilder):
         else:
             raise ValueError("TODO(mmatena): Support tf.string tensors.")
 
-    def __init__(self, data_dir=DEFAULT_TFDS_DATA_DIR, **kwargs):
+    def __init__(
+        self,
+        data_dir=DEFAULT_TFDS_DATA_DIR,
+        fasta_parser="bytes",
+        num_workers=1,
+        range_size=parallel.DEFAULT_RANGE_SIZE,
+        stream_gzip=False,
+        metrics=None,
+        checkpoint_dir=None,
+        previous_data_dir=None,
+        **kwargs,
+    ):
+        """Creates the builder.
+
+        Args:
+            data_dir: the tfds data directory.
+            fasta_parser: how to parse the FASTA file when generating examples.
+                Either "bytes" to use our own fast byte-level reader or "seqio"
+                to use Bio.SeqIO. Both produce the same examples.
+            num_workers: the number of processes to parse the FASTA file with
+                when generating examples. If greater than 1, the file is split
+                into byte ranges aligned to record boundaries which are parsed
+                in parallel. The examples and their keys are the same as when
+                generating serially. Only used with the "bytes" parser.
+            range_size: the approximate size in bytes of each of those ranges.
+            stream_gzip: if True, we parse the downloaded .gz file directly
+                while it is decompressed in a background thread instead of
+                extracting it to disk first. This saves the scratch space for
+                the decompressed copy. Since the decompressed file has no
+                random access, examples are generated serially.
+            metrics: the build_metrics.BuildMetrics to report the progress of
+                generating examples to. Creates one if None.
+            checkpoint_dir: if set, the examples generated from each range of
+                the FASTA file are committed to a checkpoint.Checkpoint in a
+                subdirectory of this local directory. A build that was
+                interrupted then resumes from the last committed range. The
+                checkpoint is removed once the dataset is prepared. Requires
+                the "bytes" parser and no stream_gzip.
+            previous_data_dir: if set, do a delta build against the dataset
+                of the same version and config prepared in this tfds data
+                directory by a previous release, which must be a different
+                directory than data_dir. Only the added and modified clusters
+                are parsed, and the examples of the others are read back from
+                the previous shards. The added, removed and modified clusters
+                are written to train-changelog.json. Builds with the "bytes"
+                parser save the content hashes of the records that this
+                needs. Can't be used with stream_gzip or a checkpoint_dir.
+        """
         super().__init__(data_dir=data_dir, **kwargs)
+        if fasta_parser not in ("bytes", "seqio"):
+            raise ValueError(f"Unknown fasta_parser: {fasta_parser}")
+        if checkpoint_dir and (fasta_parser != "bytes" or stream_gzip):
+            raise ValueError(
+                'A checkpoint_dir requires the "bytes" fasta_parser and no stream_gzip.'
+            )
+        if previous_data_dir and (stream_gzip or checkpoint_dir):
+            raise ValueError(
+                "A previous_data_dir can't be used with stream_gzip or a checkpoint_dir."
+            )
+        self.fasta_parser = fasta_parser
+        self.num_workers = num_workers
+        self.range_size = range_size
+        self.stream_gzip = stream_gzip
+        self.metrics = build_metrics.for_builder(self, metrics)
+        self.checkpoint_dir = checkpoint_dir
+        self.previous_data_dir = previous_data_dir
+        self._record_indices = {}
+        # What the last generation found, to save with the prepared dataset.
+        self._record_hashes = None
+        self._changes = None
 
     def _info(self):
+        features = {
+            # The primary accession number of the UniRef cluster.
+            # The UniRef50 identifier is generated by placing
+            # "UniRef50_" prefix before the UniProtKB accession number
+            # or UniParc identifier of the representative UniProtKB or UniParc entry.
+            "unique_identifier": tfds.features.Text(),
+            # The name of the UniRef cluster.
+            "cluster_name": tfds.features.Text(),
+            # The number of UniRef cluster members.
+            "num_members": tf.int32,
+            # The scientific name of the lowest common taxon shared by all
+            # UniRef cluster members.
+            "tax_name": tfds.features.Text(),
+            # Thee id of the lowest common taxon shared by all
+            # UniRef cluster members.
+            "tax_id": tfds.features.Text(),
+            # The entry name of the representative member of the
+            # UniRef cluster.
+            "representative_member": tfds.features.Text(),
+        }
+        features.update(sequence_features(self.builder_config))
         return tfds.core.DatasetInfo(
             builder=self,
             description=_DESCRIPTION,
-            features=tfds.features.FeaturesDict(
-                {
-                    # The primary accession number of the UniRef cluster.
-                    # The UniRef50 identifier is generated by placing
-                    # "UniRef50_" prefix before the UniProtKB accession number
-                    # or UniParc identifier of the representative UniProtKB or UniParc entry.
-                    "unique_identifier": tfds.features.Text(),
-                    # The name of the UniRef cluster.
-                    "cluster_name": tfds.features.Text(),
-                    # The number of UniRef cluster members.
-                    "num_members": tf.int32,
-                    # The scientific name of the lowest common taxon shared by all
-                    # UniRef cluster members.
-                    "tax_name": tfds.features.Text(),
-                    # Thee id of the lowest common taxon shared by all
-                    # UniRef cluster members.
-                    "tax_id": tfds.features.Text(),
-                    # The entry name of the representative member of the
-                    # UniRef cluster.
-                    "representative_member": tfds.features.Text(),
-                    # The uppercase AA sequence of the protein.
-                    "aa_sequence": tfds.features.Text(),
-                }
-            ),
+            features=tfds.features.FeaturesDict(features),
             homepage="https://www.uniprot.org/help/uniref",
             citation=_CITATION,
         )
 
     def _split_generators(self, dl_manager):
-        extracted_path = dl_manager.download_and_extract(_DOWNLOAD_URL)
+        if self.stream_gzip:
+            path = dl_manager.download(_DOWNLOAD_URL)
+        else:
+            path = dl_manager.download_and_extract(_DOWNLOAD_URL)
         return [
             tfds.core.SplitGenerator(
                 name=tfds.Split.TRAIN,
                 gen_kwargs={
-                    "fasta_file": extracted_path,
+                    "fasta_file": path,
                 },
             ),
         ]
 
+    def _open_fasta(self, fasta_file, mode):
+        if self.stream_gzip:
+            return gzip_stream.open_gzip(fasta_file, mode)
+        else:
+            return tf.io.gfile.GFile(fasta_file, mode)
+
     def _generate_examples(self, fasta_file):
-        with tf.io.gfile.GFile(fasta_file) as f:
+        yield from self.metrics.track(
+            self._iter_examples(fasta_file),
+            build_metrics.default_output_path(self),
+        )
+
+    def _iter_examples(self, fasta_file):
+        # The content hash of every record is collected while the examples
+        # are generated, so that download_and_prepare can save them for the
+        # delta build of the next release. SeqIO does not give us the raw
+        # records to hash, so builds with it save none.
+        if self.previous_data_dir:
+            yield from self._generate_examples_delta(fasta_file)
+            return
+        hashes = None if self.fasta_parser == "seqio" else delta.RecordHashesBuilder()
+        yield from self._iter_all_examples(fasta_file, hashes)
+        self._record_hashes = None if hashes is None else hashes.build()
+
+    def _iter_all_examples(self, fasta_file, hashes):
+        if self.checkpoint_dir:
+            yield from self._generate_examples_checkpointed(fasta_file, hashes)
+            return
+        if (
+            self.num_workers > 1
+            and self.fasta_parser == "bytes"
+            and not self.stream_gzip
+        ):
+            # The workers add the sequence features.
+            yield from self._generate_examples_parallel(fasta_file, hashes)
+            return
+        if self.fasta_parser == "seqio":
+            examples = self._generate_examples_seqio(fasta_file)
+        else:
+            examples = self._generate_examples_bytes(fasta_file, hashes)
+        for key, example in examples:
+            yield key, add_sequence_features(example, self.builder_config)
+        # We can't tell how far into the file we are while parsing it
+        # serially, so the bytes are only counted at the end.
+        self.metrics.count("parse", "bytes_read", tf.io.gfile.stat(fasta_file).length)
+
+    def _as_dataset(self, *args, **kwargs):
+        ds = super()._as_dataset(*args, **kwargs)
+        if self.builder_config.pack_sequences:
+            ds = ds.map(
+                unpack_sequence, num_parallel_calls=tf.data.experimental.AUTOTUNE
+            )
+        return ds
+
+    def download_and_prepare(self, *args, **kwargs):
+        """Prepares the dataset and builds the record index of each split.
+
+        If examples were generated, it also saves the content hashes of their
+        records and, for a delta build, the changelog.
+        """
+        super().download_and_prepare(*args, **kwargs)
+        if self.checkpoint_dir:
+            checkpoint.remove(self._checkpoint_directory())
+        if self._record_hashes is not None:
+            self._record_hashes.save(delta.hashes_directory(self.data_dir, "train"))
+            self._record_hashes = None
+        if self._changes is not None:
+            delta.write_changelog(
+                delta.changelog_path(self.data_dir, "train"), self._changes
+            )
+            self._changes = None
+        for split in self.info.splits:
+            self.record_index(split)
+
+    def record_index(self, split="train"):
+        """Returns the record_index.RecordIndex of a prepared split.
+
+        The index maps the unique_identifier of each example to its record in
+        the shards. It is saved next to the shards the first time, so it only
+        needs to be built once for datasets prepared before it existed.
+        """
+        if split not in self._record_indices:
+            self._record_indices[split] = record_index.build_or_load_split(
+                self.data_dir, self.name, split, key_feature="unique_identifier"
+            )
+        return self._record_indices[split]
+
+    def lookup(self, unique_identifiers, split="train"):
+        """Reads the examples of some UniRef50 clusters without a full scan.
+
+        Args:
+            unique_identifiers: the unique_identifier of each cluster, such as
+                "UniRef50_Q8WZ42".
+            split: the split to read from.
+
+        Returns:
+            A list with the example of each cluster as a dict of NumPy values,
+            in the format of as_dataset, or None for clusters not in the
+            split.
+        """
+        records = self.record_index(split).read(self.data_dir, unique_identifiers)
+        found = [record for record in records if record is not None]
+        if not found:
+            return records
+        ds = tf.data.Dataset.from_tensor_slices(found)
+        ds = ds.map(
+            self.info.features.deserialize_example,
+            num_parallel_calls=tf.data.experimental.AUTOTUNE,
+        )
+        if self.builder_config.pack_sequences:
+            ds = ds.map(
+                unpack_sequence, num_parallel_calls=tf.data.experimental.AUTOTUNE
+            )
+        examples = iter(tfds.as_numpy(ds))
+        return [None if record is None else next(examples) for record in records]
+
+    def _generate_examples_seqio(self, fasta_file):
+        with self._open_fasta(fasta_file, "r") as f:
             for seq in SeqIO.parse(f, "fasta"):
                 example = _extract_example(seq)
+                self.metrics.count("parse", "records")
+                yield example["unique_identifier"], example
+
+    def _generate_examples_bytes(self, fasta_file, hashes):
+        with self._open_fasta(fasta_file, "rb") as f:
+            for header, sequence in fasta.iter_fasta_records(f):
+                example = _extract_example_from_bytes(header, sequence)
+                hashes.add(
+                    example["unique_identifier"],
+                    delta.content_hash(header, sequence),
+                )
+                self.metrics.count("parse", "records")
                 yield example["unique_identifier"], example
+
+    def _generate_examples_parallel(self, fasta_file, hashes):
+        with self.metrics.timed("split_ranges"):
+            ranges = parallel.split_into_ranges(
+                fasta_file, range_size=self.range_size, record_start=b">"
+            )
+        args_list = [
+            (fasta_file, start, end, self.builder_config) for start, end in ranges
+        ]
+        results = parallel.ordered_imap(_parse_fasta_range, args_list, self.num_workers)
+        for (start, end), (examples, range_hashes) in zip(ranges, results):
+            self.metrics.count("parse", "bytes_read", end - start)
+            self.metrics.count("parse", "records", len(examples))
+            hashes.extend(*range_hashes)
+            for example in examples:
+                yield example["unique_identifier"], example
+
+    def _checkpoint_directory(self):
+        return os.path.join(self.checkpoint_dir, self.info.full_name)
+
+    def _generate_examples_checkpointed(self, fasta_file, hashes):
+        stat = tf.io.gfile.stat(fasta_file)
+        ckpt = checkpoint.Checkpoint(
+            self._checkpoint_directory(),
+            # The examples only depend on the FASTA file and the config.
+            fingerprint={
+                "fasta_file": fasta_file,
+                "length": stat.length,
+                "mtime_nsec": stat.mtime_nsec,
+            },
+            log=self.metrics.log,
+        )
+        for key, example in ckpt.iter_committed():
+            self.metrics.count("checkpoint", "resumed_records")
+            yield key, example
+        self.metrics.count("parse", "bytes_read", ckpt.position)
+        if ckpt.position:
+            # The chunks only hold the examples, so the records they came from
+            # are hashed again. This only happens when resuming.
+            with self.metrics.timed("hash_resumed"):
+                resumed_ranges = parallel.split_into_ranges(
+                    fasta_file,
+                    range_size=self.range_size,
+                    record_start=b">",
+                    end=ckpt.position,
+                )
+                for range_hashes in self._map_fasta_ranges(
+                    _hash_fasta_range, fasta_file, resumed_ranges
+                ):
+                    hashes.extend(*range_hashes)
+
+        ranges = []
+        if ckpt.position < stat.length:
+            with self.metrics.timed("split_ranges"):
+                ranges = parallel.split_into_ranges(
+                    fasta_file,
+                    range_size=self.range_size,
+                    record_start=b">",
+                    start=ckpt.position,
+                )
+        results = self._map_fasta_ranges(
+            _parse_fasta_range, fasta_file, ranges, self.builder_config
+        )
+        for (start, end), (examples, range_hashes) in zip(ranges, results):
+            self.metrics.count("parse", "bytes_read", end - start)
+            self.metrics.count("parse", "records", len(examples))
+            hashes.extend(*range_hashes)
+            yield from ckpt.commit(
+                ((x["unique_identifier"], x) for x in examples), start, end
+            )
+            self.metrics.count("checkpoint", "chunks")
+
+    def _map_fasta_ranges(self, fn, fasta_file, ranges, *args):
+        """Returns an iterator of fn(fasta_file, start, end, *args) per range.
+
+        The calls are made in num_workers processes if there are several.
+        """
+        args_list = [(fasta_file, start, end) + args for start, end in ranges]
+        if self.num_workers > 1:
+            return parallel.ordered_imap(fn, args_list, self.num_workers)
+        return (fn(*args) for args in args_list)
+
+    def _generate_examples_delta(self, fasta_file):
+        previous = UniRef50(
+            data_dir=self.previous_data_dir, config=self.builder_config.name
+        )
+        previous_hashes_dir = delta.hashes_directory(previous.data_dir, "train")
+        if not delta.RecordHashes.exists(previous_hashes_dir):
+            raise ValueError(
+                f"There are no record hashes in {previous_hashes_dir}. The previous "
+                "version must be prepared with the same version and config by a "
+                "build that saves them."
+            )
+
+        with self.metrics.timed("split_ranges"):
+            ranges = parallel.split_into_ranges(
+                fasta_file, range_size=self.range_size, record_start=b">"
+            )
+        results = self._map_fasta_ranges(
+            _parse_changed_fasta_range,
+            fasta_file,
+            ranges,
+            self.builder_config,
+            previous_hashes_dir,
+        )
+        hashes = delta.RecordHashesBuilder()
+        for (start, end), (keys, range_hashes, examples) in zip(ranges, results):
+            self.metrics.count("parse", "bytes_read", end - start)
+            self.metrics.count("parse", "records", len(keys))
+            self.metrics.count("delta", "parsed", len(examples))
+            hashes.extend(keys, range_hashes)
+            for example in examples:
+                yield example["unique_identifier"], example
+
+        current = hashes.build()
+        changes = delta.diff(delta.RecordHashes.load(previous_hashes_dir), current)
+        unchanged = delta.iter_records(
+            previous.record_index("train"),
+            previous.data_dir,
+            previous.info.features,
+            changes.unchanged,
+        )
+        for key, example in unchanged:
+            self.metrics.count("delta", "reused")
+            yield key.decode("utf-8"), example
+
+        self._record_hashes = current
+        self._changes = changes
+        self.metrics.log(
+            f"{len(changes.added)} clusters were added, {len(changes.removed)} "
+            f"removed and {len(changes.modified)} modified."
+        )
@@ -0,0 +1,62 @@
+"""Simple on-disk spill files of pickled records.
+
+These are used to hold intermediate data that does not fit in memory, for
+example the partitions of a join. Spill files are meant for local scratch
+space, so we use open() rather than GFile, which is much slower for the many
+small reads that unpickling does.
+"""
+import pickle
+import zlib
+
+
+def partition_of(key, num_partitions):
+    """Returns a stable partition index in [0, num_partitions) for the key.
+
+    Unlike hash(), this is the same across processes and Python runs.
+    """
+    if isinstance(key, str):
+        key = key.encode("utf-8")
+    return zlib.crc32(key) % num_partitions
+
+
+class SpillWriter(object):
+    """Appends pickled records to a file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "wb")
+        self.num_records = 0
+
+    def write(self, record):
+        """Appends a record and returns its offset, for iter_spill_at."""
+        offset = self._file.tell()
+        pickle.dump(record, self._file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.num_records += 1
+        return offset
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def iter_spill(path):
+    """Yields the records written to a spill file in order."""
+    with open(path, "rb") as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def iter_spill_at(path, offsets):
+    """Yields the records of a spill file that start at the given offsets."""
+    with open(path, "rb") as f:
+        for offset in offsets:
+            f.seek(offset)
+            yield pickle.load(f)
@@ -0,0 +1,147 @@
+"""A chunked, columnar TSV reader.
+
+Rather than building a Python object for every row, this reads large blocks of
+a TSV file and parses each requested column of the block into a NumPy array
+with vectorized operations. Only simple TSV files are supported: fields can
+not be quoted or contain delimiters or newlines. Other single-byte delimiters
+than tabs can be used too.
+"""
+import numpy as np
+
+# The approximate number of bytes in each chunk of rows we parse at a time.
+DEFAULT_CHUNK_SIZE = 32 * 1024 * 1024
+
+_NEWLINE = ord("\n")
+_ZERO = ord("0")
+
+
+def _gather(data, starts, ends):
+    """Returns the bytes of each field as a zero-padded uint8 matrix."""
+    width = max(int((ends - starts).max()), 1)
+    indices = starts[:, None] + np.arange(width)
+    mask = indices < ends[:, None]
+    values = data[np.minimum(indices, len(data) - 1)]
+    return np.where(mask, values, 0).astype(np.uint8), mask
+
+
+def parse_ints(data, starts, ends, dtype=np.int32):
+    """Parses the non-negative integer fields data[starts[i]:ends[i]]."""
+    if not len(starts):
+        return np.zeros([0], dtype=dtype)
+    digits, mask = _gather(data, starts, ends)
+    digits = digits.astype(np.int64) - _ZERO
+    if np.any(mask & ((digits < 0) | (digits > 9))) or np.any(ends <= starts):
+        raise ValueError("Found a field that is not a non-negative integer.")
+    # The power of 10 of each digit, counting from the end of the field.
+    positions = starts[:, None] + np.arange(mask.shape[1])
+    exponents = np.maximum(ends[:, None] - positions - 1, 0)
+    values = np.sum(np.where(mask, digits * 10 ** exponents, 0), axis=1)
+    return values.astype(dtype)
+
+
+def parse_strings(data, starts, ends):
+    """Returns the fields data[starts[i]:ends[i]] as a NumPy bytes array."""
+    if not len(starts):
+        return np.zeros([0], dtype="S1")
+    chars, _ = _gather(data, starts, ends)
+    return np.ascontiguousarray(chars).view(f"S{chars.shape[1]}").ravel()
+
+
+def split_fields(block, num_columns, delimiter=b"\t"):
+    """Finds the fields of a block of complete rows.
+
+    Args:
+        block: bytes of complete rows, each ending in a newline.
+        num_columns: the number of columns in each row.
+        delimiter: the single byte that separates the columns.
+
+    Returns:
+        A (data, starts, ends) tuple. The data is a uint8 view of the block.
+        The starts and ends are [num_rows, num_columns] arrays with the
+        offsets of each field in the data.
+    """
+    data = np.frombuffer(block, dtype=np.uint8)
+    delimiter = ord(delimiter)
+    delimiters = np.flatnonzero((data == delimiter) | (data == _NEWLINE))
+    if len(delimiters) % num_columns:
+        raise ValueError(f"Found a row that does not have {num_columns} columns.")
+    ends = delimiters.reshape([-1, num_columns])
+    if np.any(data[ends[:, -1]] != _NEWLINE) or np.any(data[ends[:, :-1]] != delimiter):
+        raise ValueError(f"Found a row that does not have {num_columns} columns.")
+    starts = np.empty_like(ends)
+    starts[0, 0] = 0
+    starts[1:, 0] = ends[:-1, -1] + 1
+    starts[:, 1:] = ends[:, :-1] + 1
+    return data, starts, ends
+
+
+def iter_blocks(f, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yields blocks of complete lines read from a binary file.
+
+    Every block ends in a newline, which is added to the last line of the
+    file if it is missing.
+    """
+    pending = b""
+    while True:
+        block = f.read(chunk_size)
+        if not block:
+            break
+        pending += block
+        last_newline = pending.rfind(b"\n")
+        if last_newline < 0:
+            continue
+        yield pending[: last_newline + 1]
+        pending = pending[last_newline + 1 :]
+    if pending:
+        yield pending + b"\n"
+
+
+def iter_column_chunks(
+    f,
+    columns,
+    int_columns=None,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    delimiter=b"\t",
+    column_names=None,
+):
+    """Yields chunks of rows of a TSV file with a header as NumPy columns.
+
+    Args:
+        f: a file-like object opened in binary mode. The first line must be a
+            header with the names of the columns.
+        columns: the names of the columns to parse.
+        int_columns: a dict from the names of the columns in `columns` that
+            contain non-negative integers to the NumPy dtype to parse them as.
+            All other columns are returned as NumPy bytes arrays.
+        chunk_size: the approximate number of bytes in each chunk.
+        delimiter: the single byte that separates the columns.
+        column_names: if given, the names of the columns in the file. The
+            header line is then skipped instead of being used for the names.
+
+    Yields:
+        Dicts from column name to a 1-D array with one entry per row in the
+        chunk. Every row of the file appears in exactly one chunk, in order.
+    """
+    int_columns = int_columns or {}
+
+    header = None
+    for block in iter_blocks(f, chunk_size=chunk_size):
+        if header is None:
+            header_line, _, block = block.partition(b"\n")
+            header = column_names or (
+                header_line.rstrip(b"\r").decode("utf-8").split(delimiter.decode())
+            )
+            column_indices = {name: header.index(name) for name in columns}
+        if not block:
+            continue
+
+        data, starts, ends = split_fields(block, len(header), delimiter=delimiter)
+        chunk = {}
+        for name, index in column_indices.items():
+            if name in int_columns:
+                chunk[name] = parse_ints(
+                    data, starts[:, index], ends[:, index], dtype=int_columns[name]
+                )
+            else:
+                chunk[name] = parse_strings(data, starts[:, index], ends[:, index])
+        yield chunk
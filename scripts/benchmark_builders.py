@@ -0,0 +1,304 @@
+"""Benchmarks generating and reading every builder on synthetic fixtures.
+
+For each scale, seeded synthetic input files are written with
+synthetic_fixtures, so no download or network access is needed. Then each
+builder is run in three stages:
+    generate: iterating over _generate_examples.
+    prepare: download_and_prepare, which also writes the shards.
+    read: iterating over as_dataset for every split.
+Each stage runs in a fresh process, so its peak RSS is its own. The
+UniRef50WithPfamRegions stages prepare the UniRef50 and Pfam datasets first
+if needed, outside of the timings. Side indices that a builder saves the first
+time, like the alias index of StringLinks, are built in the first stage.
+
+The results are printed as JSON, with the records/sec, MB/sec and peak RSS of
+every builder, scale and stage. The MB/sec of generate and prepare is of the
+input files and that of read is of the shards. Compare the JSON of two commits
+to find regressions.
+
+Usage: python scripts/benchmark_builders.py [--scales 1000 10000]
+    [--builders uniref50 pfam ...] [--output results.json]
+"""
+import argparse
+import collections
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import tensorflow as tf
+import tensorflow_datasets as tfds
+
+from bio_tfds import build_metrics
+from bio_tfds.mhc import mhcflurry
+from bio_tfds.protein import hippie
+from bio_tfds.protein import joined
+from bio_tfds.protein import pfam
+from bio_tfds.protein import stringdb
+from bio_tfds.protein import uniref
+
+import synthetic_fixtures
+
+_STAGES = ("generate", "prepare", "read")
+
+# The names of the builders in _specs, in the order they are benchmarked.
+_BUILDERS = (
+    "uniref50",
+    "pfam",
+    "uniref50_with_pfam_regions",
+    "hippie",
+    "string_links",
+    "mhc_binding_affinity",
+)
+
+_Spec = collections.namedtuple(
+    "_Spec", ["builder_cls", "builder_kwargs", "gen_kwargs", "input_files", "deps"]
+)
+
+
+def write_fixtures(directory, scale, seed=0):
+    """Writes the input files of every builder and returns their paths."""
+    num_proteins = max(2, scale // 5)
+    files = {
+        "fasta_file": synthetic_fixtures.write_uniref50_fasta(
+            os.path.join(directory, "uniref50.fasta"), scale, seed=seed
+        ),
+        "tsv_file": synthetic_fixtures.write_pfam_regions_tsv(
+            os.path.join(directory, "regions.tsv"), 2 * scale, scale, seed=seed
+        ),
+        "mitab_file": synthetic_fixtures.write_hippie_mitab(
+            os.path.join(directory, "hippie.mitab.txt"), scale, num_proteins, seed=seed
+        ),
+        "sequence_fasta_file": synthetic_fixtures.write_uniprot_fasta(
+            os.path.join(directory, "uniprot_sprot.fasta"), num_proteins, seed=seed
+        ),
+    }
+    files.update(synthetic_fixtures.write_string_files(directory, scale, seed=seed))
+    mhc_files, _ = synthetic_fixtures.write_mhcflurry_files(
+        directory, scale, num_alleles=min(2000, scale), seed=seed
+    )
+    files.update(mhc_files)
+    return files
+
+
+def _specs(files):
+    """Returns how to build each builder from the files of write_fixtures."""
+    return {
+        "uniref50": _Spec(
+            uniref.UniRef50,
+            builder_kwargs={},
+            gen_kwargs={"fasta_file": files["fasta_file"]},
+            input_files=[files["fasta_file"]],
+            deps=[],
+        ),
+        "pfam": _Spec(
+            pfam.PfamARegionsUniprot,
+            builder_kwargs={},
+            gen_kwargs={"tsv_file": files["tsv_file"]},
+            input_files=[files["tsv_file"]],
+            deps=[],
+        ),
+        "uniref50_with_pfam_regions": _Spec(
+            joined.UniRef50WithPfamRegions,
+            builder_kwargs={},
+            gen_kwargs={"split": "train"},
+            # The inputs are the shards of the dependencies.
+            input_files=[],
+            deps=["uniref50", "pfam"],
+        ),
+        "hippie": _Spec(
+            hippie.Hippie,
+            builder_kwargs={
+                "config": "with_seq",
+                "sequence_source": "fasta",
+                "sequence_fasta_file": files["sequence_fasta_file"],
+            },
+            gen_kwargs={"mitab_file": files["mitab_file"]},
+            input_files=[files["mitab_file"], files["sequence_fasta_file"]],
+            deps=[],
+        ),
+        "string_links": _Spec(
+            stringdb.StringLinks,
+            builder_kwargs={"config": "all"},
+            gen_kwargs={
+                "alias_file": files["alias_file"],
+                "links_file": files["links_file"],
+            },
+            input_files=[files["alias_file"], files["links_file"]],
+            deps=[],
+        ),
+        "mhc_binding_affinity": _Spec(
+            mhcflurry.MhcBindingAffinity,
+            builder_kwargs={},
+            gen_kwargs={
+                "affinity_file": files["affinity_file"],
+                "mhc_sequence_file": files["mhc_sequence_file"],
+            },
+            input_files=[files["affinity_file"], files["mhc_sequence_file"]],
+            deps=[],
+        ),
+    }
+
+
+def _use_fixtures(spec):
+    """Makes the builder class generate from the fixtures instead of downloads.
+
+    This patches the class, so it is only done in the benchmark processes.
+    """
+    if spec.builder_cls is joined.UniRef50WithPfamRegions:
+        # It does not download anything.
+        return
+
+    def split_generators(self, dl_manager):
+        if isinstance(self, mhcflurry.MhcBindingAffinity):
+            self._set_label_names(**spec.gen_kwargs)
+        return [
+            tfds.core.SplitGenerator(name=tfds.Split.TRAIN, gen_kwargs=spec.gen_kwargs)
+        ]
+
+    spec.builder_cls._split_generators = split_generators
+
+
+def _shard_paths(builder):
+    return tf.io.gfile.glob(os.path.join(builder.data_dir, "*.tfrecord*"))
+
+
+def _num_bytes(paths):
+    return sum(tf.io.gfile.stat(path).length for path in paths)
+
+
+def _run_stage(name, stage, files, data_dir, download_dir):
+    specs = _specs(files)
+    for spec in specs.values():
+        _use_fixtures(spec)
+
+    def make_builder(name, **kwargs):
+        spec = specs[name]
+        return spec.builder_cls(data_dir=data_dir, **spec.builder_kwargs, **kwargs)
+
+    spec = specs[name]
+    input_files = list(spec.input_files)
+    for dep in spec.deps:
+        dep_builder = make_builder(dep)
+        dep_builder.download_and_prepare(download_dir=download_dir)
+        input_files.extend(_shard_paths(dep_builder))
+    # The metrics would otherwise be written to the dataset directory, which
+    # tfds would then take for an already prepared dataset.
+    metrics = build_metrics.BuildMetrics(
+        log_interval_seconds=None,
+        output_path=os.path.join(data_dir, f"{name}-{stage}-metrics.json"),
+    )
+    builder = make_builder(name, metrics=metrics)
+
+    start_time = time.time()
+    if stage == "generate":
+        num_records = sum(1 for _ in builder._generate_examples(**spec.gen_kwargs))
+        num_bytes = _num_bytes(input_files)
+    elif stage == "prepare":
+        builder.download_and_prepare(download_dir=download_dir)
+        num_records = sum(s.num_examples for s in builder.info.splits.values())
+        num_bytes = _num_bytes(input_files)
+    else:
+        num_records = 0
+        for split in builder.info.splits:
+            for _ in builder.as_dataset(split=split):
+                num_records += 1
+        num_bytes = _num_bytes(_shard_paths(builder))
+    seconds = time.time() - start_time
+
+    return {
+        "builder": name,
+        "config": builder.builder_config.name if builder.builder_config else None,
+        "stage": stage,
+        "records": num_records,
+        "bytes": num_bytes,
+        "seconds": seconds,
+        "records_per_sec": num_records / seconds,
+        "mb_per_sec": num_bytes / 2 ** 20 / seconds,
+        "peak_rss_mb": build_metrics.peak_rss_bytes() / 2 ** 20,
+        # What the builder reported while generating examples, if it did.
+        "build_metrics": metrics.summary() if stage != "read" else None,
+    }
+
+
+def _put_result(queue, fn, args):
+    queue.put(fn(*args))
+
+
+def _in_new_process(fn, *args):
+    """Returns fn(*args), computed in a new process."""
+    # We don't use a multiprocessing.Pool since its daemonic workers can't
+    # start the worker processes of the builders.
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    process = ctx.Process(target=_put_result, args=(queue, fn, args))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL,
+            text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(scales, builders, output=None, seed=0):
+    results = []
+    for scale in scales:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            fixture_dir = os.path.join(tmp_dir, "fixtures")
+            data_dir = os.path.join(tmp_dir, "data")
+            download_dir = os.path.join(tmp_dir, "downloads")
+            os.makedirs(fixture_dir)
+            files = write_fixtures(fixture_dir, scale, seed=seed)
+            for name in builders:
+                for stage in _STAGES:
+                    result = _in_new_process(
+                        _run_stage, name, stage, files, data_dir, download_dir
+                    )
+                    result["scale"] = scale
+                    results.append(result)
+                    print(
+                        f"{name} {stage} at scale {scale}: "
+                        f"{result['records_per_sec']:.0f} records/sec, "
+                        f"{result['mb_per_sec']:.1f} MB/sec, "
+                        f"{result['peak_rss_mb']:.0f} MB peak RSS",
+                        file=sys.stderr,
+                    )
+
+    report = {
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "tensorflow": tf.__version__,
+        "tensorflow_datasets": tfds.__version__,
+        "seed": seed,
+        "results": results,
+    }
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--scales", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument(
+        "--builders", nargs="+", choices=_BUILDERS, default=list(_BUILDERS)
+    )
+    parser.add_argument("--output", help="Also write the JSON to this file.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    main(args.scales, args.builders, output=args.output, seed=args.seed)
@@ -0,0 +1,71 @@
+"""Compares the storage and read throughput of UniRef50's sequence features.
+
+The "default" config stores the sequences as text, "encoded" adds amino acid
+tokens and "packed" stores only the tokens packed at 5 bits per token, which
+are unpacked in the tf.data pipeline. Runs on a synthetic FASTA file, so no
+download is needed.
+
+Usage: python scripts/benchmark_packed_sequences.py [num_records]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import tensorflow as tf
+import tensorflow_datasets as tfds
+
+from bio_tfds.protein import uniref
+
+import synthetic_fixtures
+
+
+class SyntheticUniRef50(uniref.UniRef50):
+    """Reads a synthetic FASTA file instead of downloading UniRef50."""
+
+    fasta_file = None
+
+    def _split_generators(self, dl_manager):
+        return [
+            tfds.core.SplitGenerator(
+                name=tfds.Split.TRAIN, gen_kwargs={"fasta_file": self.fasta_file}
+            )
+        ]
+
+
+def _shard_bytes(builder):
+    """Returns the total size of the tfrecord shards of a prepared builder."""
+    return sum(
+        os.path.getsize(os.path.join(builder.data_dir, name))
+        for name in os.listdir(builder.data_dir)
+        if ".tfrecord" in name
+    )
+
+
+def _read(ds):
+    """Returns the number of examples in the dataset and the seconds it took."""
+    start_time = time.time()
+    num_examples = 0
+    for _ in ds:
+        num_examples += 1
+    return num_examples, time.time() - start_time
+
+
+def main(num_records):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        SyntheticUniRef50.fasta_file = synthetic_fixtures.write_uniref50_fasta(
+            os.path.join(tmp_dir, "uniref50.fasta"), num_records
+        )
+        for config in ["default", "encoded", "packed"]:
+            builder = SyntheticUniRef50(data_dir=tmp_dir, config=config)
+            builder.download_and_prepare(download_dir=tmp_dir)
+            _, seconds = _read(builder.as_dataset(split="train"))
+            print(
+                f"{config}: {_shard_bytes(builder) / 2 ** 20:.1f} MiB of shards, "
+                f"{num_records / seconds:.0f} records/sec"
+            )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,30 @@
+"""Compares the rows/sec of the TSV readers of PfamARegionsUniprot.
+
+Runs on a synthetic Pfam-A.regions.uniprot.tsv, so no download is needed.
+
+Usage: python scripts/benchmark_pfam_tsv.py [num_rows]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from bio_tfds.protein import pfam
+
+import synthetic_fixtures
+
+
+def main(num_rows):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tsv_file = os.path.join(tmp_dir, "regions.tsv")
+        synthetic_fixtures.write_pfam_regions_tsv(tsv_file, num_rows)
+        for tsv_reader in ["csv", "numpy"]:
+            builder = pfam.PfamARegionsUniprot(data_dir=tmp_dir, tsv_reader=tsv_reader)
+            start_time = time.time()
+            num_examples = sum(1 for _ in builder._generate_examples(tsv_file))
+            elapsed = time.time() - start_time
+            print(f"{tsv_reader}: {num_examples / elapsed:.0f} rows/sec")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
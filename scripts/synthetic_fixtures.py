@@ -0,0 +1,225 @@
+"""Seeded synthetic versions of the files that the builders are generated from.
+
+The files have the same format as the real downloads, so the builders can be
+generated and benchmarked without network access. The same arguments always
+give the same files. The UniProt accessions are shared between the files, so
+the Pfam regions, HIPPIE interactions and STRING links refer to proteins in
+the UniRef50 FASTA file.
+"""
+import os
+import random
+
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+
+_SPECIES = ["HLA", "Patr", "Mamu", "H-2"]
+
+# The taxa of the synthetic STRING proteins.
+_STRING_TAXA = [9606, 10090, 7227]
+
+_PFAM_HEADER = "uniprot_acc\tseq_version\tcrc64\tmd5\tpfamA_acc\tseq_start\tseq_end\n"
+
+_MITAB_COLUMNS = [
+    "ID Interactor A",
+    "ID Interactor B",
+    "Alt IDs Interactor A",
+    "Alt IDs Interactor B",
+    "Aliases Interactor A",
+    "Aliases Interactor B",
+    "Interaction Detection Methods",
+    "First Author",
+    "Publication Identifiers",
+    "Taxid Interactor A",
+    "Taxid Interactor B",
+    "Interaction Types",
+    "Source Databases",
+    "Interaction Identifiers",
+    "Confidence Value",
+    "Presence In Other Species",
+    "Gene Name Interactor A",
+    "Gene Name Interactor B",
+]
+
+
+def accession(i):
+    """Returns the UniProt accession of the i-th synthetic protein."""
+    return f"P{i:08d}"
+
+
+def random_sequence(rng, length):
+    return "".join(rng.choice(AMINO_ACIDS) for _ in range(length))
+
+
+def _random_length(rng):
+    # About the length distribution of UniRef50.
+    return min(int(rng.lognormvariate(5.5, 0.7)) + 10, 5000)
+
+
+def _write_wrapped(f, seq, width=60):
+    for start in range(0, len(seq), width):
+        f.write(seq[start : start + width] + "\n")
+
+
+def write_uniref50_fasta(path, num_records, seed=0):
+    """Writes a UniRef50 FASTA file with the proteins 0 to num_records - 1."""
+    rng = random.Random(seed)
+    with open(path, "w") as f:
+        for i in range(num_records):
+            acc = accession(i)
+            f.write(
+                f">UniRef50_{acc} Uncharacterized protein n={rng.randint(1, 100)} "
+                f"Tax=Homo sapiens TaxID=9606 RepID={acc}_HUMAN\n"
+            )
+            _write_wrapped(f, random_sequence(rng, _random_length(rng)))
+    return path
+
+
+def write_uniprot_fasta(path, num_proteins, seed=0):
+    """Writes a UniProt FASTA file, like the sprot dump, of the proteins."""
+    rng = random.Random(seed)
+    with open(path, "w") as f:
+        for i in range(num_proteins):
+            acc = accession(i)
+            f.write(f">sp|{acc}|{acc}_HUMAN Uncharacterized protein OS=Homo sapiens\n")
+            _write_wrapped(f, random_sequence(rng, _random_length(rng)))
+    return path
+
+
+def write_pfam_regions_tsv(path, num_rows, num_proteins=None, seed=0):
+    """Writes a Pfam-A.regions.uniprot.tsv file.
+
+    The regions are on random proteins out of the first num_proteins, which
+    defaults to num_rows // 2.
+    """
+    rng = random.Random(seed)
+    num_proteins = num_proteins or max(1, num_rows // 2)
+    with open(path, "w") as f:
+        f.write(_PFAM_HEADER)
+        for _ in range(num_rows):
+            start = rng.randint(1, 1000)
+            end = start + rng.randint(10, 300)
+            f.write(
+                f"{accession(rng.randrange(num_proteins))}\t{rng.randint(1, 9)}\t"
+                f"{rng.getrandbits(64):016X}\t{rng.getrandbits(128):032x}\t"
+                f"PF{rng.randrange(20000):05d}\t{start}\t{end}\n"
+            )
+    return path
+
+
+def write_hippie_mitab(path, num_rows, num_proteins=None, seed=0):
+    """Writes a HIPPIE MITAB file of interactions between random proteins.
+
+    About 1% of the interactors have no UniProt accession, like in the real
+    file. num_proteins defaults to num_rows // 5.
+    """
+    rng = random.Random(seed)
+    num_proteins = num_proteins or max(2, num_rows // 5)
+
+    def alt_id(i):
+        if rng.random() < 0.01:
+            return "-"
+        return f"uniprotkb:{accession(i)}"
+
+    with open(path, "w") as f:
+        f.write("\t".join(_MITAB_COLUMNS) + "\n")
+        for _ in range(num_rows):
+            a = rng.randrange(num_proteins)
+            b = rng.randrange(num_proteins)
+            row = {column: "-" for column in _MITAB_COLUMNS}
+            row.update(
+                {
+                    "ID Interactor A": f"entrez gene:{a}",
+                    "ID Interactor B": f"entrez gene:{b}",
+                    "Alt IDs Interactor A": alt_id(a),
+                    "Alt IDs Interactor B": alt_id(b),
+                    "Taxid Interactor A": "taxid:9606(Homo sapiens)",
+                    "Taxid Interactor B": "taxid:9606(Homo sapiens)",
+                    "Confidence Value": f"{rng.random():.3f}",
+                }
+            )
+            f.write("\t".join(row[column] for column in _MITAB_COLUMNS) + "\n")
+    return path
+
+
+def _string_name(i):
+    taxon = _STRING_TAXA[i % len(_STRING_TAXA)]
+    return f"{taxon}.ENSP{i:011d}"
+
+
+def write_string_files(directory, num_links, num_proteins=None, seed=0):
+    """Writes STRING protein.aliases and protein.links files.
+
+    About 10% of the STRING proteins have no UniProt alias. num_proteins
+    defaults to num_links // 20.
+
+    Returns:
+        A dict with the "alias_file" and "links_file" paths.
+    """
+    rng = random.Random(seed)
+    num_proteins = num_proteins or max(2, num_links // 20)
+    files = {
+        "alias_file": os.path.join(directory, "protein.aliases.txt"),
+        "links_file": os.path.join(directory, "protein.links.txt"),
+    }
+    with open(files["alias_file"], "w") as f:
+        f.write("## string_protein_id ## alias ## source ##\n")
+        for i in range(num_proteins):
+            name = _string_name(i)
+            f.write(f"{name}\tGENE{i}\tBioMart_HUGO Ensembl_EntrezGene\n")
+            if rng.random() < 0.9:
+                f.write(f"{name}\t{accession(i)}\tEnsembl_UniProt BLAST_UniProt_AC\n")
+    # The links file is sorted by the first protein, so the links of each
+    # taxon are contiguous.
+    links = []
+    for _ in range(num_links):
+        p1 = rng.randrange(num_proteins)
+        # Most links are between proteins of the same taxon.
+        p2 = rng.randrange(num_proteins)
+        if rng.random() < 0.9:
+            p2 = max(p2 - (p2 - p1) % len(_STRING_TAXA), 0)
+        links.append((_string_name(p1), _string_name(p2), rng.randint(150, 999)))
+    links.sort()
+    with open(files["links_file"], "w") as f:
+        f.write("protein1 protein2 combined_score\n")
+        for p1, p2, score in links:
+            f.write(f"{p1} {p2} {score}\n")
+    return files
+
+
+def _random_alleles(rng, num_alleles):
+    alleles = set()
+    while len(alleles) < num_alleles:
+        species = rng.choice(_SPECIES)
+        gene = rng.choice("ABCE")
+        alleles.add(
+            f"{species}-{gene}*{rng.randrange(100):02d}:{rng.randrange(100):02d}"
+        )
+    return sorted(alleles)
+
+
+def write_mhcflurry_files(directory, num_rows, num_alleles=2000, seed=0):
+    """Writes the MHCflurry affinity and MHC sequence CSV files.
+
+    Returns:
+        A (files, alleles) tuple. The files is a dict with the "affinity_file"
+        and "mhc_sequence_file" paths and the alleles a sorted list of the
+        alleles with a sequence.
+    """
+    rng = random.Random(seed)
+    alleles = _random_alleles(rng, num_alleles)
+    files = {
+        "affinity_file": os.path.join(directory, "affinity.csv"),
+        "mhc_sequence_file": os.path.join(directory, "mhc_sequences.csv"),
+    }
+    with open(files["mhc_sequence_file"], "w") as f:
+        f.write("name,seq\n")
+        for allele in alleles:
+            f.write(f"{allele},{random_sequence(rng, 180)}\n")
+    with open(files["affinity_file"], "w") as f:
+        f.write("allele,peptide,measurement_value,measurement_inequality\n")
+        for _ in range(num_rows):
+            inequality = rng.choice(["=", "=", "=", "<", ">"])
+            f.write(
+                f"{rng.choice(alleles)},{random_sequence(rng, 9)},"
+                f"{rng.uniform(1, 50000):.1f},{inequality}\n"
+            )
+    return files, alleles
@@ -0,0 +1,84 @@
+"""Checks that the byte-level FASTA reader parses UniRef like Bio.SeqIO."""
+import io
+
+from Bio import SeqIO
+import pytest
+
+from bio_tfds.protein import fasta
+from bio_tfds.protein import uniref
+
+_RECORDS = [
+    (
+        "UniRef50_Q8WZ42 Titin n=1336 Tax=Vertebrata TaxID=7742 RepID=TITIN_HUMAN",
+        [
+            "MTTQAPTFTQPLQSVVVLEGSTATFEAHISGFPVPEVSWFRDGQVISTSTLPGVQISFSD",
+            "GRAKLTIPAVTKANSGRYSLKATNGSGQATSTAELLVKAE",
+        ],
+    ),
+    (
+        "UniRef50_A0A5A9P0L4 Peptidylprolyl isomerase n=1 "
+        "Tax=Triplophysa tibetana TaxID=1572043 RepID=A0A5A9P0L4_9TELE",
+        ["MSEEKKGGNGAHAAPEAPEEPEVTVDFFE", "ERGEKLSIGVGAATVEKI", "K"],
+    ),
+    (
+        "UniRef50_P0DPR3 Cluster: Uncharacterized protein n=2 Tax=root TaxID=1 "
+        "RepID=YKL1_YEAST",
+        ["MK"],
+    ),
+    (
+        "UniRef50_Q00001 Short n=7 Tax=Homo sapiens TaxID=9606 RepID=Q00001_HUMAN",
+        ["M"],
+    ),
+]
+
+
+def _fasta_bytes(newline="\n", trailing_newline=True):
+    lines = []
+    for description, sequence_lines in _RECORDS:
+        lines.append(">" + description)
+        lines.extend(sequence_lines)
+    text = newline.join(lines)
+    if trailing_newline:
+        text += newline
+    return text.encode("utf-8")
+
+
+def _parse_with_seqio(data):
+    handle = io.StringIO(data.decode("utf-8"), newline="")
+    return [uniref._extract_example(seq) for seq in SeqIO.parse(handle, "fasta")]
+
+
+def _parse_with_bytes(data, chunk_size):
+    return [
+        uniref._extract_example_from_bytes(header, sequence)
+        for header, sequence in fasta.iter_fasta_records(
+            io.BytesIO(data), chunk_size=chunk_size
+        )
+    ]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64, fasta.DEFAULT_CHUNK_SIZE])
+@pytest.mark.parametrize("newline", ["\n", "\r\n"])
+@pytest.mark.parametrize("trailing_newline", [True, False])
+def test_matches_seqio(chunk_size, newline, trailing_newline):
+    data = _fasta_bytes(newline=newline, trailing_newline=trailing_newline)
+    expected = _parse_with_seqio(data)
+    assert len(expected) == len(_RECORDS)
+    assert _parse_with_bytes(data, chunk_size) == expected
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, fasta.DEFAULT_CHUNK_SIZE])
+def test_skips_content_before_first_record(chunk_size):
+    data = b"# A comment\n\n" + _fasta_bytes()
+    assert _parse_with_bytes(data, chunk_size) == _parse_with_seqio(_fasta_bytes())
+
+
+def test_multi_line_sequences_are_joined():
+    data = _fasta_bytes(newline="\r\n")
+    records = list(fasta.iter_fasta_records(io.BytesIO(data), chunk_size=4))
+    assert [header.decode("utf-8") for header, _ in records] == [
+        description for description, _ in _RECORDS
+    ]
+    assert [sequence.decode("utf-8") for _, sequence in records] == [
+        "".join(sequence_lines) for _, sequence_lines in _RECORDS
+    ]
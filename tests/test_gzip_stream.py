@@ -0,0 +1,70 @@
+"""Checks that open_gzip reads gzipped files like the gzip module."""
+import gzip
+import random
+
+import pytest
+
+from bio_tfds import gzip_stream
+
+
+def _random_bytes(size, seed=0):
+    # Random lines over a small alphabet, which compress like FASTA does.
+    rng = random.Random(seed)
+    return bytes(rng.choice(b"ACDEFGHIKLMNPQRSTVWY\n") for _ in range(size))
+
+
+def _read(path, read_size=1024):
+    with gzip_stream.open_gzip(str(path), read_size=read_size) as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("read_size", [7, 1024, gzip_stream.DEFAULT_READ_SIZE])
+def test_reads_single_member(tmp_path, read_size):
+    content = _random_bytes(100000)
+    path = tmp_path / "single.gz"
+    path.write_bytes(gzip.compress(content))
+    assert _read(path, read_size) == content
+
+
+@pytest.mark.parametrize("read_size", [7, 1024, gzip_stream.DEFAULT_READ_SIZE])
+def test_reads_multiple_members(tmp_path, read_size):
+    parts = [_random_bytes(30000, seed=i) for i in range(3)] + [b""]
+    path = tmp_path / "multi.gz"
+    path.write_bytes(b"".join(gzip.compress(part) for part in parts))
+    assert _read(path, read_size) == b"".join(parts)
+
+
+def test_reads_text(tmp_path):
+    path = tmp_path / "text.gz"
+    path.write_bytes(gzip.compress(b">a\nMK\n>b\nMA\n"))
+    with gzip_stream.open_gzip(str(path), mode="r") as f:
+        assert list(f) == [">a\n", "MK\n", ">b\n", "MA\n"]
+
+
+def test_reads_empty_file(tmp_path):
+    path = tmp_path / "empty.gz"
+    path.write_bytes(b"")
+    assert _read(path) == b""
+
+
+@pytest.mark.parametrize("read_size", [7, 1024, gzip_stream.DEFAULT_READ_SIZE])
+@pytest.mark.parametrize("fraction", [0.01, 0.5, 0.99])
+def test_truncated_file_raises(tmp_path, read_size, fraction):
+    compressed = gzip.compress(_random_bytes(100000))
+    path = tmp_path / "truncated.gz"
+    path.write_bytes(compressed[: int(len(compressed) * fraction)])
+
+    with pytest.raises(EOFError):
+        gzip.decompress(path.read_bytes())
+    with pytest.raises(EOFError):
+        _read(path, read_size)
+
+
+def test_truncated_last_member_raises(tmp_path):
+    first = gzip.compress(_random_bytes(30000, seed=1))
+    second = gzip.compress(_random_bytes(30000, seed=2))
+    path = tmp_path / "truncated_multi.gz"
+    path.write_bytes(first + second[: len(second) // 2])
+
+    with pytest.raises(EOFError):
+        _read(path)
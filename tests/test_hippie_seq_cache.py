@@ -0,0 +1,144 @@
+"""Checks that Hippie only asks UniProt for sequences that are not cached."""
+import http.server
+import threading
+import time
+import types
+import urllib.parse
+
+import pytest
+
+from bio_tfds.protein import hippie
+from bio_tfds.protein import seq_cache
+
+_SEQUENCES = {
+    "P00001": "MKTAYIAKQR",
+    "P00002": "MSSHEGGKKK",
+    "P00003": "MGLSDGEWQL",
+}
+
+# An accession that the stand-in UniProt does not have a sequence for.
+_MISSING_ACC = "Q99999"
+
+_INTERACTIONS = [
+    ("P00001", "P00002", 0.5),
+    ("P00002", "P00003", 0.7),
+    ("P00001", _MISSING_ACC, 0.9),
+]
+
+
+class _UniProtHandler(http.server.BaseHTTPRequestHandler):
+    def do_POST(self):
+        length = int(self.headers["Content-Length"])
+        payload = urllib.parse.parse_qs(self.rfile.read(length).decode("utf-8"))
+        accs = payload["query"][0].split()
+        self.server.requests.append(accs)
+
+        # Hippie reads the accession from the last "|"-separated part of the
+        # record name, which is the whole name here.
+        body = "".join(
+            f">{acc} Protein {acc}_HUMAN\n{_SEQUENCES[acc]}\n"
+            for acc in accs
+            if acc in _SEQUENCES
+        )
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def uniprot_server():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _UniProtHandler)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+@pytest.fixture
+def mitab_file(tmp_path):
+    path = tmp_path / "hippie.mitab.txt"
+    lines = ["Alt IDs Interactor A\tAlt IDs Interactor B\tConfidence Value"]
+    for a_acc, b_acc, confidence in _INTERACTIONS:
+        lines.append(f"uniprotkb:{a_acc}\tuniprotkb:{b_acc}\t{confidence}")
+    path.write_text("\n".join(lines) + "\n")
+    return str(path)
+
+
+def _build(tmp_path, server, mitab_file, ttl_seconds=None):
+    """Generates the examples of the "with_seq" config and returns them."""
+    builder = hippie.Hippie(
+        config="with_seq",
+        data_dir=str(tmp_path / "tfds"),
+        sequence_cache_path=str(tmp_path / "sequences.sqlite"),
+        sequence_cache_ttl_seconds=ttl_seconds,
+        uniprot_url=f"http://127.0.0.1:{server.server_port}/",
+    )
+    return dict(builder._generate_examples_with_seq(mitab_file))
+
+
+def _requested_accs(server):
+    return sorted(acc for accs in server.requests for acc in accs)
+
+
+def test_cold_build_fetches_each_accession_once(tmp_path, uniprot_server, mitab_file):
+    examples = _build(tmp_path, uniprot_server, mitab_file)
+
+    assert sorted(examples) == [0, 1]
+    assert examples[0]["protein_a_sequence"] == _SEQUENCES["P00001"]
+    assert examples[1]["protein_b_sequence"] == _SEQUENCES["P00003"]
+    assert _requested_accs(uniprot_server) == sorted(
+        list(_SEQUENCES) + [_MISSING_ACC]
+    )
+
+
+def test_misses_are_cached_as_negative_entries(tmp_path, uniprot_server, mitab_file):
+    _build(tmp_path, uniprot_server, mitab_file)
+
+    with seq_cache.SequenceCache(str(tmp_path / "sequences.sqlite")) as cache:
+        sequences, missing = cache.get_many(list(_SEQUENCES) + [_MISSING_ACC])
+    assert sequences == _SEQUENCES
+    assert missing == {_MISSING_ACC}
+
+
+def test_warm_rebuild_makes_no_requests(tmp_path, uniprot_server, mitab_file):
+    cold_examples = _build(tmp_path, uniprot_server, mitab_file, ttl_seconds=3600)
+    uniprot_server.requests.clear()
+
+    warm_examples = _build(tmp_path, uniprot_server, mitab_file, ttl_seconds=3600)
+
+    assert uniprot_server.requests == []
+    assert sorted(warm_examples) == [0, 1]
+    assert warm_examples == cold_examples
+
+
+def test_expired_entries_are_fetched_again(
+    tmp_path, uniprot_server, mitab_file, monkeypatch
+):
+    cold_examples = _build(tmp_path, uniprot_server, mitab_file, ttl_seconds=3600)
+    uniprot_server.requests.clear()
+
+    # Rebuild two hours later, once every cached entry has expired.
+    now = time.time() + 7200
+    monkeypatch.setattr(seq_cache, "time", types.SimpleNamespace(time=lambda: now))
+    expired_examples = _build(tmp_path, uniprot_server, mitab_file, ttl_seconds=3600)
+
+    assert _requested_accs(uniprot_server) == sorted(
+        list(_SEQUENCES) + [_MISSING_ACC]
+    )
+    assert expired_examples == cold_examples
+
+    # The refetched entries are fresh again, so another rebuild is all hits.
+    uniprot_server.requests.clear()
+    _build(tmp_path, uniprot_server, mitab_file, ttl_seconds=3600)
+    assert uniprot_server.requests == []
@@ -0,0 +1,92 @@
+"""Checks that the partitioned join keeps to its memory budget."""
+import os
+
+import pytest
+
+from bio_tfds import spill
+from bio_tfds.protein import joined
+
+_NUM_PARTITIONS = 2
+
+
+def _spill_partitions(spill_dir, regions, uniref_records):
+    region_writers = [
+        spill.SpillWriter(os.path.join(spill_dir, f"regions-{i:05d}"))
+        for i in range(_NUM_PARTITIONS)
+    ]
+    uniref_writers = [
+        spill.SpillWriter(os.path.join(spill_dir, f"uniref50-{i:05d}"))
+        for i in range(_NUM_PARTITIONS)
+    ]
+    for region in regions:
+        region_writers[spill.partition_of(region[0], _NUM_PARTITIONS)].write(region)
+    for x in uniref_records:
+        acc = x["unique_identifier"][len("UniRef50_") :]
+        uniref_writers[spill.partition_of(acc, _NUM_PARTITIONS)].write(x)
+    for writer in region_writers + uniref_writers:
+        writer.close()
+    return (
+        [writer.path for writer in region_writers],
+        [writer.path for writer in uniref_writers],
+    )
+
+
+def _builder(tmp_path, memory_budget_bytes):
+    return joined.UniRef50WithPfamRegions(
+        data_dir=str(tmp_path / "tfds"),
+        join_mode="partitioned",
+        num_partitions=_NUM_PARTITIONS,
+        memory_budget_bytes=memory_budget_bytes,
+    )
+
+
+def test_oversized_partitions_are_split(tmp_path):
+    accs = [f"P{i:05d}".encode("utf-8") for i in range(200)]
+    regions = [
+        (acc, f"PF{j:05d}".encode("utf-8"), 10 * j, 10 * j + 5)
+        for acc in accs
+        for j in range(3)
+    ]
+    # Every other accession has a UniRef50 record.
+    uniref_records = [{"unique_identifier": b"UniRef50_" + acc} for acc in accs[::2]]
+    region_files, uniref_files = _spill_partitions(
+        str(tmp_path), regions, uniref_records
+    )
+
+    largest = max(
+        joined._MEMORY_PER_SPILL_BYTE * os.path.getsize(f) for f in region_files
+    )
+    builder = _builder(tmp_path, memory_budget_bytes=largest // 3)
+    split_region_files, split_uniref_files = builder._split_oversized_partitions(
+        region_files, uniref_files
+    )
+    assert len(split_region_files) > _NUM_PARTITIONS
+    assert len(split_uniref_files) == len(split_region_files)
+    for region_file in split_region_files:
+        size = joined._MEMORY_PER_SPILL_BYTE * os.path.getsize(region_file)
+        assert size <= builder.memory_budget_bytes
+
+    examples = {}
+    for _, task_examples in builder._join_tasks(
+        region_files, uniref_files, str(tmp_path)
+    ):
+        for key, x in task_examples:
+            assert key not in examples
+            examples[key] = x
+    assert sorted(examples) == sorted(x["unique_identifier"] for x in uniref_records)
+    for key, x in examples.items():
+        assert x["pfam_regions"]["pfam_acc"] == [b"PF00000", b"PF00001", b"PF00002"]
+        assert x["pfam_regions"]["start"] == [0, 10, 20]
+
+
+def test_unsplittable_partition_raises(tmp_path):
+    # All of the regions belong to one accession, so splitting can't help.
+    regions = [(b"P00001", b"PF00001", i, i + 1) for i in range(1000)]
+    uniref_records = [{"unique_identifier": b"UniRef50_P00001"}]
+    region_files, uniref_files = _spill_partitions(
+        str(tmp_path), regions, uniref_records
+    )
+
+    builder = _builder(tmp_path, memory_budget_bytes=1000)
+    with pytest.raises(ValueError, match="memory_budget_bytes"):
+        next(builder._join_tasks(region_files, uniref_files, str(tmp_path)))
@@ -0,0 +1,41 @@
+"""Checks the region hashes of the Pfam region index."""
+import numpy as np
+
+from bio_tfds.protein import joined
+from bio_tfds.protein import pfam_index
+from bio_tfds.protein import uniref
+
+
+def _index():
+    return pfam_index.PfamRegionIndex.from_arrays(
+        uniprot_accs=np.array([b"Q00002", b"P00001", b"Q00002", b"A00003"]),
+        pfam_accs=np.array([b"PF00002", b"PF00001", b"PF00001", b"PF00003"]),
+        starts=np.array([10, 0, 50, 5]),
+        ends=np.array([40, 20, 90, 15]),
+    )
+
+
+def test_region_hashes_match_the_hashes_of_the_joined_records(tmp_path):
+    index = _index()
+    index.compute_region_hashes()
+    index.save(str(tmp_path))
+    index = pfam_index.PfamRegionIndex.load(str(tmp_path))
+
+    accs = [b"A00003", b"P00001", b"Q00002", b"MISSING", b"Z99999", b"0"]
+    expected = [joined._regions_hash(index.regions(acc)) for acc in accs]
+    assert index.lookup_region_hashes(np.array(accs)).tolist() == expected
+    # Accessions without regions all hash the same.
+    assert expected[3] == expected[4] == expected[5]
+    assert len(set(expected[:4])) == 4
+
+
+def test_load_without_region_hashes(tmp_path):
+    _index().save(str(tmp_path))
+    assert pfam_index.PfamRegionIndex.load(str(tmp_path)).region_hashes is None
+
+
+def test_uniprot_accs():
+    keys = np.array([b"UniRef50_P00001", b"UniRef50_A0A5A9P0L4", b"UniRef50_Q1"])
+    expected = [uniref.UniRef50.extract_uniprot_acc(k) for k in keys.tolist()]
+    assert joined._uniprot_accs(keys).tolist() == expected
+    assert joined._uniprot_accs(np.zeros([0], dtype="S1")).tolist() == []